@@ -1,7 +1,29 @@
-from fastapi import APIRouter
+from datetime import datetime
+from itertools import islice
+from typing import Optional, Sequence, Set
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.security import Principal, require_roles
+from app.models.customer import Customer
+from app.models.session import Session
+from app.schemas.export import BulkExportRequest, ExportJobStatus
+from app.services.analytics.events import get_event_writer
+from app.services.compliance.audit_store import get_audit_store
+from app.services.compliance.transcript import FORMATS, BulkExport, job_status, zip_job
 
 router = APIRouter()
 
+# Running bulk export jobs, referenced so they are not garbage collected
+_export_tasks = set()
+
+# Audit records and exports are limited to the caller's own tenant
+require_admin = require_roles("admin")
+
 # TODO: Implement admin endpoints
 # - GET /users - List all users
 # - POST /users - Create new user
@@ -24,3 +46,98 @@ async def create_user():
 async def system_health():
     """TODO: Implement system health check"""
     return {"message": "System health endpoint - TODO: Implement"}
+
+@router.get("/audit")
+async def query_audit_log(
+    session_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = Query(None, description="Exclusive"),
+    limit: int = Query(1000, ge=1, le=10000),
+    principal: Principal = Depends(require_admin),
+):
+    """The caller's tenant's audit records from the append-only store, read from indexed blocks only"""
+    store = get_audit_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="Audit store is disabled")
+    if session_id is None and user_id is None and start is None:
+        raise HTTPException(status_code=400, detail="Filter by session_id, user_id or start")
+    records = await asyncio.to_thread(
+        lambda: list(islice(
+            store.query(session_id=session_id, user_id=user_id, start=start, end=end, tenant_id=principal.tenant_id), limit
+        ))
+    )
+    return {"records": records, "head": store.head()}
+
+@router.get("/audit/verify")
+async def verify_audit_log(principal: Principal = Depends(require_admin)):
+    """Recompute the audit hash chain over every segment
+
+    The chain spans all tenants, so only its outcome is returned, not
+    record counts that would reveal other tenants' activity.
+    """
+    store = get_audit_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="Audit store is disabled")
+    report = await asyncio.to_thread(store.verify)
+    return {"ok": report.ok, "head": report.head, "broken_at": report.broken_at, "reason": report.reason}
+
+@router.post("/exports", response_model=ExportJobStatus, status_code=202)
+async def start_bulk_export(
+    request: BulkExportRequest,
+    db: AsyncSession = Depends(get_db),
+    principal: Principal = Depends(require_admin),
+):
+    """Export many of the caller's tenant's session transcripts in the background for a regulatory request"""
+    if request.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(sorted(FORMATS))}")
+    if len(request.session_ids) > settings.EXPORT_MAX_SESSIONS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.EXPORT_MAX_SESSIONS} sessions per export")
+    if await _foreign_sessions(db, principal.tenant_id, request.session_ids):
+        # Not told apart from sessions that do not exist
+        raise HTTPException(status_code=404, detail="Session not found")
+    job = await asyncio.to_thread(BulkExport.create, request.session_ids, request.format, principal.tenant_id)
+    await get_event_writer().audit(
+        "bulk_export",
+        user_id=principal.user_id,
+        details={"job_id": job.job_id, "format": request.format, "sessions": len(request.session_ids)},
+        tenant_id=principal.tenant_id,
+    )
+    task = asyncio.create_task(job.run())
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
+    return job.status
+
+async def _foreign_sessions(db: AsyncSession, tenant_id: str, session_ids: Sequence[str]) -> Set[str]:
+    """Ids among ``session_ids`` that are not sessions of the tenant"""
+    wanted = set(session_ids)
+    owned = set((await db.execute(
+        select(Session.id).join(Customer, Customer.id == Session.customer_id)
+        .where(Session.id.in_(wanted), Customer.tenant_id == tenant_id)
+    )).scalars())
+    return wanted - owned
+
+def _job_status(job_id: str, principal: Principal) -> dict:
+    try:
+        status = job_status(job_id)
+    except ValueError:
+        status = None
+    if status is None or status.get("tenant_id") != principal.tenant_id:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return status
+
+@router.get("/exports/{job_id}", response_model=ExportJobStatus)
+async def get_bulk_export(job_id: str, principal: Principal = Depends(require_admin)):
+    """Progress of a bulk export"""
+    return _job_status(job_id, principal)
+
+@router.get("/exports/{job_id}/download")
+async def download_bulk_export(job_id: str, principal: Principal = Depends(require_admin)):
+    """Stream a finished export as a zip of transcripts plus SHA256SUMS"""
+    if _job_status(job_id, principal)["state"] != "completed":
+        raise HTTPException(status_code=409, detail="Export is still running")
+    return StreamingResponse(
+        zip_job(job_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="export-{job_id}.zip"'},
+    )
@@ -1,7 +1,22 @@
-from fastapi import APIRouter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.core.security import Principal, require_roles
+from app.schemas.analytics import DashboardKPIs, DashboardPoint, DashboardResponse
+from app.services.analytics.events import get_event_writer
+from app.services.analytics.rollup import GRANULARITIES, AnalyticsRollupService, dashboard_kpis, get_rollup_service
 
 router = APIRouter()
 
+# Longest range the dashboard will summarise in one request
+MAX_DASHBOARD_RANGE = timedelta(days=366)
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
 # TODO: Implement analytics endpoints
 # - GET /dashboard - Get dashboard metrics
 # - GET /conversations - Get conversation analytics
@@ -9,10 +24,44 @@ router = APIRouter()
 # - GET /deflection - Get deflection rate analytics
 # - GET /satisfaction - Get customer satisfaction metrics
 
-@router.get("/dashboard")
-async def get_dashboard_metrics():
-    """TODO: Implement dashboard metrics"""
-    return {"message": "Dashboard metrics endpoint - TODO: Implement"}
+@router.get("/dashboard", response_model=DashboardResponse)
+async def get_dashboard_metrics(
+    start: Optional[datetime] = Query(None, description="Range start, UTC if no offset; defaults to 24h before end"),
+    end: Optional[datetime] = Query(None, description="Range end, UTC if no offset; defaults to now"),
+    granularity: Optional[str] = Query(None, description="minute, hour or day; chosen from the range if omitted"),
+    db: AsyncSession = Depends(get_db),
+    rollups: AnalyticsRollupService = Depends(get_rollup_service),
+    principal: Principal = Depends(require_roles("supervisor", "admin")),
+):
+    """Dashboard KPIs and time series for the caller's tenant, read from pre-aggregated rollups"""
+    tenant_id = principal.tenant_id
+    end = _utc(end) if end else datetime.now(timezone.utc)
+    start = _utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > MAX_DASHBOARD_RANGE:
+        raise HTTPException(status_code=400, detail="Range is limited to 366 days")
+    if granularity is not None and granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    totals, series, granularity = await rollups.read(db, tenant_id, start, end, granularity=granularity)
+    return DashboardResponse(
+        tenant_id=tenant_id,
+        start=start,
+        end=end,
+        granularity=granularity,
+        kpis=DashboardKPIs(**dashboard_kpis(totals)),
+        series=[
+            DashboardPoint(bucket_start=bucket, kpis=DashboardKPIs(**dashboard_kpis(aggregates)))
+            for bucket, aggregates in series.items()
+        ],
+        rollup_watermark=await rollups.watermark(db),
+    )
+
+@router.get("/writer")
+async def get_event_writer_stats(principal: Principal = Depends(require_roles("admin"))):
+    """Buffered, written, spilled and dropped event counts for this worker"""
+    return get_event_writer().stats()
 
 @router.get("/conversations")
 async def get_conversation_analytics():
@@ -1,25 +1,80 @@
-from fastapi import APIRouter
+from datetime import datetime, timezone
+from typing import Optional
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.core.security import (
+    AuthenticationError,
+    Principal,
+    TokenClaims,
+    authenticate,
+    create_token,
+    get_current_claims,
+    get_current_principal,
+    get_principal_cache,
+    get_token_verifier,
+    verify_password,
+)
+from app.models.user import User
+from app.schemas.auth import LoginRequest, LogoutRequest, PrincipalResponse, RefreshRequest, TokenResponse
+from app.services.analytics.events import get_event_writer
 
 router = APIRouter()
 
 # TODO: Implement authentication endpoints
-# - POST /login - User login with JWT token generation
-# - POST /refresh - Refresh access token
-# - POST /logout - Invalidate refresh token
 # - POST /register - User registration (if needed)
-# - GET /me - Get current user information
 
-@router.post("/login")
-async def login():
-    """TODO: Implement user login"""
-    return {"message": "Login endpoint - TODO: Implement"}
 
-@router.post("/refresh")
-async def refresh_token():
-    """TODO: Implement token refresh"""
-    return {"message": "Token refresh endpoint - TODO: Implement"}
+def _issue(principal: Principal) -> TokenResponse:
+    access_token, access = create_token(principal, "access")
+    refresh_token, _ = create_token(principal, "refresh")
+    return TokenResponse(
+        access_token=access_token,
+        refresh_token=refresh_token,
+        expires_in=int(access.expires_at - time.time()),
+    )
+
+
+@router.post("/login", response_model=TokenResponse)
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_db)):
+    """Exchange email and password for an access and refresh token"""
+    user = (await db.execute(select(User).where(User.email == request.email))).scalar_one_or_none()
+    if not await verify_password(request.password, user.hashed_password if user is not None else None):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    principal = await get_principal_cache().get(user.id)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Account is disabled")
+    user.last_login = datetime.now(timezone.utc)
+    await db.commit()
+    await get_event_writer().audit("login", user_id=user.id, tenant_id=principal.tenant_id)
+    return _issue(principal)
+
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_token(request: RefreshRequest):
+    """Rotate a refresh token: the old one is revoked and a new pair issued"""
+    claims, principal = await authenticate(request.refresh_token, "refresh")
+    await get_token_verifier().revoke(claims)
+    return _issue(principal)
+
 
 @router.post("/logout")
-async def logout():
-    """TODO: Implement user logout"""
-    return {"message": "Logout endpoint - TODO: Implement"}
+async def logout(request: Optional[LogoutRequest] = None, claims: TokenClaims = Depends(get_current_claims)):
+    """Revoke the caller's access token and, if given, its refresh token"""
+    verifier = get_token_verifier()
+    await verifier.revoke(claims)
+    if request is not None and request.refresh_token:
+        try:
+            await verifier.revoke(await verifier.verify(request.refresh_token, "refresh"))
+        except AuthenticationError:
+            pass  # already expired or revoked
+    await get_event_writer().audit("logout", user_id=claims.subject, tenant_id=claims.tenant_id)
+    return {"message": "Logged out"}
+
+
+@router.get("/me", response_model=PrincipalResponse)
+async def me(principal: Principal = Depends(get_current_principal)):
+    """The authenticated user"""
+    return PrincipalResponse(**principal.to_dict())
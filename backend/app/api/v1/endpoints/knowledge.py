@@ -1,25 +1,232 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional
+import os
+import time
+import uuid
+import aiofiles
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.logging import get_logger
+from app.core.security import Principal, get_current_principal, require_roles
+from app.models.knowledge_source import KnowledgeSource
+from app.services.ai.embeddings import EmbeddingError
+from app.services.knowledge.ingestion import DocumentProcessor, IngestDocument, SourceChanges, detect_kind
+from app.services.knowledge.search import SearchService, get_search_service
 
 router = APIRouter()
+logger = get_logger(__name__)
 
-# TODO: Implement knowledge management endpoints
-# - GET /sources - List all knowledge sources
-# - POST /sources - Add new knowledge source
-# - GET /search - Search knowledge base
-# - PUT /sources/{source_id} - Update knowledge source
-# - DELETE /sources/{source_id} - Delete knowledge source
+require_admin = require_roles("admin")
 
 @router.get("/sources")
-async def list_knowledge_sources():
-    """TODO: Implement knowledge source listing"""
-    return {"message": "List knowledge sources endpoint - TODO: Implement"}
+async def list_knowledge_sources(
+    include_inactive: bool = Query(False),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+):
+    """List the caller's tenant's knowledge sources, newest first, without their content"""
+    tenant_id = principal.tenant_id
+    query = select(
+        KnowledgeSource.id, KnowledgeSource.name, KnowledgeSource.type, KnowledgeSource.category,
+        KnowledgeSource.author, KnowledgeSource.version, KnowledgeSource.is_active,
+        KnowledgeSource.effective_date, KnowledgeSource.expiry_date,
+        KnowledgeSource.created_at, KnowledgeSource.updated_at,
+    ).where(KnowledgeSource.tenant_id == tenant_id)
+    if not include_inactive:
+        query = query.where(KnowledgeSource.is_active.is_(True))
+    rows = await db.execute(
+        query.order_by(KnowledgeSource.created_at.desc(), KnowledgeSource.id).limit(limit).offset(offset)
+    )
+    return {"sources": [dict(row._mapping) for row in rows]}
+
+async def _save_upload(upload: UploadFile, source_id: str) -> str:
+    """Stream an upload to local storage without holding it in memory"""
+    directory = os.path.join(settings.STORAGE_PATH, "uploads")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, source_id + os.path.splitext(upload.filename or "")[1].lower())
+    async with aiofiles.open(path, "wb") as handle:
+        while block := await upload.read(1024 * 1024):
+            await handle.write(block)
+    return path
+
+async def _tenant_source(db: AsyncSession, source_id: str, principal: Principal) -> KnowledgeSource:
+    """The caller's tenant's source, or 404"""
+    source = await db.get(KnowledgeSource, source_id)
+    if source is None or source.tenant_id != principal.tenant_id:
+        raise HTTPException(status_code=404, detail="Knowledge source not found")
+    return source
 
 @router.post("/sources")
-async def add_knowledge_source():
-    """TODO: Implement knowledge source creation"""
-    return {"message": "Add knowledge source endpoint - TODO: Implement"}
+async def add_knowledge_source(
+    name: str = Form(...),
+    type: str = Form(...),
+    category: str = Form(...),
+    author: str = Form(...),
+    content: Optional[str] = Form(None),
+    files: List[UploadFile] = File(default=[]),
+    db: AsyncSession = Depends(get_db),
+    search_service: SearchService = Depends(get_search_service),
+    principal: Principal = Depends(require_admin),
+):
+    """Create knowledge sources for the caller's tenant from uploaded files or inline text and ingest them"""
+    tenant_id = principal.tenant_id
+    if not files and not content:
+        raise HTTPException(status_code=422, detail="Provide files or content")
+
+    documents: List[IngestDocument] = []
+    if content:
+        source = KnowledgeSource(
+            id=uuid.uuid4().hex, name=name, type=type, category=category,
+            tenant_id=tenant_id, author=author, content=content,
+        )
+        db.add(source)
+        documents.append(IngestDocument(source_id=source.id, text=content))
+    for upload in files:
+        source = KnowledgeSource(
+            id=uuid.uuid4().hex, name=upload.filename or name, type=type, category=category,
+            tenant_id=tenant_id, author=author, content="",
+        )
+        db.add(source)
+        path = await _save_upload(upload, source.id)
+        documents.append(IngestDocument(source_id=source.id, path=path, kind=detect_kind(path)))
+
+    # The new sources are committed together with their chunks, so a failed
+    # embedding leaves no empty sources behind
+    try:
+        report = await DocumentProcessor(search_service.embedding_service).run(db, documents)
+    except EmbeddingError as e:
+        logger.error("Knowledge ingestion failed", tenant_id=tenant_id, error=str(e))
+        raise HTTPException(status_code=503, detail="Embedding service unavailable")
+
+    await search_service.apply_changes(db, tenant_id, report.changes)
+
+    return {
+        "source_ids": [document.source_id for document in documents],
+        "ingestion": report.to_dict(),
+    }
 
 @router.get("/search")
-async def search_knowledge():
-    """TODO: Implement knowledge search"""
-    return {"message": "Search knowledge endpoint - TODO: Implement"}
+async def search_knowledge(
+    q: str = Query(..., min_length=1),
+    k: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    search_service: SearchService = Depends(get_search_service),
+    principal: Principal = Depends(get_current_principal),
+):
+    """Hybrid keyword + semantic search over the caller's tenant's knowledge chunks"""
+    tenant_id = principal.tenant_id
+    started = time.perf_counter()
+    try:
+        hits = await search_service.search(db, tenant_id, q, k)
+    except EmbeddingError as e:
+        logger.error("Knowledge search failed", tenant_id=tenant_id, error=str(e))
+        raise HTTPException(status_code=503, detail="Embedding service unavailable")
+
+    return {
+        "query": q,
+        "results": [hit.to_dict() for hit in hits],
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+@router.get("/search/recall")
+async def search_index_recall(
+    k: int = Query(10, ge=1, le=100),
+    nprobe: Optional[int] = Query(None, ge=1),
+    samples: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    search_service: SearchService = Depends(get_search_service),
+    principal: Principal = Depends(require_admin),
+):
+    """Report approximate-search recall@k against exact search on the caller's tenant, for tuning"""
+    tenant_id = principal.tenant_id
+    index = (await search_service.get_index(db, tenant_id)).vectors
+    stats = index.stats()
+    return {
+        "tenant_id": tenant_id,
+        "size": stats.size,
+        "nlist": stats.nlist,
+        "nprobe": nprobe or stats.nprobe,
+        "exact": stats.exact,
+        "k": k,
+        "recall": index.measure_recall(k=k, sample_size=samples, nprobe=nprobe),
+    }
+
+@router.put("/sources/{source_id}")
+async def update_knowledge_source(
+    source_id: str,
+    name: Optional[str] = Form(None),
+    content: Optional[str] = Form(None),
+    is_active: Optional[bool] = Form(None),
+    effective_date: Optional[datetime] = Form(None),
+    expiry_date: Optional[datetime] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    db: AsyncSession = Depends(get_db),
+    search_service: SearchService = Depends(get_search_service),
+    principal: Principal = Depends(require_admin),
+):
+    """Update a knowledge source, re-embedding only chunks whose text changed"""
+    source = await _tenant_source(db, source_id, principal)
+
+    if name is not None:
+        source.name = name
+    activity_changed = is_active is not None and is_active != bool(source.is_active)
+    if is_active is not None:
+        source.is_active = is_active
+    if effective_date is not None:
+        source.effective_date = effective_date
+    if expiry_date is not None:
+        source.expiry_date = expiry_date
+
+    document = None
+    if content is not None or file is not None:
+        source.version = (source.version or 1) + 1
+        if file is not None:
+            path = await _save_upload(file, source_id)
+            document = IngestDocument(source_id, path=path, kind=detect_kind(path), version=source.version, reindex=True)
+        else:
+            source.content = content
+            document = IngestDocument(source_id, text=content, version=source.version, reindex=True)
+
+    report = None
+    if document is not None:
+        # The version bump commits with the re-ingestion or rolls back with it
+        try:
+            report = await DocumentProcessor(search_service.embedding_service).run(db, [document])
+        except EmbeddingError as e:
+            logger.error("Knowledge re-ingestion failed", source_id=source_id, error=str(e))
+            raise HTTPException(status_code=503, detail="Embedding service unavailable")
+        await search_service.apply_changes(db, source.tenant_id, report.changes)
+    elif activity_changed:
+        await db.commit()
+        # No chunk changes to apply: a reactivated source's chunks must be loaded whole
+        await search_service.upsert_source(db, source_id)
+    else:
+        await db.commit()
+        await search_service.apply_changes(db, source.tenant_id, {source_id: SourceChanges()})
+
+    return {
+        "id": source_id,
+        "version": source.version,
+        "is_active": source.is_active,
+        "ingestion": report.to_dict() if report else None,
+    }
+
+@router.delete("/sources/{source_id}")
+async def deactivate_knowledge_source(
+    source_id: str,
+    db: AsyncSession = Depends(get_db),
+    search_service: SearchService = Depends(get_search_service),
+    principal: Principal = Depends(require_admin),
+):
+    """Deactivate a knowledge source and drop its chunks from search"""
+    source = await _tenant_source(db, source_id, principal)
+
+    source.is_active = False
+    await db.commit()
+    await search_service.remove_source(source.tenant_id, source_id)
+    return {"id": source_id, "is_active": False}
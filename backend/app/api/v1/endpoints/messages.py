@@ -1,17 +1,68 @@
-from fastapi import APIRouter
+from typing import Any, Dict, Optional
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db
+from app.core.security import Principal, authenticate, require_roles
+from app.core.logging import get_logger
+from app.schemas.message import BotReply, SendMessageRequest, SendMessageResponse
+from app.services.chat.message_processor import (
+    MessageProcessor, SessionNotFoundError, get_message_processor, message_payload
+)
+from app.services.chat.fanout import SessionFanout, get_fanout
+from app.services.chat.orchestrator import get_orchestrator
+from app.services.chat.websocket import Connection, presence_event
 
 router = APIRouter()
+logger = get_logger(__name__)
+
+# Close code for sessions that do not exist or have ended
+SESSION_NOT_FOUND_CLOSE_CODE = 4404
+# Close codes for an invalid token, and for a user whose role may not act as an agent
+AUTH_FAILED_CLOSE_CODE = 4401
+FORBIDDEN_CLOSE_CODE = 4403
+# Close code for a client sending messages faster than they are answered
+POLICY_VIOLATION_CLOSE_CODE = 1008
+
+# Staff roles that join a session as its agent
+AGENT_ROLES = ("agent", "supervisor", "admin")
 
 # TODO: Implement message handling endpoints
 # - POST /send - Send message in session
 # - GET /{session_id} - Get all messages in session
 # - POST /{message_id}/feedback - Provide feedback on bot response
-# - WebSocket endpoint for real-time messaging
 
-@router.post("/send")
-async def send_message():
-    """TODO: Implement message sending"""
-    return {"message": "Send message endpoint - TODO: Implement"}
+@router.post("/send", response_model=SendMessageResponse)
+async def send_message(
+    request: SendMessageRequest,
+    db: AsyncSession = Depends(get_db),
+    processor: MessageProcessor = Depends(get_message_processor),
+):
+    """Store a message in a session and return the bot's reply"""
+    try:
+        return await processor.handle(db, request)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+@router.get("/pipeline/latency")
+async def pipeline_latency(principal: Principal = Depends(require_roles("admin"))) -> Dict[str, Any]:
+    """Per-stage latency percentiles of the reply pipeline on this worker"""
+    return get_orchestrator().latency.summary()
+
+@router.post("/{message_id}/resume", response_model=BotReply)
+async def resume_reply(
+    message_id: str,
+    db: AsyncSession = Depends(get_db),
+    processor: MessageProcessor = Depends(get_message_processor),
+):
+    """Finish an interrupted reply from its last checkpoint"""
+    try:
+        return await processor.resume(db, message_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Message not found")
 
 @router.get("/{session_id}")
 async def get_messages(session_id: str):
@@ -22,3 +73,131 @@ async def get_messages(session_id: str):
 async def provide_feedback(message_id: str):
     """TODO: Implement feedback collection"""
     return {"message": f"Feedback for message {message_id} - TODO: Implement"}
+
+async def _stream_reply(
+    fanout: SessionFanout,
+    processor: MessageProcessor,
+    connection: Connection,
+    request: SendMessageRequest,
+    previous: Optional[asyncio.Task],
+) -> None:
+    """Process one inbound message after the previous one, publishing every event"""
+    manager = fanout.manager
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+    try:
+        async with AsyncSessionLocal() as db:
+            async for event in processor.stream(db, request):
+                fanout.publish(connection.session_id, event)
+                if event["type"] == "token":
+                    await manager.backpressure(connection.session_id)
+    except SessionNotFoundError:
+        manager.send(connection, {"type": "error", "code": "session_not_found"})
+    except Exception as e:
+        logger.error("Streaming reply failed", session_id=connection.session_id, error=str(e))
+        manager.send(connection, {"type": "error", "code": "processing_failed"})
+
+@router.websocket("/ws/{session_id}")
+async def message_stream(
+    websocket: WebSocket,
+    session_id: str,
+    token: Optional[str] = Query(None, description="Access token; staff connect as the session's agent"),
+    last_ack: Optional[str] = Query(None),
+    fanout: SessionFanout = Depends(get_fanout),
+    processor: MessageProcessor = Depends(get_message_processor),
+):
+    """Real-time channel for a session: bot tokens, messages, typing and presence
+
+    Clients send JSON frames ``{"type": "message", "content": ...}``,
+    ``{"type": "typing", "state": true}`` and ``{"type": "ack", "message_id": ...}``.
+    Reconnecting clients pass ``last_ack`` to receive the messages they missed;
+    a message published while they are replayed can arrive twice, so clients
+    drop duplicates by message id. Customers connect without a token. Staff pass their access token and
+    join as the agent, which needs an agent role in the session's tenant.
+    """
+    role = "customer"
+    principal = None
+    if token is not None:
+        try:
+            _, principal = await authenticate(token)
+        except HTTPException:
+            await websocket.close(code=AUTH_FAILED_CLOSE_CODE)
+            return
+        if principal.role not in AGENT_ROLES:
+            await websocket.close(code=FORBIDDEN_CLOSE_CODE)
+            return
+        role = "agent"
+
+    # Short-lived DB sessions only: idle sockets must not pin pool connections
+    async with AsyncSessionLocal() as db:
+        try:
+            _, tenant_id = await processor.resolve_session(db, session_id)
+        except SessionNotFoundError:
+            tenant_id = None
+        if tenant_id is None or (principal is not None and principal.tenant_id != tenant_id):
+            await websocket.close(code=SESSION_NOT_FOUND_CLOSE_CODE)
+            return
+
+    manager = fanout.manager
+    connection = await manager.connect(websocket, session_id, role)
+    await fanout.acquire(session_id)
+    if last_ack:
+        # Subscribed first, so anything published from here on is delivered live or replayed, never neither
+        try:
+            async with AsyncSessionLocal() as db:
+                missed = await processor.replay(db, session_id, last_ack)
+        except Exception:
+            manager.disconnect(connection)
+            await fanout.release(session_id)
+            raise
+        for message in missed:
+            manager.send(connection, {"type": "message", "message": message_payload(message), "replayed": True})
+    fanout.publish(session_id, presence_event(role, "online"))
+
+    worker: Optional[asyncio.Task] = None
+    pending = 0  # inbound messages whose reply has not finished
+
+    def answered(_: asyncio.Task) -> None:
+        nonlocal pending
+        pending -= 1
+
+    try:
+        while not connection.closed:
+            try:
+                frame: Dict[str, Any] = json.loads(await websocket.receive_text())
+            except ValueError:
+                manager.send(connection, {"type": "error", "code": "invalid_json"})
+                continue
+
+            kind = frame.get("type")
+            if kind == "message":
+                if pending >= settings.WS_MAX_PENDING_MESSAGES:
+                    # Each message costs a pipeline run and LLM call; a flood is not queued without bound
+                    logger.warning("Too many unanswered messages, closing WebSocket", session_id=session_id, pending=pending)
+                    await websocket.close(code=POLICY_VIOLATION_CLOSE_CODE)
+                    break
+                try:
+                    request = SendMessageRequest(
+                        session_id=session_id,
+                        content=frame.get("content", ""),
+                        message_type="agent" if role == "agent" else "user",
+                    )
+                except ValidationError:
+                    manager.send(connection, {"type": "error", "code": "invalid_message"})
+                    continue
+                worker = asyncio.create_task(_stream_reply(fanout, processor, connection, request, worker))
+                pending += 1
+                worker.add_done_callback(answered)
+            elif kind == "typing":
+                fanout.publish(session_id, {"type": "typing", "role": role, "state": bool(frame.get("state"))})
+            elif kind == "ack":
+                # Acks only matter for resume, which clients drive via last_ack
+                continue
+            else:
+                manager.send(connection, {"type": "error", "code": "unknown_event"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(connection)
+        await fanout.release(session_id)
+        fanout.publish(session_id, presence_event(role, "offline"))
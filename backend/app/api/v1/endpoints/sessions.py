@@ -1,7 +1,21 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.core.security import Principal, get_current_principal, require_roles
+from app.schemas.session import HandoffResponse, TakeoverRequest
+from app.services.analytics.events import get_event_writer
+from app.services.chat.fanout import SessionFanout, get_fanout
+from app.services.chat.handoff import hand_back, take_over
+from app.services.chat.message_processor import MessageProcessor, SessionNotFoundError, get_message_processor
+from app.services.compliance.transcript import (
+    FORMATS, TranscriptExporter, TranscriptNotFoundError, get_transcript_exporter, stream_transcript
+)
 
 router = APIRouter()
 
+require_agent = require_roles("agent", "supervisor", "admin")
+
 # TODO: Implement session management endpoints
 # - POST /create - Create new chat session
 # - GET /{session_id} - Get session details and history
@@ -22,3 +36,75 @@ async def get_session(session_id: str):
 async def end_session(session_id: str):
     """TODO: Implement session ending"""
     return {"message": f"End session {session_id} - TODO: Implement"}
+
+async def _check_tenant(db: AsyncSession, processor: MessageProcessor, session_id: str, principal: Principal) -> None:
+    """404 unless the session is open and belongs to the caller's tenant"""
+    try:
+        _, tenant_id = await processor.resolve_session(db, session_id)
+    except SessionNotFoundError:
+        tenant_id = None
+    if tenant_id != principal.tenant_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+@router.post("/{session_id}/takeover", response_model=HandoffResponse)
+async def takeover_session(
+    session_id: str,
+    request: TakeoverRequest,
+    db: AsyncSession = Depends(get_db),
+    fanout: SessionFanout = Depends(get_fanout),
+    processor: MessageProcessor = Depends(get_message_processor),
+    principal: Principal = Depends(require_agent),
+):
+    """Hand a session to the calling agent; both participants are notified live"""
+    await _check_tenant(db, processor, session_id, principal)
+    try:
+        session = await take_over(db, fanout, session_id, principal.user_id, request.reason)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return HandoffResponse(session_id=session.id, status=session.status, agent_id=session.agent_id)
+
+@router.post("/{session_id}/release", response_model=HandoffResponse)
+async def release_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    fanout: SessionFanout = Depends(get_fanout),
+    processor: MessageProcessor = Depends(get_message_processor),
+    principal: Principal = Depends(require_agent),
+):
+    """Return an escalated session in the caller's tenant to the bot"""
+    await _check_tenant(db, processor, session_id, principal)
+    try:
+        session = await hand_back(db, fanout, session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return HandoffResponse(session_id=session.id, status=session.status, agent_id=session.agent_id)
+
+@router.get("/{session_id}/transcript")
+async def export_transcript(
+    session_id: str,
+    format: str = Query("ndjson", description="ndjson, csv or pdf"),
+    db: AsyncSession = Depends(get_db),
+    exporter: TranscriptExporter = Depends(get_transcript_exporter),
+    principal: Principal = Depends(get_current_principal),
+):
+    """Stream the audited, redacted transcript of one of the caller's tenant's sessions"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(sorted(FORMATS))}")
+    try:
+        header = await exporter.header(db, session_id)
+    except TranscriptNotFoundError:
+        header = None
+    if header is None or header["tenant_id"] != principal.tenant_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    await get_event_writer().audit(
+        "transcript_export",
+        user_id=principal.user_id,
+        session_id=session_id,
+        details={"format": format},
+        tenant_id=principal.tenant_id,
+    )
+    return StreamingResponse(
+        stream_transcript(session_id, format, exporter),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="transcript-{session_id}.{format}"'},
+    )
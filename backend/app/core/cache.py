@@ -0,0 +1,179 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Generic, Hashable, List, Optional, Protocol, Sequence, TypeVar
+import time
+import structlog
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters for a cache"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
+
+
+class LRUCache(Generic[V]):
+    """Size-bounded in-process LRU cache with optional per-entry TTL"""
+
+    def __init__(self, max_items: int, ttl: Optional[float] = None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def keys(self) -> List[Hashable]:
+        return list(self._data.keys())
+
+
+class SharedCache(Protocol):
+    """Byte-valued cache shared between workers"""
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]: ...
+
+    async def set_many(self, items: Dict[str, bytes], ttl: Optional[int] = None) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+
+class InMemorySharedCache:
+    """Process-local stand-in for the shared cache, for tests and single-worker setups"""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        values: List[Optional[bytes]] = []
+        for key in keys:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                del self._data[key]
+                entry = None
+            values.append(entry[0] if entry is not None else None)
+        return values
+
+    async def set_many(self, items: Dict[str, bytes], ttl: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        for key, value in items.items():
+            self._data[key] = (value, expires_at)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class RedisSharedCache:
+    """Shared cache backed by Redis at REDIS_URL"""
+
+    def __init__(self, url: Optional[str] = None, db: Optional[int] = None):
+        import redis.asyncio as redis
+        self._client = redis.from_url(url or settings.REDIS_URL, db=settings.REDIS_DB if db is None else db)
+
+    @property
+    def client(self):
+        return self._client
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self._client.mget(list(keys))
+
+    async def set_many(self, items: Dict[str, bytes], ttl: Optional[int] = None) -> None:
+        if not items:
+            return
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, ex=ttl)
+            await pipe.execute()
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(key)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+_shared_cache: Optional[SharedCache] = None
+
+
+def get_shared_cache() -> SharedCache:
+    """Return the process-wide shared cache selected by CACHE_BACKEND"""
+    global _shared_cache
+    if _shared_cache is None:
+        if settings.CACHE_BACKEND == "redis":
+            _shared_cache = RedisSharedCache()
+        else:
+            _shared_cache = InMemorySharedCache()
+        logger.info("Shared cache initialized", backend=settings.CACHE_BACKEND)
+    return _shared_cache
+
+
+def set_shared_cache(cache: Optional[SharedCache]) -> None:
+    """Replace the shared cache, e.g. with an in-memory stand-in in tests"""
+    global _shared_cache
+    _shared_cache = cache
+
+
+async def close_shared_cache() -> None:
+    global _shared_cache
+    if isinstance(_shared_cache, RedisSharedCache):
+        await _shared_cache.close()
+    _shared_cache = None
@@ -1,8 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 import structlog
 from app.core.config import settings
+from app.core.metrics import TimedQueuePool, instrument_engine
 
 logger = structlog.get_logger()
 
@@ -13,7 +14,10 @@ engine = create_async_engine(
     pool_size=settings.DATABASE_POOL_SIZE,
     max_overflow=settings.DATABASE_MAX_OVERFLOW,
     pool_pre_ping=True,
+    poolclass=TimedQueuePool if settings.PROMETHEUS_ENABLED else AsyncAdaptedQueuePool,
 )
+if settings.PROMETHEUS_ENABLED:
+    instrument_engine(engine)
 
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -33,7 +37,7 @@ async def init_db():
         from app.models import (
             tenant, user, customer, session, message, thread, 
             ticket, knowledge_source, chunk, redaction_rule, 
-            policy, audit, analytics
+            policy, audit, analytics, orchestration
         )
         
         # Create all tables
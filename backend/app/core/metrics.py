@@ -0,0 +1,242 @@
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Set
+import hmac
+import ipaddress
+import re
+import time
+import uuid
+import structlog
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.responses import Response
+from app.core.cache import CacheStats
+from app.core.config import settings
+from app.core.logging import log_request
+
+logger = structlog.get_logger()
+
+OTHER = "other"
+
+# Buckets in seconds, from a cache hit to a slow LLM completion
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template, status and authenticated tenant",
+    ["method", "route", "status", "tenant"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being served")
+DB_POOL_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds", "Time to obtain a database connection from the pool", buckets=_LATENCY_BUCKETS
+)
+DB_QUERY = Histogram(
+    "db_query_duration_seconds", "Database statement time by verb and table", ["statement"], buckets=_LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "pipeline_stage_duration_seconds", "Reply pipeline stage latency", ["graph", "stage"], buckets=_LATENCY_BUCKETS
+)
+LLM_FIRST_TOKEN = Histogram(
+    "llm_first_token_seconds", "Time to the first streamed token by provider", ["provider"], buckets=_LATENCY_BUCKETS
+)
+
+
+class BoundedLabels:
+    """Label values capped at ``limit`` distinct ones; later values share ``other``
+
+    Values that arrive first keep their own series for the life of the
+    process, so a flood of new tenants or statements cannot grow the
+    series count without bound.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._seen: Set[str] = set()
+
+    def __call__(self, value: Optional[str]) -> str:
+        if not value:
+            return "none"
+        if value in self._seen:
+            return value
+        if len(self._seen) < self.limit:
+            self._seen.add(value)
+            return value
+        return OTHER
+
+
+tenant_label = BoundedLabels(settings.METRICS_MAX_TENANTS)
+
+_statement_label = BoundedLabels(settings.METRICS_MAX_STATEMENTS)
+_VERB_RE = re.compile(r"\s*(\w+)")
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|COPY)\s+\"?([a-z_]\w*)", re.IGNORECASE)
+_statement_labels: Dict[str, str] = {}
+
+
+def statement_label(statement: str) -> str:
+    """``VERB table`` for a SQL statement, e.g. ``SELECT messages``"""
+    label = _statement_labels.get(statement)
+    if label is None:
+        verb = _VERB_RE.match(statement)
+        if verb is None:
+            label = OTHER
+        else:
+            table = _TABLE_RE.search(statement)
+            label = verb.group(1).upper()
+            if table is not None:
+                label = f"{label} {table.group(1).lower()}"
+            label = _statement_label(label)
+        # Compiled statements repeat; literal-laden ones are labelled again each time
+        if len(_statement_labels) < 4096:
+            _statement_labels[statement] = label
+    return label
+
+
+class _StatsCollector:
+    """Reads existing cache and connection counters at scrape time, adding nothing to the request path"""
+
+    def __init__(self):
+        self.caches: Dict[str, CacheStats] = {}
+        self.gauges: Dict[str, Any] = {}
+
+    def collect(self) -> Iterator[Any]:
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        evictions = CounterMetricFamily("cache_evictions", "Entries evicted for space", labels=["cache"])
+        for name, stats in self.caches.items():
+            hits.add_metric([name], stats.hits)
+            misses.add_metric([name], stats.misses)
+            evictions.add_metric([name], stats.evictions)
+        yield from (hits, misses, evictions)
+        for name, (documentation, read) in self.gauges.items():
+            try:
+                yield GaugeMetricFamily(name, documentation, value=read())
+            except Exception as e:
+                logger.warning("Metric unavailable", metric=name, error=str(e))
+
+
+_collector = _StatsCollector()
+REGISTRY.register(_collector)
+
+
+def register_cache(name: str, stats: CacheStats) -> None:
+    """Export a cache's hit, miss and eviction counters as ``cache_*_total{cache=name}``"""
+    _collector.caches[name] = stats
+
+
+def register_gauge(name: str, documentation: str, read: Callable[[], float]) -> None:
+    """Export ``read()`` as a gauge, evaluated on each scrape"""
+    _collector.gauges[name] = (documentation, read)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Async queue pool that records how long each checkout takes, pre-ping included"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Time every statement and export the pool's occupancy"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            DB_QUERY.labels(statement_label(statement)).observe(time.perf_counter() - started)
+
+    # Read through the engine, which gets a new pool on dispose()
+    register_gauge("db_pool_checked_out", "Database connections in use", lambda: sync_engine.pool.checkedout())
+    register_gauge("db_pool_overflow", "Database connections open beyond the pool size", lambda: sync_engine.pool.overflow())
+
+
+class MetricsMiddleware:
+    """Times every HTTP request by route template and logs it
+
+    Pure ASGI, like ``RateLimitMiddleware``. The route label is the matched
+    path template (``/api/v1/sessions/{session_id}``), never the raw path,
+    and requests that match no route share ``unmatched``. The tenant label
+    comes from ``tenant_of``, which must read it from verified credentials;
+    without one every request is labelled ``none``.
+    """
+
+    def __init__(self, app, tenant_of: Optional[Callable[[Any], Awaitable[Optional[str]]]] = None):
+        self.app = app
+        self.tenant_of = tenant_of
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            duration = time.perf_counter() - started
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            tenant = None
+            if self.tenant_of is not None:
+                try:
+                    tenant = await self.tenant_of(scope)
+                except Exception as e:
+                    logger.warning("Request tenant unavailable for metrics", error=str(e))
+            HTTP_REQUESTS.labels(method, template, str(status_code), tenant_label(tenant)).inc()
+            HTTP_LATENCY.labels(method, template).observe(duration)
+            headers = dict(scope["headers"])
+            request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+            log_request(request_id, method, scope["path"], status_code, round(duration, 6))
+
+
+_SCRAPE_NETWORKS = [ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_NETWORKS]
+
+# Set by reverse proxies; a relayed request's peer address is the proxy's, not the client's
+_FORWARDED_HEADERS = {b"forwarded", b"x-forwarded-for", b"x-real-ip"}
+
+
+def scrape_allowed(scope) -> bool:
+    """Whether a request may read ``/metrics``: a direct connection from an allowed network, with METRICS_TOKEN if set"""
+    headers = dict(scope["headers"])
+    if _FORWARDED_HEADERS.intersection(headers):
+        return False
+    client = scope.get("client")
+    try:
+        address = ipaddress.ip_address(client[0]) if client else None
+    except ValueError:
+        address = None
+    if address is None or not any(address in network for network in _SCRAPE_NETWORKS):
+        return False
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}".encode("latin-1")
+        return hmac.compare_digest(headers.get(b"authorization", b""), expected)
+    return True
+
+
+def metrics_response() -> Response:
+    """The Prometheus exposition of this worker's metrics"""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,395 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+import asyncio
+import json
+import math
+import time
+import structlog
+from app.core.cache import CacheStats, RedisSharedCache, get_shared_cache
+from app.core.config import settings
+from app.core.security import scope_claims
+
+logger = structlog.get_logger()
+
+# Paths never limited: probes and API docs
+EXEMPT_PATHS = ("/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json")
+EXEMPT_PREFIXES = ("/api/v1/health",)
+
+# Share of the smallest limit one worker may hold locally at a time
+_LEASE_SHARE = 20
+
+
+@dataclass(frozen=True)
+class Limit:
+    """``count`` units per ``period`` seconds, enforced with GCRA"""
+    count: int
+    period: float
+
+    @property
+    def emission(self) -> float:
+        return self.period / self.count
+
+
+class RateLimitStore(Protocol):
+    """Holds GCRA state shared by all workers"""
+
+    async def claim(self, key: str, limits: Sequence[Limit], want: int, need: int, credit: int) -> Tuple[int, float]:
+        """Grant between ``need`` and ``want`` units under every limit at once
+
+        ``credit`` units from an unused lease are returned first. Returns
+        the units granted, or 0 and the seconds until ``need`` would be.
+        """
+        ...
+
+    async def refund(self, key: str, limits: Sequence[Limit], units: int) -> None:
+        """Hand back ``units`` granted earlier but not used, never past a full allowance"""
+        ...
+
+
+def _gcra(tats: List[float], limits: Sequence[Limit], now: float, want: int, need: int, credit: int) -> Tuple[int, float, List[float]]:
+    # Same arithmetic as the Lua script, for the in-process store
+    granted = want
+    wait = 0.0
+    for i, limit in enumerate(limits):
+        tat = max(tats[i] - credit * limit.emission, now)
+        tats[i] = tat
+        room = int((now + limit.period - tat) / limit.emission + 1e-9)
+        if room < need:
+            wait = max(wait, tat + need * limit.emission - limit.period - now)
+        granted = min(granted, room)
+    if wait > 0:
+        return 0, wait, tats
+    return granted, 0.0, [tat + granted * limit.emission for tat, limit in zip(tats, limits)]
+
+
+class InMemoryRateLimitStore:
+    """Process-local GCRA state, for tests and single-worker setups"""
+
+    def __init__(self):
+        self._tats: Dict[str, Tuple[float, ...]] = {}
+
+    async def claim(self, key: str, limits: Sequence[Limit], want: int, need: int, credit: int) -> Tuple[int, float]:
+        now = time.time()
+        state = self._tats.get(key)
+        tats = list(state) if state is not None and len(state) == len(limits) else [now] * len(limits)
+        granted, wait, tats = _gcra(tats, limits, now, want, need, credit)
+        if granted:
+            self._tats[key] = tuple(tats)
+        if len(self._tats) > settings.RATE_LIMIT_MAX_LOCAL_SUBJECTS:
+            # A subject whose arrival times have all passed is at full allowance and needs no state
+            self._tats = {k: v for k, v in self._tats.items() if max(v) > now}
+        return granted, wait
+
+    async def refund(self, key: str, limits: Sequence[Limit], units: int) -> None:
+        state = self._tats.get(key)
+        if state is None or len(state) != len(limits):
+            return
+        now = time.time()
+        self._tats[key] = tuple(max(tat - units * limit.emission, now) for tat, limit in zip(state, limits))
+
+
+# KEYS: one per limit. ARGV: want, need, credit, then emission interval and period per limit, in ms.
+# Uses the server clock so workers with skewed clocks agree.
+_CLAIM_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local want, need, credit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local granted, wait, tats = want, 0, {}
+for i, key in ipairs(KEYS) do
+  local emission, period = tonumber(ARGV[2 + i * 2]), tonumber(ARGV[3 + i * 2])
+  local tat = math.max((tonumber(redis.call('GET', key)) or now) - credit * emission, now)
+  local room = math.floor((now + period - tat) / emission + 1e-9)
+  if room < need then wait = math.max(wait, tat + need * emission - period - now) end
+  granted = math.min(granted, room)
+  tats[i] = tat
+end
+if wait > 0 then return {0, tostring(wait)} end
+for i, key in ipairs(KEYS) do
+  local tat = tats[i] + granted * tonumber(ARGV[2 + i * 2])
+  redis.call('SET', key, tostring(tat), 'PX', math.ceil(tat - now) + 1000)
+end
+return {granted, '0'}
+"""
+
+# KEYS: one per limit. ARGV: units, then emission interval per limit, in ms.
+# Moves each arrival time back, never before now, in one atomic step.
+_REFUND_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local units = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+  local tat = tonumber(redis.call('GET', key))
+  if tat and tat > now then
+    tat = math.max(tat - units * tonumber(ARGV[1 + i]), now)
+    redis.call('SET', key, tostring(tat), 'PX', math.ceil(tat - now) + 1000)
+  end
+end
+return 0
+"""
+
+
+def _keys(key: str, limits: Sequence[Limit]) -> List[str]:
+    return [f"rl:{{{key}}}:{int(limit.period)}" for limit in limits]
+
+
+class RedisRateLimitStore:
+    """GCRA state in Redis, updated by one script call per claim
+
+    A subject's windows share a hash tag, so a Redis Cluster keeps them on
+    one shard (the script needs that) while subjects spread across shards.
+    """
+
+    def __init__(self, client):
+        self._script = client.register_script(_CLAIM_SCRIPT)
+        self._refund_script = client.register_script(_REFUND_SCRIPT)
+
+    async def claim(self, key: str, limits: Sequence[Limit], want: int, need: int, credit: int) -> Tuple[int, float]:
+        args: List[Any] = [want, need, credit]
+        for limit in limits:
+            args += [limit.emission * 1000, limit.period * 1000]
+        granted, wait = await self._script(keys=_keys(key, limits), args=args)
+        return int(granted), float(wait) / 1000
+
+    async def refund(self, key: str, limits: Sequence[Limit], units: int) -> None:
+        await self._refund_script(keys=_keys(key, limits), args=[units] + [limit.emission * 1000 for limit in limits])
+
+
+class _Lease:
+    __slots__ = ("tokens", "expires")
+
+    def __init__(self, tokens: int, expires: float):
+        self.tokens = tokens
+        self.expires = expires
+
+
+class RateLimiter:
+    """GCRA limits shared across workers, served mostly from local leases
+
+    Each claim against the shared store takes a small lease of units (at
+    most 1/20th of the smallest limit, and ``lease_size``) that this
+    worker then hands out with no I/O until it runs out or expires after
+    ``lease_seconds``. Unused units are credited back on the next claim.
+    Leases are plain counters only touched between awaits, so the event
+    loop needs no locks; concurrent refills of one subject share a single
+    store call. If the store is unreachable, limits are enforced per
+    worker until it is back.
+    """
+
+    def __init__(
+        self,
+        store: Optional[RateLimitStore] = None,
+        lease_size: Optional[int] = None,
+        lease_seconds: Optional[float] = None,
+    ):
+        self.store = store
+        self.lease_size = settings.RATE_LIMIT_LEASE_SIZE if lease_size is None else lease_size
+        self.lease_seconds = settings.RATE_LIMIT_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.fallback = InMemoryRateLimitStore()
+        self.stats = CacheStats()  # hits are served from a lease, misses went to the store
+        self.denied = 0
+        self._leases: Dict[str, _Lease] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._degraded = False
+
+    def _store(self) -> RateLimitStore:
+        if self.store is None:
+            shared = get_shared_cache()
+            self.store = RedisRateLimitStore(shared.client) if isinstance(shared, RedisSharedCache) else InMemoryRateLimitStore()
+        return self.store
+
+    def _take(self, subject: str, cost: int) -> bool:
+        lease = self._leases.get(subject)
+        if lease is None or lease.tokens < cost or lease.expires <= time.monotonic():
+            return False
+        lease.tokens -= cost
+        return True
+
+    async def acquire(self, subject: str, limits: Sequence[Limit], cost: int = 1) -> float:
+        """0 when ``cost`` units are granted, else seconds until they could be"""
+        if not limits:
+            return 0.0
+        if self._take(subject, cost):
+            self.stats.hits += 1
+            return 0.0
+        pending = self._pending.get(subject)
+        if pending is not None:
+            await asyncio.shield(pending)
+            if self._take(subject, cost):
+                self.stats.hits += 1
+                return 0.0
+        return await self._refill(subject, limits, cost)
+
+    async def _refill(self, subject: str, limits: Sequence[Limit], cost: int) -> float:
+        self.stats.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[subject] = future
+        lease = self._leases.pop(subject, None)
+        credit = lease.tokens if lease is not None else 0
+        want = max(cost, min(self.lease_size, min(limit.count for limit in limits) // _LEASE_SHARE))
+        try:
+            try:
+                granted, wait = await self._store().claim(subject, limits, want, cost, credit)
+                if self._degraded:
+                    self._degraded = False
+                    logger.info("Rate limit store recovered")
+            except Exception as e:
+                if not self._degraded:
+                    self._degraded = True
+                    logger.warning("Rate limit store unavailable, limiting per worker", error=str(e))
+                granted, wait = await self.fallback.claim(subject, limits, want, cost, credit)
+            if granted < cost:
+                self.denied += 1
+                return wait
+            if granted > cost:
+                self._leases[subject] = _Lease(granted - cost, time.monotonic() + self.lease_seconds)
+                if len(self._leases) > settings.RATE_LIMIT_MAX_LOCAL_SUBJECTS:
+                    self._prune()
+            return 0.0
+        finally:
+            if self._pending.get(subject) is future:
+                del self._pending[subject]
+            future.set_result(None)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        self._leases = {subject: lease for subject, lease in self._leases.items() if lease.expires > now}
+
+    async def refund(self, subject: str, limits: Sequence[Limit], units: int) -> None:
+        """Return units granted but not used
+
+        They go to this worker's live lease when there is one, which is
+        credited to the store on its next refill, and otherwise straight
+        back to the store.
+        """
+        if units <= 0 or not limits:
+            return
+        lease = self._leases.get(subject)
+        if lease is not None and lease.expires > time.monotonic():
+            lease.tokens += units
+            return
+        if not self._degraded:
+            try:
+                await self._store().refund(subject, limits, units)
+                return
+            except Exception as e:
+                logger.warning("Rate limit store unavailable, refund is local only", error=str(e))
+        await self.fallback.refund(subject, limits, units)
+
+    def stats_dict(self) -> Dict[str, Any]:
+        return {"leases": self.stats.to_dict(), "denied": self.denied, "subjects": len(self._leases)}
+
+
+def _limits(per_minute: int, per_hour: int) -> Tuple[Limit, ...]:
+    return tuple(limit for limit in (Limit(per_minute, 60.0), Limit(per_hour, 3600.0)) if limit.count > 0)
+
+
+class RateLimitMiddleware:
+    """Enforce request limits per client address, user and tenant
+
+    Every request is charged to its client address
+    (RATE_LIMIT_IP_PER_MINUTE/HOUR). A request with a valid access token
+    is also charged to its user (RATE_LIMIT_PER_MINUTE/HOUR) and to the
+    user's tenant as a whole (RATE_LIMIT_TENANT_PER_MINUTE/HOUR). The
+    user and tenant come from the verified token claims, never from
+    headers the client chooses. Rejected requests get a 429 with
+    ``Retry-After``; rejected WebSocket handshakes are closed.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter
+        self.ip_limits = _limits(settings.RATE_LIMIT_IP_PER_MINUTE, settings.RATE_LIMIT_IP_PER_HOUR)
+        self.user_limits = _limits(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_PER_HOUR)
+        self.tenant_limits = _limits(settings.RATE_LIMIT_TENANT_PER_MINUTE, settings.RATE_LIMIT_TENANT_PER_HOUR)
+
+    async def _subjects(self, scope) -> List[Tuple[str, str, Tuple[Limit, ...]]]:
+        client = scope.get("client")
+        subjects = [("client", f"ip:{client[0] if client else 'unknown'}", self.ip_limits)]
+        claims = await scope_claims(scope)
+        if claims is not None:
+            subjects.append(("user", f"user:{claims.subject}", self.user_limits))
+            subjects.append(("tenant", f"tenant:{claims.tenant_id}", self.tenant_limits))
+        return subjects
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not settings.RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+            return await self.app(scope, receive, send)
+
+        if self.limiter is None:
+            self.limiter = get_rate_limiter()
+        granted: List[Tuple[str, Tuple[Limit, ...]]] = []
+        for kind, subject, limits in await self._subjects(scope):
+            wait = await self.limiter.acquire(subject, limits)
+            if wait > 0:
+                # Earlier subjects were charged for a request that will not run
+                for previous, previous_limits in granted:
+                    await self.limiter.refund(previous, previous_limits, 1)
+                return await self._reject(scope, send, kind, wait)
+            granted.append((subject, limits))
+        await self.app(scope, receive, send)
+
+    async def _reject(self, scope, send, kind: str, wait: float) -> None:
+        logger.debug("Rate limit exceeded", scope=kind, path=scope["path"], retry_after=round(wait, 3))
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1013})
+            return
+        body = json.dumps({"detail": "Rate limit exceeded", "scope": kind}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class LLMTokenMeter:
+    """Per-tenant LLM token budgets, so one busy tenant cannot exhaust provider capacity
+
+    Callers reserve the prompt plus the completion limit before a request
+    and release what the completion did not use, which moves the shared
+    arrival time back. Budgets are GCRA limits on the shared store with
+    leases of 1/20th of the budget.
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, tokens_per_minute: Optional[int] = None):
+        tokens_per_minute = settings.LLM_TENANT_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute
+        self.limits = _limits(tokens_per_minute, 0)
+        self.limiter = limiter or RateLimiter(lease_size=max(tokens_per_minute, 1))
+
+    async def reserve(self, tenant_id: str, tokens: int) -> bool:
+        if not self.limits:
+            return True
+        # A single request larger than the whole budget is capped at it rather than never admitted
+        tokens = min(tokens, self.limits[0].count)
+        return await self.limiter.acquire(f"llm:{tenant_id}", self.limits, tokens) == 0
+
+    async def release(self, tenant_id: str, tokens: int) -> None:
+        if self.limits:
+            await self.limiter.refund(f"llm:{tenant_id}", self.limits, min(tokens, self.limits[0].count))
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_token_meter: Optional[LLMTokenMeter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide request rate limiter"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def get_token_meter() -> LLMTokenMeter:
+    """Return the process-wide LLM token meter"""
+    global _token_meter
+    if _token_meter is None:
+        _token_meter = LLMTokenMeter()
+    return _token_meter
@@ -0,0 +1,370 @@
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import parse_qs
+import asyncio
+import hashlib
+import time
+import uuid
+import structlog
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+from app.core.cache import LRUCache, SharedCache, get_shared_cache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import register_cache
+from app.models.tenant import Tenant
+from app.models.user import User
+
+logger = structlog.get_logger()
+
+_password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Rows updated this long before the last poll are read again, for transactions that committed late
+_POLL_OVERLAP = timedelta(seconds=60)
+
+
+class AuthenticationError(Exception):
+    """Raised when a bearer token is missing, invalid, expired or revoked"""
+    pass
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    """The verified claims of an access or refresh token"""
+    subject: str
+    tenant_id: str
+    token_type: str
+    jti: str
+    expires_at: float
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "TokenClaims":
+        try:
+            return cls(
+                subject=str(payload["sub"]),
+                tenant_id=str(payload["tid"]),
+                token_type=str(payload["type"]),
+                jti=str(payload["jti"]),
+                expires_at=float(payload["exp"]),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise AuthenticationError("Malformed token") from e
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user and tenant behind a request"""
+    user_id: str
+    tenant_id: str
+    email: str
+    name: str
+    role: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def hash_password(password: str) -> str:
+    return _password_context.hash(password)
+
+
+async def verify_password(password: str, hashed_password: Optional[str]) -> bool:
+    """Check a password off the event loop; bcrypt takes tens of milliseconds"""
+    if not hashed_password:
+        # Still pay for one hash so unknown accounts answer no faster than known ones
+        await run_in_threadpool(_password_context.dummy_verify)
+        return False
+    return await run_in_threadpool(_password_context.verify, password, hashed_password)
+
+
+def create_token(principal: Principal, token_type: str = "access") -> Tuple[str, TokenClaims]:
+    if token_type == "refresh":
+        lifetime = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    else:
+        lifetime = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    now = datetime.now(timezone.utc)
+    claims = TokenClaims(
+        subject=principal.user_id,
+        tenant_id=principal.tenant_id,
+        token_type=token_type,
+        jti=uuid.uuid4().hex,
+        expires_at=int((now + lifetime).timestamp()),
+    )
+    payload = {
+        "sub": claims.subject,
+        "tid": claims.tenant_id,
+        "type": claims.token_type,
+        "jti": claims.jti,
+        "iat": int(now.timestamp()),
+        "exp": int(claims.expires_at),
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM), claims
+
+
+class _Verified:
+    __slots__ = ("claims", "checked_at")
+
+    def __init__(self, claims: TokenClaims):
+        self.claims = claims
+        self.checked_at = float("-inf")  # last revocation check against the shared cache
+
+
+class TokenVerifier:
+    """Verifies bearer tokens once, then serves their claims from memory
+
+    Verified claims are cached under a SHA-256 digest of the token, never
+    the token itself, for no longer than the token's ``exp``. Revocation
+    takes effect at once in the worker that revokes; other workers learn
+    of it from the shared cache, which they consult for a cached token at
+    most every ``AUTH_REVOCATION_CHECK_SECONDS``.
+    """
+
+    def __init__(self, shared: Optional[SharedCache] = None):
+        self.shared = shared
+        self.claims: LRUCache[_Verified] = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE)
+        self.revoked: LRUCache[bool] = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+    def _shared(self) -> SharedCache:
+        if self.shared is None:
+            self.shared = get_shared_cache()
+        return self.shared
+
+    @staticmethod
+    def _revoked_key(jti: str) -> str:
+        return f"revoked:{jti}"
+
+    async def verify(self, token: str, token_type: str = "access") -> TokenClaims:
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self.claims.get(key)
+        now = time.time()
+        if entry is None:
+            try:
+                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            except JWTError as e:
+                raise AuthenticationError("Invalid or expired token") from e
+            entry = _Verified(TokenClaims.from_payload(payload))
+            self.claims.set(key, entry, ttl=max(entry.claims.expires_at - now, 0.001))
+
+        claims = entry.claims
+        if claims.expires_at <= now:
+            raise AuthenticationError("Invalid or expired token")
+        if claims.token_type != token_type:
+            raise AuthenticationError(f"Wrong token type, expected {token_type}")
+        if claims.jti in self.revoked:
+            raise AuthenticationError("Token has been revoked")
+        if time.monotonic() - entry.checked_at >= settings.AUTH_REVOCATION_CHECK_SECONDS:
+            if await self._revoked_elsewhere(claims):
+                self.revoked.set(claims.jti, True, ttl=claims.expires_at - now)
+                raise AuthenticationError("Token has been revoked")
+            entry.checked_at = time.monotonic()
+        return claims
+
+    async def _revoked_elsewhere(self, claims: TokenClaims) -> bool:
+        try:
+            return (await self._shared().get_many([self._revoked_key(claims.jti)]))[0] is not None
+        except Exception as e:
+            logger.warning("Shared cache unavailable, skipping revocation check", error=str(e))
+            return False
+
+    async def revoke(self, claims: TokenClaims) -> None:
+        """Refuse the token from now on, here at once and in other workers after their next check"""
+        ttl = claims.expires_at - time.time()
+        if ttl <= 0:
+            return
+        self.revoked.set(claims.jti, True, ttl=ttl)
+        try:
+            await self._shared().set_many({self._revoked_key(claims.jti): b"1"}, ttl=int(ttl) + 1)
+        except Exception as e:
+            logger.warning("Shared cache unavailable, revocation is local only", jti=claims.jti, error=str(e))
+
+
+class PrincipalCache:
+    """Active users and their tenants as principals, loaded once per change
+
+    ``run_forever`` polls every ``AUTH_PRINCIPAL_REFRESH_SECONDS`` for users
+    and tenants whose ``updated_at`` moved, which covers deactivation, and
+    drops their principals, so resolving a cached identity never queries
+    the database. Call ``invalidate_user`` or ``invalidate_tenant`` after
+    changes made in this process to apply them at once.
+    """
+
+    def __init__(self):
+        self.cache: LRUCache[Principal] = LRUCache(settings.AUTH_PRINCIPAL_CACHE_SIZE)
+        self._by_tenant: Dict[str, Set[str]] = {}
+        self._since: Optional[datetime] = None
+
+    async def get(self, user_id: str) -> Optional[Principal]:
+        """Principal for an active user of an active tenant, else None"""
+        principal = self.cache.get(user_id)
+        if principal is None:
+            principal = await self._load(user_id)
+            if principal is not None:
+                self.cache.set(user_id, principal)
+                self._by_tenant.setdefault(principal.tenant_id, set()).add(user_id)
+        return principal
+
+    async def _load(self, user_id: str) -> Optional[Principal]:
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(User.id, User.tenant_id, User.email, User.name, User.role)
+                .join(Tenant, Tenant.id == User.tenant_id)
+                .where(User.id == user_id, User.is_active.is_(True), Tenant.is_active.is_(True))
+            )).one_or_none()
+        return Principal(*row) if row is not None else None
+
+    def invalidate_user(self, user_id: str) -> None:
+        principal = self.cache.pop(user_id)
+        if principal is not None:
+            self._by_tenant.get(principal.tenant_id, set()).discard(user_id)
+
+    def invalidate_tenant(self, tenant_id: str) -> None:
+        for user_id in self._by_tenant.pop(tenant_id, set()):
+            self.cache.pop(user_id)
+
+    async def poll(self) -> int:
+        """Drop principals whose user or tenant changed since the last poll; returns how many"""
+        async with AsyncSessionLocal() as db:
+            if self._since is None:
+                self._since = (await db.execute(select(func.now()))).scalar_one()
+                return 0
+            since = self._since - _POLL_OVERLAP
+            users = (await db.execute(select(User.id, User.updated_at).where(User.updated_at > since))).all()
+            tenants = (await db.execute(select(Tenant.id, Tenant.updated_at).where(Tenant.updated_at > since))).all()
+        dropped = 0
+        for user_id, updated_at in users:
+            dropped += user_id in self.cache
+            self.invalidate_user(user_id)
+            self._since = max(self._since, updated_at)
+        for tenant_id, updated_at in tenants:
+            dropped += len(self._by_tenant.get(tenant_id, ()))
+            self.invalidate_tenant(tenant_id)
+            self._since = max(self._since, updated_at)
+        if dropped:
+            logger.info("Principals invalidated", principals=dropped)
+        return dropped
+
+    async def run_forever(self, interval: Optional[float] = None) -> None:
+        """Poll for changes on a fixed interval until cancelled"""
+        interval = interval or settings.AUTH_PRINCIPAL_REFRESH_SECONDS
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Principal cache poll failed", error=str(e))
+            await asyncio.sleep(interval)
+
+
+_token_verifier: Optional[TokenVerifier] = None
+_principal_cache: Optional[PrincipalCache] = None
+
+
+def get_token_verifier() -> TokenVerifier:
+    """Return the process-wide token verifier"""
+    global _token_verifier
+    if _token_verifier is None:
+        _token_verifier = TokenVerifier()
+        register_cache("auth_tokens", _token_verifier.claims.stats)
+    return _token_verifier
+
+
+def get_principal_cache() -> PrincipalCache:
+    """Return the process-wide principal cache"""
+    global _principal_cache
+    if _principal_cache is None:
+        _principal_cache = PrincipalCache()
+        register_cache("auth_principals", _principal_cache.cache.stats)
+    return _principal_cache
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+# Where scope_claims() leaves its result for later middleware and handlers
+_SCOPE_CLAIMS = "auth_claims"
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+async def authenticate(token: str, token_type: str = "access") -> Tuple[TokenClaims, Principal]:
+    """Claims and principal for a token, raising HTTP 401 when either is not valid"""
+    try:
+        claims = await get_token_verifier().verify(token, token_type)
+    except AuthenticationError as e:
+        raise _unauthorized(str(e))
+    principal = await get_principal_cache().get(claims.subject)
+    if principal is None or principal.tenant_id != claims.tenant_id:
+        raise _unauthorized("Account is disabled")
+    return claims, principal
+
+
+def _scope_token(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    if scope["type"] == "websocket":
+        # Browsers cannot set headers on a WebSocket handshake
+        token = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("token")
+        return token[0] if token else None
+    return None
+
+
+async def scope_claims(scope) -> Optional[TokenClaims]:
+    """Verified access token claims of an ASGI request, or None when it carries no valid token
+
+    The result is kept on the scope, so middleware and handlers of one
+    request verify the token once.
+    """
+    state = scope.setdefault("state", {})
+    if _SCOPE_CLAIMS in state:
+        return state[_SCOPE_CLAIMS]
+    claims = None
+    token = _scope_token(scope)
+    if token:
+        try:
+            claims = await get_token_verifier().verify(token)
+        except AuthenticationError:
+            pass
+    state[_SCOPE_CLAIMS] = claims
+    return claims
+
+
+async def scope_tenant(scope) -> Optional[str]:
+    """Tenant of the verified access token on an ASGI request, if it carries one"""
+    claims = await scope_claims(scope)
+    return claims.tenant_id if claims is not None else None
+
+
+async def get_current_claims(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> TokenClaims:
+    """Dependency: verified access token claims of the caller"""
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    claims, _ = await authenticate(credentials.credentials)
+    return claims
+
+
+async def get_current_principal(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Principal:
+    """Dependency: the authenticated caller"""
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    _, principal = await authenticate(credentials.credentials)
+    return principal
+
+
+def require_roles(*roles: str) -> Callable[..., Awaitable[Principal]]:
+    """Dependency factory: the authenticated caller, who must hold one of ``roles``"""
+
+    async def dependency(principal: Principal = Depends(get_current_principal)) -> Principal:
+        if principal.role not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient role")
+        return principal
+
+    return dependency
@@ -12,7 +12,8 @@ from .chunk import Chunk
 from .redaction_rule import RedactionRule
 from .policy import Policy
 from .audit import Audit
-from .analytics import Analytics
+from .analytics import Analytics, AnalyticsRollup, RollupWatermark
+from .orchestration import OrchestrationCheckpoint
 
 __all__ = [
     "Tenant",
@@ -27,5 +28,8 @@ __all__ = [
     "RedactionRule",
     "Policy",
     "Audit",
-    "Analytics"
+    "Analytics",
+    "AnalyticsRollup",
+    "RollupWatermark",
+    "OrchestrationCheckpoint"
 ]
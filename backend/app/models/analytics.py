@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Float, Integer
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Float, Integer, LargeBinary
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -14,7 +14,32 @@ class Analytics(Base):
     user_id = Column(String, ForeignKey("users.id"))
     tenant_id = Column(String, ForeignKey("tenants.id"), nullable=False)
     metadata = Column(Text)  # JSON metadata
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    ingested_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # Drives rollup refresh
 
     # TODO: Add analytics aggregation methods
     # TODO: Add performance tracking fields
+
+
+class AnalyticsRollup(Base):
+    """Pre-aggregated analytics events for one tenant, metric and time bucket"""
+    __tablename__ = "analytics_rollups"
+
+    tenant_id = Column(String, ForeignKey("tenants.id"), primary_key=True)
+    granularity = Column(String, primary_key=True)  # minute, hour, day (UTC)
+    metric_name = Column(String, primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    metric_type = Column(String, nullable=False)
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    sketch = Column(LargeBinary)  # DDSketch for histograms, see services/analytics/sketch.py
+
+
+class RollupWatermark(Base):
+    """How far the rollup has consumed ingested analytics events"""
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String, primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=False)
@@ -8,12 +8,13 @@ class Audit(Base):
 
     id = Column(String, primary_key=True, index=True)
     event_type = Column(String, nullable=False)  # login, message, escalation, etc.
-    user_id = Column(String, ForeignKey("users.id"))
-    session_id = Column(String, ForeignKey("sessions.id"))
+    tenant_id = Column(String, ForeignKey("tenants.id"), index=True)
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    session_id = Column(String, ForeignKey("sessions.id"), index=True)
     details = Column(Text)  # JSON details
     ip_address = Column(String)
     user_agent = Column(String)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     # TODO: Add audit query methods
     # TODO: Add compliance reporting fields
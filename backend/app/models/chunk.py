@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Float, Integer, LargeBinary
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -7,11 +7,15 @@ class Chunk(Base):
     __tablename__ = "chunks"
 
     id = Column(String, primary_key=True, index=True)
-    knowledge_source_id = Column(String, ForeignKey("knowledge_sources.id"), nullable=False)
+    knowledge_source_id = Column(String, ForeignKey("knowledge_sources.id"), nullable=False, index=True)
     content = Column(Text, nullable=False)
-    embedding = Column(Text)  # Vector embedding (JSON)
+    content_hash = Column(String(64))  # sha256 of normalized content, see ingestion.content_hash
+    ordinal = Column(Integer)  # Position within the source document
+    source_version = Column(Integer)  # KnowledgeSource.version last confirming this chunk
+    embedding = Column(Text)  # Legacy JSON embedding, migrated to embedding_data
+    embedding_data = Column(LargeBinary)  # Packed vector, see services/knowledge/embedding_codec.py
     metadata = Column(Text)  # JSON metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    deleted_at = Column(DateTime(timezone=True))  # Tombstone set when a re-ingest drops the chunk
 
     # TODO: Add vector similarity search methods
-    # TODO: Add chunk processing fields
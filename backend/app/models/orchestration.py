@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class OrchestrationCheckpoint(Base):
+    """Completed node outputs of an orchestration run, for resumption"""
+    __tablename__ = "orchestration_checkpoints"
+
+    id = Column(String, primary_key=True, index=True)  # Run id
+    graph = Column(String, nullable=False)
+    session_id = Column(String, ForeignKey("sessions.id"), index=True)
+    status = Column(String, nullable=False)  # running, completed, failed
+    state = Column(Text)  # JSON node outputs
+    timings = Column(Text)  # JSON per-node seconds
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
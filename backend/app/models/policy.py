@@ -17,5 +17,4 @@ class Policy(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    # TODO: Add policy enforcement methods
     # TODO: Add compliance tracking fields
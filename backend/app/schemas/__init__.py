@@ -0,0 +1,26 @@
+# Pydantic schemas for HeliosCS API payloads
+
+from .message import SendMessageRequest, SendMessageResponse, BotReply, Citation
+from .session import TakeoverRequest, HandoffResponse
+from .analytics import DashboardKPIs, DashboardPoint, DashboardResponse
+from .export import BulkExportRequest, ExportJobStatus
+from .auth import LoginRequest, RefreshRequest, LogoutRequest, TokenResponse, PrincipalResponse
+
+__all__ = [
+    "SendMessageRequest",
+    "SendMessageResponse",
+    "BotReply",
+    "Citation",
+    "TakeoverRequest",
+    "HandoffResponse",
+    "DashboardKPIs",
+    "DashboardPoint",
+    "DashboardResponse",
+    "BulkExportRequest",
+    "ExportJobStatus",
+    "LoginRequest",
+    "RefreshRequest",
+    "LogoutRequest",
+    "TokenResponse",
+    "PrincipalResponse",
+]
@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class DashboardKPIs(BaseModel):
+    """Headline support metrics over the requested range"""
+    sessions: int = 0
+    deflection_rate: Optional[float] = None
+    containment_rate: Optional[float] = None
+    csat_average: Optional[float] = None
+    csat_satisfied_rate: Optional[float] = None
+    csat_responses: int = 0
+    first_response_p50_seconds: Optional[float] = None
+    first_response_p90_seconds: Optional[float] = None
+    response_p90_seconds: Optional[float] = None
+
+
+class DashboardPoint(BaseModel):
+    """Dashboard metrics for one time bucket"""
+    bucket_start: datetime
+    kpis: DashboardKPIs
+
+
+class DashboardResponse(BaseModel):
+    """Dashboard KPIs and their time series, read from rollups"""
+    tenant_id: str
+    start: datetime
+    end: datetime
+    granularity: str
+    kpis: DashboardKPIs
+    series: List[DashboardPoint]
+    rollup_watermark: Optional[datetime] = None
@@ -0,0 +1,35 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class LoginRequest(BaseModel):
+    """Email and password of a console user"""
+    email: str
+    password: str
+
+
+class RefreshRequest(BaseModel):
+    """A refresh token to exchange, or to revoke on logout"""
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    """Refresh token to revoke along with the access token"""
+    refresh_token: Optional[str] = None
+
+
+class TokenResponse(BaseModel):
+    """A new access and refresh token pair"""
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int  # seconds until the access token expires
+
+
+class PrincipalResponse(BaseModel):
+    """The authenticated user"""
+    user_id: str
+    tenant_id: str
+    email: str
+    name: str
+    role: str
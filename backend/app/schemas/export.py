@@ -0,0 +1,20 @@
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class BulkExportRequest(BaseModel):
+    """Sessions to export for a regulatory request"""
+    session_ids: List[str] = Field(..., min_length=1)
+    format: str = "ndjson"  # ndjson, csv, pdf
+
+
+class ExportJobStatus(BaseModel):
+    """Progress of a bulk transcript export"""
+    job_id: str
+    format: str
+    state: str  # pending, running, completed
+    sessions: int
+    completed: int
+    failed: List[Dict[str, Any]] = []
+    created_at: str
+    finished_at: Optional[str] = None
@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class SendMessageRequest(BaseModel):
+    """Customer message posted to a session"""
+    session_id: str
+    content: str = Field(..., min_length=1, max_length=8000)
+    message_type: str = "user"
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class Citation(BaseModel):
+    """Knowledge chunk an answer is grounded in"""
+    chunk_id: str
+    knowledge_source_id: str
+    source_name: str
+    score: float
+
+
+class BotReply(BaseModel):
+    """Composed bot answer returned alongside the stored user message"""
+    message_id: str
+    content: str
+    citations: List[Citation] = []
+    confidence: Optional[float] = None
+    cached: bool = False
+
+
+class SendMessageResponse(BaseModel):
+    message_id: str
+    session_id: str
+    content: str
+    message_type: str
+    timestamp: datetime
+    status: str
+    reply: Optional[BotReply] = None
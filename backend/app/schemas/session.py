@@ -0,0 +1,14 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class TakeoverRequest(BaseModel):
+    """Agent taking over a session from the bot; the agent is the caller"""
+    reason: Optional[str] = None
+
+
+class HandoffResponse(BaseModel):
+    """Session state after a takeover or hand-back"""
+    session_id: str
+    status: str
+    agent_id: Optional[str] = None
@@ -0,0 +1,32 @@
+# AI/LLM integration services
+
+from .embedding_cache import EmbeddingCache, normalize_text
+from .embeddings import EmbeddingService, EmbeddingError, get_embedding_service
+from .local_embeddings import LocalEmbeddingEngine, get_local_engine, shutdown_local_engine
+from .batching import MicroBatcher, BatcherStats
+from .intent import IntentClassifier, EmbeddingIntentClassifier, IntentResult, get_intent_classifier
+from .llm import LLMPool, LLMError, Provider, OpenAIProvider, AnthropicProvider, get_llm_pool, close_llm_pool
+
+__all__ = [
+    "EmbeddingCache",
+    "normalize_text",
+    "EmbeddingService",
+    "EmbeddingError",
+    "get_embedding_service",
+    "LocalEmbeddingEngine",
+    "get_local_engine",
+    "shutdown_local_engine",
+    "MicroBatcher",
+    "BatcherStats",
+    "IntentClassifier",
+    "EmbeddingIntentClassifier",
+    "IntentResult",
+    "get_intent_classifier",
+    "LLMPool",
+    "LLMError",
+    "Provider",
+    "OpenAIProvider",
+    "AnthropicProvider",
+    "get_llm_pool",
+    "close_llm_pool",
+]
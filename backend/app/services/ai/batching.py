@@ -0,0 +1,108 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Sequence, Set, Tuple, TypeVar
+import asyncio
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class BatcherStats:
+    """Counters for one micro-batcher"""
+    submitted: int = 0
+    batches: int = 0
+    largest_batch: int = 0
+    failed_batches: int = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.submitted / self.batches if self.batches else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "mean_batch_size": round(self.mean_batch_size, 2)}
+
+
+class MicroBatcher(Generic[T, R]):
+    """Coalesces concurrent single-item calls into batched backend calls
+
+    When no batch is in flight a call is dispatched on the next loop
+    iteration, together with anything submitted in the same tick, so an
+    idle service adds no latency. While a batch is in flight new items
+    accumulate for up to ``window`` seconds or ``max_size`` items and are
+    sent as one call. A failed batch fails every caller in it; callers
+    that were cancelled while waiting are left out of the batch.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[T]], Awaitable[Sequence[R]]],
+        max_size: int,
+        window: float,
+        max_in_flight: int = 4,
+        name: str = "batcher",
+    ):
+        self.fn = fn
+        self.max_size = max_size
+        self.window = window
+        self.max_in_flight = max_in_flight
+        self.name = name
+        self.stats = BatcherStats()
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Handle] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self.stats.submitted += 1
+
+        if len(self._pending) >= self.max_size:
+            self._dispatch()
+        elif self._timer is None:
+            delay = 0 if not self._in_flight else self.window
+            self._timer = loop.call_later(delay, self._dispatch)
+        return await future
+
+    async def submit_many(self, items: Sequence[T]) -> List[R]:
+        return list(await asyncio.gather(*(self.submit(item) for item in items)))
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # With max_in_flight batches running, items keep accumulating until one completes
+        while self._pending and len(self._in_flight) < self.max_in_flight:
+            batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+            task = asyncio.create_task(self._run(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        if self._pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_soon(self._dispatch)
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        live = [(item, future) for item, future in batch if not future.done()]
+        if not live:
+            return
+        self.stats.batches += 1
+        self.stats.largest_batch = max(self.stats.largest_batch, len(live))
+        try:
+            results = await self.fn([item for item, _ in live])
+            if len(results) != len(live):
+                raise RuntimeError(f"{self.name} returned {len(results)} results for {len(live)} items")
+        except Exception as e:
+            self.stats.failed_batches += 1
+            logger.warning("Batched call failed", batcher=self.name, size=len(live), error=str(e))
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(live, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,95 @@
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import unicodedata
+import numpy as np
+from app.core.cache import CacheStats, LRUCache, SharedCache, get_shared_cache
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFKC, case-folded, single-spaced"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"emb:{model}:{digest}"
+
+
+class EmbeddingCache:
+    """Two-level embedding cache: in-process LRU in front of a shared tier
+
+    The shared tier is whatever ``get_shared_cache`` returns (Redis in
+    deployment, an in-memory stand-in in tests). Shared-tier failures are
+    logged and treated as misses so embedding never depends on Redis.
+    """
+
+    def __init__(
+        self,
+        max_items: Optional[int] = None,
+        ttl: Optional[int] = None,
+        shared: Optional[SharedCache] = None,
+        use_shared: Optional[bool] = None,
+    ):
+        self.ttl = settings.EMBEDDING_CACHE_TTL if ttl is None else ttl
+        self.local: LRUCache[np.ndarray] = LRUCache(
+            max_items or settings.EMBEDDING_CACHE_SIZE, ttl=self.ttl or None
+        )
+        self.use_shared = settings.EMBEDDING_CACHE_SHARED if use_shared is None else use_shared
+        self._shared = shared
+        self.shared_stats = CacheStats()
+
+    @property
+    def shared(self) -> SharedCache:
+        return self._shared or get_shared_cache()
+
+    async def get_many(self, model: str, texts: Sequence[str], dimension: int) -> List[Optional[np.ndarray]]:
+        """Cached vectors for each text, None where both tiers miss"""
+        keys = [cache_key(model, text) for text in texts]
+        found: List[Optional[np.ndarray]] = [self.local.get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(found) if vector is None]
+        if not missing or not self.use_shared:
+            return found
+
+        try:
+            blobs = await self.shared.get_many([keys[i] for i in missing])
+        except Exception as e:
+            logger.warning("Shared embedding cache unavailable", error=str(e))
+            self.shared_stats.misses += len(missing)
+            return found
+
+        for i, blob in zip(missing, blobs):
+            if blob is None or len(blob) != dimension * 4:
+                self.shared_stats.misses += 1
+                continue
+            vector = np.frombuffer(blob, dtype=np.float32)
+            self.local.set(keys[i], vector)
+            found[i] = vector
+            self.shared_stats.hits += 1
+        return found
+
+    async def set_many(self, model: str, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """Store freshly computed vectors in both tiers"""
+        items: Dict[str, bytes] = {}
+        for text, vector in zip(texts, vectors):
+            key = cache_key(model, text)
+            vector = np.ascontiguousarray(vector, dtype=np.float32)
+            self.local.set(key, vector)
+            items[key] = vector.tobytes()
+
+        if not self.use_shared or not items:
+            return
+        try:
+            await self.shared.set_many(items, ttl=self.ttl or None)
+        except Exception as e:
+            logger.warning("Shared embedding cache write failed", error=str(e))
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            "local": {**self.local.stats.to_dict(), "size": len(self.local)},
+            "shared": self.shared_stats.to_dict(),
+        }
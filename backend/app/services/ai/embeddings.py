@@ -0,0 +1,175 @@
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import register_cache
+from app.services.ai.batching import MicroBatcher
+from app.services.ai.embedding_cache import EmbeddingCache, normalize_text
+from app.services.ai.local_embeddings import LocalEmbeddingEngine, get_local_engine
+
+logger = get_logger(__name__)
+
+
+class EmbeddingError(Exception):
+    """Raised when an embedding backend fails"""
+    pass
+
+
+class EmbeddingService:
+    """Vector embeddings for queries and knowledge chunks
+
+    Every call goes through the embedding cache first; only texts missing
+    from both cache tiers reach the backend. Single queries from
+    concurrent requests are coalesced into batched backend calls.
+
+    Backends: ``openai`` (the embeddings API) and ``local``
+    (sentence-transformers on a CPU process pool, fully offline).
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        dimension: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None,
+        backend: Optional[str] = None,
+        local_engine: Optional[LocalEmbeddingEngine] = None,
+    ):
+        self.backend = backend or settings.EMBEDDING_BACKEND
+        if self.backend not in ("openai", "local"):
+            raise EmbeddingError(f"Unknown embedding backend {self.backend!r}")
+        default_model = settings.EMBEDDING_LOCAL_MODEL if self.backend == "local" else settings.EMBEDDING_MODEL
+        self.model = model or default_model
+        self._dimension = dimension or settings.EMBEDDING_DIMENSION or None
+        if self._dimension is None and self.backend == "openai":
+            self._dimension = settings.PGVECTOR_DIMENSION
+        if cache is None and settings.EMBEDDING_CACHE_ENABLED:
+            cache = EmbeddingCache()
+            register_cache("embedding_local", cache.local.stats)
+            register_cache("embedding_shared", cache.shared_stats)
+        self.cache = cache
+        self._client = None
+        self._local_engine = local_engine
+        self.batcher: MicroBatcher[str, np.ndarray] = MicroBatcher(
+            self.embed,
+            max_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+            window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+            name="embeddings",
+        )
+
+    @property
+    def dimension(self) -> int:
+        """Vector width; for the local backend, known once ``ready`` has loaded the model"""
+        if self._dimension is None:
+            raise EmbeddingError("Embedding dimension is not known yet; await ready() first")
+        return self._dimension
+
+    async def ready(self) -> int:
+        """The vector width, starting the local model to read it if it is not configured"""
+        if self._dimension is None:
+            engine = self._local_engine = self._local_engine or get_local_engine()
+            try:
+                self._dimension = await engine.ensure_started()
+            except Exception as e:
+                logger.error("Local embedding model unavailable", model=self.model, error=str(e))
+                raise EmbeddingError(str(e)) from e
+        return self._dimension
+
+    def _get_client(self):
+        """Lazily create the OpenAI client"""
+        if self._client is None:
+            if not settings.OPENAI_API_KEY:
+                raise EmbeddingError("OPENAI_API_KEY is not configured")
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        return self._client
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed a batch of texts into a float32 matrix of shape (n, dimension)"""
+        out = np.empty((len(texts), await self.ready()), dtype=np.float32)
+        if not texts:
+            return out
+
+        missing = list(range(len(texts)))
+        if self.cache is not None:
+            cached = await self.cache.get_many(self.model, texts, self.dimension)
+            missing = []
+            for i, vector in enumerate(cached):
+                if vector is None:
+                    missing.append(i)
+                else:
+                    out[i] = vector
+        if not missing:
+            return out
+
+        # Texts that normalize identically within one batch are only sent once
+        slots: Dict[str, int] = {}
+        representatives: List[str] = []
+        positions: List[int] = []
+        for i in missing:
+            key = normalize_text(texts[i])
+            if key not in slots:
+                slots[key] = len(representatives)
+                representatives.append(texts[i])
+            positions.append(slots[key])
+        computed = await self._embed_uncached(representatives)
+        out[missing] = computed[positions]
+
+        if self.cache is not None:
+            await self.cache.set_many(self.model, representatives, computed)
+        return out
+
+    async def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        """Call the embedding backend directly"""
+        if self.backend == "local":
+            return await self._embed_local(texts)
+        try:
+            options = {}
+            if settings.EMBEDDING_DIMENSION and not self.model.startswith("text-embedding-ada"):
+                # text-embedding-3 models can shorten their output natively
+                options["dimensions"] = self.dimension
+            response = await self._get_client().embeddings.create(
+                model=self.model,
+                input=texts,
+                **options,
+            )
+        except EmbeddingError:
+            raise
+        except Exception as e:
+            logger.error("Embedding request failed", model=self.model, error=str(e))
+            raise EmbeddingError(str(e)) from e
+
+        vectors = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+        if vectors.shape[1] != self.dimension:
+            raise EmbeddingError(
+                f"Model {self.model} returned dimension {vectors.shape[1]}, expected {self.dimension}"
+            )
+        return vectors
+
+    async def _embed_local(self, texts: List[str]) -> np.ndarray:
+        engine = self._local_engine = self._local_engine or get_local_engine()
+        try:
+            vectors = await engine.encode(texts)
+        except Exception as e:
+            logger.error("Local embedding failed", model=self.model, error=str(e))
+            raise EmbeddingError(str(e)) from e
+        if vectors.shape[1] != self.dimension:
+            raise EmbeddingError(
+                f"Model {self.model} produces dimension {vectors.shape[1]}, expected {self.dimension}; "
+                "set EMBEDDING_DIMENSION to match"
+            )
+        return vectors
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        """Embed a single query string, batched with concurrent queries"""
+        return await self.batcher.submit(text)
+
+
+_embedding_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the process-wide embedding service"""
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService()
+    return _embedding_service
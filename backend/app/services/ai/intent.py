@@ -0,0 +1,164 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import re
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.ai.batching import MicroBatcher
+from app.services.ai.embeddings import EmbeddingService, get_embedding_service
+
+logger = get_logger(__name__)
+
+# Ordered: the first intent whose pattern matches wins
+INTENT_PATTERNS: List[Tuple[str, str]] = [
+    ("escalation", r"\b(?:human|agent|representative|real person|speak to someone|talk to someone|supervisor|manager)\b"),
+    ("complaint", r"\b(?:complain(?:t)?|unacceptable|terrible|ridiculous|fraud(?:ulent)?|dispute|unauthori[sz]ed)\b"),
+    ("account", r"\b(?:my (?:account|balance|card|statement|transaction|payment|loan)s?|balance|transactions?)\b"),
+    ("greeting", r"^\s*(?:hi|hello|hey|good (?:morning|afternoon|evening))\b[\s!.,]*$"),
+]
+
+DEFAULT_INTENT = "faq"
+
+# Example phrasings per intent for the embedding backend; keyword rules still run first
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "escalation": [
+        "I want to talk to a person",
+        "can someone from your team call me",
+        "this bot is not helping, get me support staff",
+    ],
+    "complaint": [
+        "I was charged twice and nobody has fixed it",
+        "I am very unhappy with how my case was handled",
+        "there is a payment on my card I did not make",
+    ],
+    "account": [
+        "what is my current balance",
+        "why was my card declined",
+        "when will my last transfer arrive",
+    ],
+    "greeting": ["hi there", "good morning"],
+    "faq": [
+        "what are your opening hours",
+        "how do I reset my online banking password",
+        "what fees apply to international transfers",
+    ],
+}
+
+
+@dataclass
+class IntentResult:
+    """Detected intent of a customer message"""
+    intent: str
+    confidence: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class IntentClassifier:
+    """Keyword intent classifier
+
+    Escalation and complaint cues are checked first so they are never
+    masked by a more generic intent.
+    """
+
+    def __init__(self, patterns: Optional[List[Tuple[str, str]]] = None):
+        self.patterns = [(intent, re.compile(pattern, re.IGNORECASE)) for intent, pattern in (patterns or INTENT_PATTERNS)]
+
+    def match(self, text: str) -> Optional[IntentResult]:
+        for intent, pattern in self.patterns:
+            if pattern.search(text):
+                return IntentResult(intent=intent, confidence=0.9)
+        return None
+
+    def classify_sync(self, text: str) -> IntentResult:
+        return self.match(text) or IntentResult(intent=DEFAULT_INTENT, confidence=0.5)
+
+    async def classify(self, text: str) -> IntentResult:
+        return self.classify_sync(text)
+
+    async def classify_many(self, texts: Sequence[str]) -> List[IntentResult]:
+        return [self.classify_sync(text) for text in texts]
+
+
+class EmbeddingIntentClassifier(IntentClassifier):
+    """Nearest-example intent classifier over sentence embeddings
+
+    Keyword rules run first and win outright. Remaining messages from
+    concurrent requests are batched, embedded in one backend call and
+    scored against every example with a single matrix product; below
+    ``INTENT_MIN_SIMILARITY`` the message falls back to the default intent.
+    """
+
+    def __init__(
+        self,
+        embedding_service: Optional[EmbeddingService] = None,
+        examples: Optional[Dict[str, List[str]]] = None,
+        min_similarity: Optional[float] = None,
+        patterns: Optional[List[Tuple[str, str]]] = None,
+    ):
+        super().__init__(patterns)
+        self.embedding_service = embedding_service or get_embedding_service()
+        self.examples = examples or INTENT_EXAMPLES
+        self.min_similarity = settings.INTENT_MIN_SIMILARITY if min_similarity is None else min_similarity
+        self._labels = [intent for intent, phrases in self.examples.items() for _ in phrases]
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_lock = asyncio.Lock()
+        self.batcher: MicroBatcher[str, IntentResult] = MicroBatcher(
+            self._classify_batch,
+            max_size=settings.INTENT_BATCH_MAX_SIZE,
+            window=settings.INTENT_BATCH_WINDOW_MS / 1000,
+            name="intent",
+        )
+
+    async def _example_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            async with self._matrix_lock:
+                if self._matrix is None:
+                    phrases = [phrase for phrases in self.examples.values() for phrase in phrases]
+                    self._matrix = _normalized(await self.embedding_service.embed(phrases))
+        return self._matrix
+
+    async def _classify_batch(self, texts: List[str]) -> List[IntentResult]:
+        examples = await self._example_matrix()
+        scores = _normalized(await self.embedding_service.embed(texts)) @ examples.T
+        best = scores.argmax(axis=1)
+        results = []
+        for row, column in enumerate(best):
+            similarity = float(scores[row, column])
+            if similarity < self.min_similarity:
+                results.append(IntentResult(intent=DEFAULT_INTENT, confidence=similarity))
+            else:
+                results.append(IntentResult(intent=self._labels[column], confidence=similarity))
+        return results
+
+    async def classify(self, text: str) -> IntentResult:
+        return self.match(text) or await self.batcher.submit(text)
+
+    async def classify_many(self, texts: Sequence[str]) -> List[IntentResult]:
+        results: List[Optional[IntentResult]] = [self.match(text) for text in texts]
+        unmatched = [i for i, result in enumerate(results) if result is None]
+        if unmatched:
+            for i, result in zip(unmatched, await self._classify_batch([texts[i] for i in unmatched])):
+                results[i] = result
+        return results
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+_intent_classifier: Optional[IntentClassifier] = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """Return the process-wide intent classifier selected by INTENT_BACKEND"""
+    global _intent_classifier
+    if _intent_classifier is None:
+        if settings.INTENT_BACKEND == "embedding":
+            _intent_classifier = EmbeddingIntentClassifier()
+        else:
+            _intent_classifier = IntentClassifier()
+    return _intent_classifier
@@ -0,0 +1,458 @@
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+import asyncio
+import json
+import time
+import httpx
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import LLM_FIRST_TOKEN
+
+logger = get_logger(__name__)
+
+ChatMessages = List[Dict[str, str]]
+
+
+class LLMError(Exception):
+    """Raised when no provider could produce a completion"""
+    pass
+
+
+class ProviderError(LLMError):
+    """Raised when a single provider request fails"""
+
+    def __init__(self, provider: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Client-side view of a provider's tokens-per-minute limit
+
+    Refills continuously at ``tokens_per_minute``. Providers report their
+    remaining budget in response headers; ``observe`` adopts those figures
+    so other workers' traffic is accounted for too.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: int) -> float:
+        """Seconds until ``cost`` tokens are available, 0 when they are now"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        missing = min(cost, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    async def acquire(self, cost: int) -> None:
+        if self.rate <= 0:
+            return
+        delay = self.wait_time(cost)
+        if delay > 0:
+            await asyncio.sleep(delay)
+            self._refill()
+        self.tokens -= min(cost, self.capacity)
+
+    def observe(self, remaining: Optional[float]) -> None:
+        if remaining is None or self.rate <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class LatencyWindow:
+    """Recent time-to-first-token samples for one provider"""
+
+    def __init__(self, size: int = 256):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class ProviderStats:
+    """Counters for one provider"""
+    requests: int = 0
+    failures: int = 0
+    hedges_won: int = 0
+    cancelled: int = 0
+    in_flight: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class Provider:
+    """One chat completion API reached through the shared HTTP client
+
+    Subclasses describe the request and how to read a streamed delta from
+    one server-sent event; connection reuse, concurrency and rate limits
+    are handled here.
+    """
+
+    name = "provider"
+    remaining_tokens_header: Optional[str] = None
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        base_url: str,
+        model: str,
+        max_concurrency: Optional[int] = None,
+        tokens_per_minute: int = 0,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.semaphore = asyncio.Semaphore(max_concurrency or settings.LLM_MAX_CONCURRENCY)
+        self.bucket = TokenBucket(tokens_per_minute)
+        self.ttft = LatencyWindow()
+        self.stats = ProviderStats()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def request(self, messages: ChatMessages, max_tokens: int) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Path, headers and JSON body of a streaming completion request"""
+        raise NotImplementedError
+
+    def delta(self, event: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+        """Text carried by one server-sent event, if any"""
+        raise NotImplementedError
+
+    def hedge_delay(self) -> float:
+        """How long to wait for this provider's first token before hedging"""
+        if len(self.ttft) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return settings.LLM_HEDGE_DELAY_MS / 1000
+        observed = self.ttft.quantile(settings.LLM_HEDGE_QUANTILE)
+        return max(settings.LLM_HEDGE_MIN_DELAY_MS / 1000, observed)
+
+    async def stream(self, client: httpx.AsyncClient, messages: ChatMessages, max_tokens: int) -> AsyncIterator[str]:
+        """Yield text deltas of one completion"""
+        path, headers, body = self.request(messages, max_tokens)
+        cost = max_tokens + sum(len(message["content"]) for message in messages) // 4
+        async with self.semaphore:
+            await self.bucket.acquire(cost)
+            self.stats.requests += 1
+            self.stats.in_flight += 1
+            started = time.perf_counter()
+            first = True
+            try:
+                async with client.stream("POST", self.base_url + path, headers=headers, json=body) as response:
+                    if response.status_code >= 400:
+                        detail = (await response.aread())[:200].decode(errors="replace")
+                        raise ProviderError(self.name, f"HTTP {response.status_code}: {detail}", response.status_code)
+                    if self.remaining_tokens_header:
+                        remaining = response.headers.get(self.remaining_tokens_header)
+                        self.bucket.observe(float(remaining) if remaining and remaining.isdigit() else None)
+                    async for event, data in _server_sent_events(response):
+                        text = self.delta(event, data)
+                        if text:
+                            if first:
+                                elapsed = time.perf_counter() - started
+                                self.ttft.record(elapsed)
+                                LLM_FIRST_TOKEN.labels(self.name).observe(elapsed)
+                                first = False
+                            yield text
+            except httpx.HTTPError as e:
+                raise ProviderError(self.name, f"{type(e).__name__}: {e}")
+            finally:
+                self.stats.in_flight -= 1
+
+
+class OpenAIProvider(Provider):
+    """OpenAI chat completions"""
+
+    name = "openai"
+    remaining_tokens_header = "x-ratelimit-remaining-tokens"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("api_key", settings.OPENAI_API_KEY)
+        kwargs.setdefault("base_url", settings.OPENAI_BASE_URL)
+        kwargs.setdefault("model", settings.OPENAI_CHAT_MODEL)
+        kwargs.setdefault("tokens_per_minute", settings.OPENAI_TOKENS_PER_MINUTE)
+        super().__init__(**kwargs)
+
+    def request(self, messages: ChatMessages, max_tokens: int) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        body = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "stream": True}
+        return "/v1/chat/completions", headers, body
+
+    def delta(self, event: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+        choices = data.get("choices") or []
+        if not choices:
+            return None
+        return (choices[0].get("delta") or {}).get("content")
+
+
+class AnthropicProvider(Provider):
+    """Anthropic messages API"""
+
+    name = "anthropic"
+    remaining_tokens_header = "anthropic-ratelimit-tokens-remaining"
+    API_VERSION = "2023-06-01"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("api_key", settings.ANTHROPIC_API_KEY)
+        kwargs.setdefault("base_url", settings.ANTHROPIC_BASE_URL)
+        kwargs.setdefault("model", settings.ANTHROPIC_CHAT_MODEL)
+        kwargs.setdefault("tokens_per_minute", settings.ANTHROPIC_TOKENS_PER_MINUTE)
+        super().__init__(**kwargs)
+
+    def request(self, messages: ChatMessages, max_tokens: int) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        headers = {"x-api-key": self.api_key or "", "anthropic-version": self.API_VERSION}
+        system = "\n\n".join(message["content"] for message in messages if message["role"] == "system")
+        body: Dict[str, Any] = {
+            "model": self.model,
+            "messages": [message for message in messages if message["role"] != "system"],
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        if system:
+            body["system"] = system
+        return "/v1/messages", headers, body
+
+    def delta(self, event: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+        if data.get("type") == "error":
+            raise ProviderError(self.name, (data.get("error") or {}).get("message", "stream error"))
+        if data.get("type") != "content_block_delta":
+            return None
+        return (data.get("delta") or {}).get("text")
+
+
+async def _server_sent_events(response: httpx.Response) -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """Decoded (event, data) pairs of a text/event-stream response"""
+    event: Optional[str] = None
+    data: List[str] = []
+    async for line in response.aiter_lines():
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+        elif not line and data:
+            payload = "\n".join(data)
+            if payload == "[DONE]":
+                return
+            yield event, json.loads(payload)
+            event, data = None, []
+
+
+@dataclass
+class PoolStats:
+    """Counters for the provider pool"""
+    completions: int = 0
+    hedged: int = 0
+    failovers: int = 0
+    failed: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class _Attempt:
+    """A provider request racing for the first token"""
+
+    __slots__ = ("provider", "stream", "first")
+
+    def __init__(self, provider: Provider, stream: AsyncIterator[str]):
+        self.provider = provider
+        self.stream = stream
+        self.first = asyncio.ensure_future(stream.__anext__())
+
+
+class LLMPool:
+    """Chat completions across providers over one pooled HTTP/2 client
+
+    Providers are tried in preference order, skipping ahead past any
+    whose token bucket cannot admit the request right now. If the first
+    token has not arrived within the provider's observed p95 time to
+    first token, the next provider is started as a hedge and whichever
+    streams first wins; the loser is cancelled. A provider that fails
+    before its first token fails over to the next one immediately. Once
+    tokens have been streamed the winner is committed to.
+    """
+
+    def __init__(
+        self,
+        providers: Optional[List[Provider]] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        hedging: Optional[bool] = None,
+    ):
+        if providers is None:
+            providers = [provider for provider in _default_providers() if provider.configured]
+        self.providers = providers
+        self.client = client or _create_client()
+        self.hedging = settings.LLM_HEDGE_ENABLED if hedging is None else hedging
+        self.stats = PoolStats()
+
+    @property
+    def available(self) -> bool:
+        return bool(self.providers)
+
+    def _candidates(self, cost: int) -> List[Provider]:
+        ready = [provider for provider in self.providers if provider.bucket.wait_time(cost) == 0]
+        return ready + [provider for provider in self.providers if provider not in ready]
+
+    async def stream(self, messages: ChatMessages, max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """Yield text deltas from the first provider to start streaming"""
+        if not self.providers:
+            raise LLMError("No LLM provider is configured")
+        max_tokens = max_tokens or settings.LLM_MAX_TOKENS
+        candidates = self._candidates(max_tokens)
+        attempts: List[_Attempt] = []
+        errors: List[str] = []
+        winner: Optional[_Attempt] = None
+        first: Optional[str] = None
+
+        def launch() -> None:
+            provider = candidates[len(attempts)]
+            attempts.append(_Attempt(provider, provider.stream(self.client, messages, max_tokens)))
+
+        try:
+            launch()
+            while winner is None:
+                racing = [attempt for attempt in attempts if attempt.first is not None]
+                can_hedge = self.hedging and len(attempts) < len(candidates)
+                timeout = attempts[-1].provider.hedge_delay() if can_hedge else None
+                done, _ = await asyncio.wait(
+                    [attempt.first for attempt in racing], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.stats.hedged += 1
+                    logger.debug("Hedging LLM request", waiting_on=attempts[-1].provider.name, after=timeout)
+                    launch()
+                    continue
+                for attempt in racing:
+                    if attempt.first not in done:
+                        continue
+                    future, attempt.first = attempt.first, None
+                    try:
+                        first = future.result()
+                    except StopAsyncIteration:
+                        first = ""
+                    except Exception as e:
+                        attempt.provider.stats.failures += 1
+                        errors.append(str(e))
+                        logger.warning("LLM provider failed", provider=attempt.provider.name, error=str(e))
+                        continue
+                    winner = attempt
+                    break
+                if winner is None and not any(attempt.first is not None for attempt in attempts):
+                    if len(attempts) == len(candidates):
+                        self.stats.failed += 1
+                        raise LLMError("All LLM providers failed: " + "; ".join(errors))
+                    self.stats.failovers += 1
+                    launch()
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    await _abandon(attempt)
+
+        if winner is not attempts[0]:
+            winner.provider.stats.hedges_won += 1
+        self.stats.completions += 1
+        try:
+            if first:
+                yield first
+            async for text in winner.stream:
+                yield text
+        finally:
+            await winner.stream.aclose()
+
+    async def complete(self, messages: ChatMessages, max_tokens: Optional[int] = None) -> str:
+        """Whole completion text"""
+        return "".join([text async for text in self.stream(messages, max_tokens)])
+
+    def stats_dict(self) -> Dict[str, Any]:
+        return {
+            **self.stats.to_dict(),
+            "providers": {
+                provider.name: {
+                    **provider.stats.to_dict(),
+                    "ttft_p95_ms": round((provider.ttft.quantile(0.95) or 0.0) * 1000, 1),
+                    "hedge_delay_ms": round(provider.hedge_delay() * 1000, 1),
+                }
+                for provider in self.providers
+            },
+        }
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def _abandon(attempt: _Attempt) -> None:
+    """Cancel a losing attempt and release its connection"""
+    if attempt.first is not None:
+        attempt.first.cancel()
+        await asyncio.gather(attempt.first, return_exceptions=True)
+        attempt.provider.stats.cancelled += 1
+    try:
+        await attempt.stream.aclose()
+    except Exception:
+        pass
+
+
+def _default_providers() -> List[Provider]:
+    providers: Dict[str, Provider] = {"openai": OpenAIProvider(), "anthropic": AnthropicProvider()}
+    primary = providers.pop(settings.LLM_PRIMARY_PROVIDER, None)
+    return ([primary] if primary is not None else []) + list(providers.values())
+
+
+def _create_client() -> httpx.AsyncClient:
+    http2 = settings.LLM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("h2 is not installed, LLM client falling back to HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=5.0),
+    )
+
+
+_llm_pool: Optional[LLMPool] = None
+
+
+def get_llm_pool() -> LLMPool:
+    """Return the process-wide LLM provider pool"""
+    global _llm_pool
+    if _llm_pool is None:
+        _llm_pool = LLMPool()
+        logger.info("LLM pool initialized", providers=[provider.name for provider in _llm_pool.providers])
+    return _llm_pool
+
+
+async def close_llm_pool() -> None:
+    global _llm_pool
+    if _llm_pool is not None:
+        await _llm_pool.close()
+    _llm_pool = None
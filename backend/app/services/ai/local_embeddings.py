@@ -0,0 +1,213 @@
+"""Offline sentence-transformers embeddings on a CPU process pool
+
+Workers are spawned, never forked: forking the server would copy its
+event loop, connection pools and torch's thread state into children
+that cannot safely use them. Each worker loads (and optionally
+int8-quantizes) its own copy of the model and runs inference on its own
+core; a batch is split across workers. The server process never loads
+the model, and learns its dimension from a worker.
+
+Report throughput from the backend directory:
+
+    python -m app.services.ai.local_embeddings [--sentences 2000] [--workers 4] [--quantize]
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# The loaded model and its (name, quantized) key, in each worker process
+_model = None
+_model_key = None
+
+
+class LocalEmbeddingError(Exception):
+    """Raised when the local model cannot be loaded or run"""
+    pass
+
+
+def _load_model(name: str, quantize: bool):
+    if settings.EMBEDDING_LOCAL_OFFLINE:
+        # Never reach for the Hugging Face hub; the model must be in the local cache or a path
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise LocalEmbeddingError("sentence-transformers is not installed") from e
+    model = SentenceTransformer(name, device="cpu", cache_folder=settings.EMBEDDING_LOCAL_CACHE_DIR)
+    model.eval()
+    if quantize:
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _ensure_model(name: str, quantize: bool):
+    global _model, _model_key
+    if _model is None or _model_key != (name, quantize):
+        _model = _load_model(name, quantize)
+        _model_key = (name, quantize)
+    return _model
+
+
+def _init_worker(name: str, quantize: bool, threads: int) -> None:
+    import torch
+    torch.set_num_threads(threads)
+    _ensure_model(name, quantize)
+
+
+def _dimension() -> int:
+    return _model.get_sentence_embedding_dimension()
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    import torch
+    with torch.inference_mode():
+        vectors = _model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+class LocalEmbeddingEngine:
+    """sentence-transformers inference spread over a pool of CPU workers"""
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        workers: Optional[int] = None,
+        quantize: Optional[bool] = None,
+        threads_per_worker: Optional[int] = None,
+    ):
+        self.model = model or settings.EMBEDDING_LOCAL_MODEL
+        self.workers = workers or settings.EMBEDDING_LOCAL_WORKERS or os.cpu_count() or 1
+        self.quantize = settings.EMBEDDING_LOCAL_QUANTIZE if quantize is None else quantize
+        self.threads_per_worker = threads_per_worker or settings.EMBEDDING_LOCAL_THREADS_PER_WORKER
+        self.min_slice = settings.EMBEDDING_LOCAL_MIN_SLICE
+        self.dimension: Optional[int] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+
+    def start(self) -> "LocalEmbeddingEngine":
+        """Spawn the worker pool and read the model's dimension from it; blocking, idempotent"""
+        if self._pool is not None:
+            return self
+        started = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.model, self.quantize, self.threads_per_worker),
+        )
+        try:
+            self.dimension = pool.submit(_dimension).result()
+        except Exception as e:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise LocalEmbeddingError(f"Could not load {self.model}: {e}") from e
+        self._pool = pool
+        logger.info(
+            "Local embedding engine started",
+            model=self.model,
+            dimension=self.dimension,
+            workers=self.workers,
+            quantized=self.quantize,
+            start_method=context.get_start_method(),
+            seconds=round(time.perf_counter() - started, 2),
+        )
+        return self
+
+    def _slices(self, texts: List[str]) -> List[List[str]]:
+        count = max(1, min(self.workers, len(texts) // self.min_slice))
+        size = -(-len(texts) // count)
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    async def ensure_started(self) -> int:
+        """Start the pool off the event loop if needed; returns the model's dimension"""
+        if self._pool is None:
+            self._start_lock = self._start_lock or asyncio.Lock()
+            async with self._start_lock:
+                if self._pool is None:
+                    await asyncio.get_running_loop().run_in_executor(None, self.start)
+        return self.dimension
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a float32 matrix, splitting large batches across workers"""
+        await self.ensure_started()
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        loop = asyncio.get_running_loop()
+        parts = await asyncio.gather(*(loop.run_in_executor(self._pool, _encode, part) for part in self._slices(texts)))
+        return parts[0] if len(parts) == 1 else np.vstack(parts)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_engine: Optional[LocalEmbeddingEngine] = None
+
+
+def get_local_engine() -> LocalEmbeddingEngine:
+    """Return the process-wide local embedding engine (started on first use)"""
+    global _engine
+    if _engine is None:
+        _engine = LocalEmbeddingEngine()
+    return _engine
+
+
+def shutdown_local_engine() -> None:
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+    _engine = None
+
+
+_SAMPLE = [
+    "How do I dispute a transaction on my credit card statement?",
+    "What is the daily limit for international wire transfers?",
+    "My card was declined at a store even though I have funds available.",
+    "Can I change the due date of my monthly loan payment?",
+]
+
+
+async def _bench(engine: LocalEmbeddingEngine, sentences: int, batch: int) -> None:
+    texts = [f"{_SAMPLE[i % len(_SAMPLE)]} (ref {i})" for i in range(sentences)]
+    await engine.encode(texts[:batch])  # warm up every worker
+    started = time.perf_counter()
+    for i in range(0, len(texts), batch):
+        await engine.encode(texts[i:i + batch])
+    seconds = time.perf_counter() - started
+    rate = sentences / seconds
+    print(
+        f"{engine.model} dim={engine.dimension} quantized={engine.quantize} workers={engine.workers}: "
+        f"{rate:.1f} sentences/s, {rate / engine.workers:.1f} sentences/s per core"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local embedding throughput")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--quantize", action="store_true", default=None)
+    args = parser.parse_args()
+
+    engine = LocalEmbeddingEngine(model=args.model, workers=args.workers, quantize=args.quantize).start()
+    try:
+        asyncio.run(_bench(engine, args.sentences, args.batch))
+    finally:
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Local stand-in for the OpenAI and Anthropic streaming APIs
+
+Serves ``/v1/chat/completions`` and ``/v1/messages`` with configurable
+time to first token, tail latency and failure rate, so the provider pool
+can be exercised without network access or API keys. Point
+OPENAI_BASE_URL / ANTHROPIC_BASE_URL at it, or run it from the backend
+directory:
+
+    python -m app.services.ai.mock_provider [--port 8099] [--ttft-ms 120] [--tail-rate 0.05]
+
+``--bench`` starts two instances in process and compares reply latency
+with and without hedging.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import random
+import time
+
+_WORDS = "Your statement balance is due on the fifteenth of each month and can be paid online".split()
+
+
+@dataclass
+class MockBehaviour:
+    """How the mock server responds"""
+    ttft_ms: float = 120.0
+    tail_rate: float = 0.05  # share of requests whose first token is slow
+    tail_ms: float = 2500.0
+    error_rate: float = 0.0  # share of requests answered with HTTP 529
+    token_ms: float = 5.0
+    tokens: int = 16
+
+
+class MockProviderServer:
+    """Minimal HTTP/1.1 server streaming completions as server-sent events"""
+
+    def __init__(self, behaviour: Optional[MockBehaviour] = None, host: str = "127.0.0.1", port: int = 0, seed: Optional[int] = None):
+        self.behaviour = behaviour or MockBehaviour()
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "MockProviderServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                path, body = request
+                self.requests += 1
+                await self._respond(writer, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Clients abandoning a hedged request, or the server shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, path: str, body: Dict) -> None:
+        behaviour = self.behaviour
+        if path not in ("/v1/chat/completions", "/v1/messages"):
+            _write_head(writer, 404, "application/json", b'{"error": "not found"}')
+            await writer.drain()
+            return
+        if self._random.random() < behaviour.error_rate:
+            _write_head(writer, 529, "application/json", b'{"error": {"message": "overloaded"}}')
+            await writer.drain()
+            return
+
+        slow = self._random.random() < behaviour.tail_rate
+        await asyncio.sleep((behaviour.tail_ms if slow else behaviour.ttft_ms) / 1000)
+        _write_head(writer, 200, "text/event-stream")
+        anthropic = path == "/v1/messages"
+        for i in range(min(behaviour.tokens, body.get("max_tokens", behaviour.tokens))):
+            text = _WORDS[i % len(_WORDS)] + " "
+            if anthropic:
+                event = b"event: content_block_delta\ndata: " + json.dumps(
+                    {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+                ).encode() + b"\n\n"
+            else:
+                event = b"data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": text}}]}).encode() + b"\n\n"
+            _write_chunk(writer, event)
+            await writer.drain()
+            if behaviour.token_ms:
+                await asyncio.sleep(behaviour.token_ms / 1000)
+        _write_chunk(writer, b"event: message_stop\ndata: {\"type\": \"message_stop\"}\n\n" if anthropic else b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, Dict]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    _, path, _ = line.decode().split(" ", 2)
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode().partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    payload = await reader.readexactly(length) if length else b""
+    return path, json.loads(payload) if payload else {}
+
+
+_REASONS = {200: "OK", 404: "Not Found", 529: "Overloaded"}
+
+
+def _write_head(writer: asyncio.StreamWriter, status: int, content_type: str, body: Optional[bytes] = None) -> None:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}", f"Content-Type: {content_type}", "Connection: keep-alive"]
+    if body is None:
+        lines.append("Transfer-Encoding: chunked")
+    else:
+        lines.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + (body or b""))
+
+
+def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+async def _bench(requests: int, concurrency: int, behaviour: MockBehaviour) -> None:
+    from app.services.ai.llm import AnthropicProvider, LLMPool, OpenAIProvider
+
+    primary = await MockProviderServer(behaviour, seed=1).start()
+    secondary = await MockProviderServer(behaviour, seed=2).start()
+    messages = [{"role": "user", "content": "When is my statement balance due?"}]
+    try:
+        for hedging in (False, True):
+            pool = LLMPool(
+                providers=[
+                    OpenAIProvider(api_key="mock", base_url=primary.url),
+                    AnthropicProvider(api_key="mock", base_url=secondary.url),
+                ],
+                hedging=hedging,
+            )
+            limit = asyncio.Semaphore(concurrency)
+            latencies: List[float] = []
+
+            async def one() -> None:
+                async with limit:
+                    started = time.perf_counter()
+                    async for _ in pool.stream(messages, max_tokens=1):
+                        latencies.append(time.perf_counter() - started)
+                        break
+
+            await asyncio.gather(*(one() for _ in range(requests)))
+            await pool.close()
+            latencies.sort()
+            pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+            print(
+                f"hedging={'on ' if hedging else 'off'}  first token p50 {pick(0.50):7.1f} ms  "
+                f"p95 {pick(0.95):7.1f} ms  p99 {pick(0.99):7.1f} ms  hedged {pool.stats.hedged}"
+            )
+    finally:
+        await primary.stop()
+        await secondary.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--ttft-ms", type=float, default=120.0)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--tail-ms", type=float, default=2500.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--bench", action="store_true", help="compare hedged and unhedged latency in process")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    behaviour = MockBehaviour(
+        ttft_ms=args.ttft_ms, tail_rate=args.tail_rate, tail_ms=args.tail_ms, error_rate=args.error_rate
+    )
+    if args.bench:
+        asyncio.run(_bench(args.requests, args.concurrency, behaviour))
+        return
+
+    async def serve() -> None:
+        server = await MockProviderServer(behaviour, args.host, args.port).start()
+        print(f"Mock provider listening on {server.url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
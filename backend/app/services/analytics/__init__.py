@@ -0,0 +1,27 @@
+# Analytics and reporting services
+
+from .sketch import DDSketch, SketchError
+from .events import EventWriter, WriterStats, get_event_writer, close_event_writer
+from .rollup import (
+    Aggregate,
+    AnalyticsRollupService,
+    RefreshReport,
+    dashboard_kpis,
+    ensure_analytics_columns,
+    get_rollup_service,
+)
+
+__all__ = [
+    "DDSketch",
+    "SketchError",
+    "EventWriter",
+    "WriterStats",
+    "get_event_writer",
+    "close_event_writer",
+    "Aggregate",
+    "AnalyticsRollupService",
+    "RefreshReport",
+    "dashboard_kpis",
+    "ensure_analytics_columns",
+    "get_rollup_service",
+]
@@ -0,0 +1,383 @@
+"""Write-behind buffer for analytics and audit events
+
+Request handlers enqueue rows and return; a background flusher writes
+them in batches with COPY (or a multi-row INSERT for small batches).
+Analytics rows may be dropped under sustained overload and are counted
+when they are. Audit rows are a regulatory record and never are:
+each is chained into the audit segment store as it leaves the buffer,
+producers wait for buffer space instead of dropping, and batches the
+database cannot take are spilled to fsynced files and replayed once it
+recovers.
+"""
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import os
+import time
+import uuid
+from sqlalchemy import Table
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from app.core.config import settings
+from app.core.database import engine
+from app.core.logging import get_logger
+from app.models.analytics import Analytics
+from app.models.audit import Audit
+from app.services.compliance.audit_store import AuditStore, get_audit_store
+
+logger = get_logger(__name__)
+
+_TRANSIENT_ERRORS = (OSError, ConnectionError, asyncio.TimeoutError, OperationalError, InterfaceError)
+
+
+def _is_transient(error: BaseException) -> bool:
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, _TRANSIENT_ERRORS)
+
+
+@dataclass
+class WriterStats:
+    """Counters for one event table"""
+    queued: int = 0
+    written: int = 0
+    batches: int = 0
+    spilled: int = 0
+    replayed: int = 0
+    dropped: int = 0
+    rejected: int = 0
+    waits: int = 0  # producers that blocked for buffer space
+
+
+@dataclass
+class _Buffer:
+    table: Table
+    durable: bool  # audit rows: never dropped
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    stats: WriterStats = field(default_factory=WriterStats)
+
+    @property
+    def name(self) -> str:
+        return self.table.name
+
+
+class EventWriter:
+    """Batches analytics and audit rows and writes them off the request path"""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        interval: Optional[float] = None,
+        max_rows: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+        archive: Optional[AuditStore] = None,
+    ):
+        self.batch_size = batch_size or settings.EVENT_FLUSH_BATCH_SIZE
+        self.interval = interval or settings.EVENT_FLUSH_INTERVAL_MS / 1000
+        self.max_rows = max_rows or settings.EVENT_BUFFER_MAX_ROWS
+        self.spill_dir = spill_dir or settings.EVENT_SPILL_DIR
+        self.timeout = settings.EVENT_FLUSH_TIMEOUT_SECONDS
+        self.copy_threshold = settings.EVENT_COPY_THRESHOLD
+        self.archive = archive if archive is not None else get_audit_store()
+        self.analytics = _Buffer(Analytics.__table__, durable=False)
+        self.audits = _Buffer(Audit.__table__, durable=True)
+        self._buffers = (self.audits, self.analytics)
+        self._wake = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._flush_seconds: List[float] = []
+
+    # Producers
+
+    def record(
+        self,
+        tenant_id: str,
+        metric_name: str,
+        value: float,
+        metric_type: str = "counter",
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        timestamp: Optional[datetime] = None,
+    ) -> None:
+        """Queue an analytics row; never blocks, drops and counts the row if the buffer is full"""
+        if len(self.analytics.rows) >= self.max_rows:
+            self.analytics.stats.dropped += 1
+            if self.analytics.stats.dropped % 1000 == 1:
+                logger.warning("Analytics buffer full, dropping events", dropped=self.analytics.stats.dropped)
+            return
+        self._append(self.analytics, {
+            "id": uuid.uuid4().hex,
+            "metric_name": metric_name,
+            "metric_value": float(value),
+            "metric_type": metric_type,
+            "session_id": session_id,
+            "user_id": user_id,
+            "tenant_id": tenant_id,
+            "metadata": json.dumps(metadata) if metadata else None,
+            "timestamp": timestamp or datetime.now(timezone.utc),
+        })
+
+    async def audit(
+        self,
+        event_type: str,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+    ) -> str:
+        """Queue an audit row and return its id; waits for space rather than dropping"""
+        if not settings.AUDIT_LOG_ENABLED:
+            return ""
+        while len(self.audits.rows) >= self.max_rows:
+            self.audits.stats.waits += 1
+            self._space.clear()
+            self._wake.set()
+            await self._space.wait()
+        row = {
+            "id": uuid.uuid4().hex,
+            "event_type": event_type,
+            "tenant_id": tenant_id,
+            "user_id": user_id,
+            "session_id": session_id,
+            "details": json.dumps(details) if details else None,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "created_at": datetime.now(timezone.utc),
+        }
+        self._append(self.audits, row)
+        return row["id"]
+
+    def _append(self, buffer: _Buffer, row: Dict[str, Any]) -> None:
+        buffer.rows.append(row)
+        buffer.stats.queued += 1
+        if self._task is None and not self._closing:
+            self._task = asyncio.create_task(self._run())
+        if len(buffer.rows) >= self.batch_size:
+            self._wake.set()
+
+    # Flusher
+
+    async def _run(self) -> None:
+        await self._replay_spills()
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                if await self.flush():
+                    await self._replay_spills(limit=1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Event flush failed", error=str(e))
+
+    async def flush(self) -> bool:
+        """Write everything buffered; returns False if the database was unreachable"""
+        healthy = True
+        for buffer in self._buffers:
+            # Rows that can be neither written nor spilled go back on the buffer for the next cycle
+            pending, buffer.rows = buffer.rows, []
+            if buffer.durable:
+                self._space.set()
+            for i in range(0, len(pending), self.batch_size):
+                batch = pending[i:i + self.batch_size]
+                try:
+                    if buffer.durable and self.archive is not None and not await self._archive(batch):
+                        buffer.rows[:0] = pending[i:]
+                        break
+                    if not healthy:
+                        # Don't wait out another timeout per batch while the database is down
+                        await self._spill(buffer, batch)
+                    elif not await self._write(buffer, batch):
+                        healthy = False
+                except asyncio.CancelledError:
+                    buffer.rows[:0] = pending[i:]
+                    raise
+        return healthy
+
+    async def _archive(self, batch: List[Dict[str, Any]]) -> bool:
+        """Chain audit rows into the segment store before they are offered to the database"""
+        try:
+            await asyncio.to_thread(self.archive.append, batch)
+        except OSError as e:
+            logger.error("Could not append to the audit store", rows=len(batch), error=str(e))
+            return False
+        return True
+
+    async def _write(self, buffer: _Buffer, batch: List[Dict[str, Any]]) -> bool:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._insert(buffer.table, batch), self.timeout)
+        except Exception as e:
+            if _is_transient(e):
+                logger.warning("Database unavailable for events, spilling batch", table=buffer.name, rows=len(batch), error=str(e))
+                await self._spill(buffer, batch)
+                return False
+            await self._write_rows(buffer, batch, e)
+            return True
+        buffer.stats.written += len(batch)
+        buffer.stats.batches += 1
+        self._flush_seconds = (self._flush_seconds + [time.perf_counter() - started])[-256:]
+        return True
+
+    async def _insert(self, table: Table, rows: List[Dict[str, Any]], use_copy: Optional[bool] = None) -> None:
+        columns = list(rows[0])
+        use_copy = len(rows) >= self.copy_threshold if use_copy is None else use_copy
+        async with engine.connect() as conn:
+            if use_copy:
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(
+                    table.name, records=[tuple(row[column] for column in columns) for row in rows], columns=columns
+                )
+            else:
+                # Rows already written by a timed-out attempt or earlier replay are skipped
+                await conn.execute(insert(table).on_conflict_do_nothing(index_elements=["id"]), rows)
+                await conn.commit()
+
+    async def _write_rows(self, buffer: _Buffer, batch: List[Dict[str, Any]], error: Exception) -> None:
+        """Isolate rows the database rejects (bad foreign keys, oversize values) from the rest of a batch"""
+        logger.warning("Event batch rejected, retrying row by row", table=buffer.name, rows=len(batch), error=str(error))
+        rejected: List[Dict[str, Any]] = []
+        for i, row in enumerate(batch):
+            try:
+                await asyncio.wait_for(self._insert(buffer.table, [row], use_copy=False), self.timeout)
+                buffer.stats.written += 1
+            except Exception as e:
+                if _is_transient(e):
+                    await self._spill(buffer, batch[i:])
+                    break
+                rejected.append(row)
+        if not rejected:
+            return
+        buffer.stats.rejected += len(rejected)
+        if buffer.durable:
+            # Kept on disk for an operator to repair and replay
+            await asyncio.to_thread(self._write_file, buffer, rejected, ".rejected")
+        logger.error("Events rejected by the database", table=buffer.name, rows=len(rejected), kept=buffer.durable)
+
+    # Spill files
+
+    def _write_file(self, buffer: _Buffer, rows: List[Dict[str, Any]], suffix: str = ".jsonl") -> str:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{buffer.name}-{time.time_ns()}{suffix}")
+        with open(path + ".tmp", "w") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=lambda value: value.isoformat()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return path
+
+    async def _spill(self, buffer: _Buffer, batch: List[Dict[str, Any]]) -> None:
+        try:
+            await asyncio.to_thread(self._write_file, buffer, batch)
+            buffer.stats.spilled += len(batch)
+        except OSError as e:
+            if buffer.durable or len(buffer.rows) + len(batch) <= self.max_rows:
+                # Hold the batch in memory; audit producers block until it drains
+                buffer.rows[:0] = batch
+            else:
+                buffer.stats.dropped += len(batch)
+            logger.error("Could not spill events to disk", table=buffer.name, rows=len(batch), error=str(e))
+
+    def _spill_files(self, buffer: _Buffer) -> List[str]:
+        if not os.path.isdir(self.spill_dir):
+            return []
+        prefix = f"{buffer.name}-"
+        return sorted(
+            os.path.join(self.spill_dir, name) for name in os.listdir(self.spill_dir)
+            if name.startswith(prefix) and name.endswith(".jsonl")
+        )
+
+    @staticmethod
+    def _read_file(path: str, buffer: _Buffer) -> List[Dict[str, Any]]:
+        timestamp = "created_at" if buffer.durable else "timestamp"
+        rows = []
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    row[timestamp] = datetime.fromisoformat(row[timestamp])
+                    rows.append(row)
+        return rows
+
+    async def _replay_spills(self, limit: Optional[int] = None) -> None:
+        """Load spilled batches back into the database, oldest first"""
+        for buffer in self._buffers:
+            for path in self._spill_files(buffer)[:limit]:
+                rows = await asyncio.to_thread(self._read_file, path, buffer)
+                try:
+                    for i in range(0, len(rows), self.batch_size):
+                        await asyncio.wait_for(self._insert(buffer.table, rows[i:i + self.batch_size], use_copy=False), self.timeout)
+                except Exception as e:
+                    if _is_transient(e):
+                        return
+                    os.replace(path, path[:-len(".jsonl")] + ".rejected")
+                    buffer.stats.rejected += len(rows)
+                    logger.error("Spilled events rejected on replay", path=path, rows=len(rows), error=str(e))
+                    continue
+                os.remove(path)
+                buffer.stats.replayed += len(rows)
+                logger.info("Replayed spilled events", table=buffer.name, rows=len(rows))
+
+    # Lifecycle
+
+    def stats(self) -> Dict[str, Any]:
+        seconds = sorted(self._flush_seconds)
+        return {
+            "analytics": {**asdict(self.analytics.stats), "buffered": len(self.analytics.rows)},
+            "audits": {**asdict(self.audits.stats), "buffered": len(self.audits.rows)},
+            "flush_p50_ms": round(seconds[len(seconds) // 2] * 1000, 2) if seconds else None,
+            "spill_files": sum(len(self._spill_files(buffer)) for buffer in self._buffers),
+        }
+
+    async def _drain(self) -> None:
+        if await self.flush():
+            await self._replay_spills()
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """Stop the flusher and write (or spill) everything still buffered"""
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self._drain(), timeout or settings.EVENT_SHUTDOWN_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        for buffer in self._buffers:
+            if buffer.rows:
+                rows, buffer.rows = buffer.rows, []
+                await self._spill(buffer, rows)
+                logger.warning("Events spilled at shutdown", table=buffer.name, rows=len(rows))
+        self._space.set()
+
+
+_writer: Optional[EventWriter] = None
+
+
+def get_event_writer() -> EventWriter:
+    """Return the process-wide event writer"""
+    global _writer
+    if _writer is None:
+        _writer = EventWriter()
+    return _writer
+
+
+async def close_event_writer() -> None:
+    global _writer
+    if _writer is not None:
+        await _writer.close()
+    _writer = None
@@ -0,0 +1,467 @@
+"""Time-bucketed rollups of analytics events
+
+Raw ``analytics`` rows are folded into minute, hour and day buckets per
+tenant and metric. Refresh and backfill from the backend directory:
+
+    python -m app.services.analytics.rollup refresh
+    python -m app.services.analytics.rollup backfill --since 2024-01-01
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import time
+from sqlalchemy import and_, delete, func, insert, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.logging import get_logger, setup_logging
+from app.models.analytics import Analytics, AnalyticsRollup, RollupWatermark
+from app.services.analytics.sketch import DDSketch
+
+logger = get_logger(__name__)
+
+GRANULARITIES = ("minute", "hour", "day")
+_STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# Metric names the dashboard reads; event writers emit these
+SESSIONS_STARTED = "sessions_started"
+SESSIONS_DEFLECTED = "sessions_deflected"  # resolved by the bot without a ticket
+SESSIONS_ESCALATED = "sessions_escalated"  # handed to a human agent
+CSAT_SCORE = "csat_score"  # 1-5
+FIRST_RESPONSE_SECONDS = "first_response_seconds"
+RESPONSE_SECONDS = "response_seconds"  # user message to stored bot reply
+DASHBOARD_METRICS = (
+    SESSIONS_STARTED, SESSIONS_DEFLECTED, SESSIONS_ESCALATED, CSAT_SCORE, FIRST_RESPONSE_SECONDS, RESPONSE_SECONDS
+)
+
+WATERMARK_NAME = "analytics_rollup"
+# pg advisory lock id so only one worker refreshes at a time
+_LOCK_KEY = 0x68656C696F73
+
+# Longest raw range aggregated in one query during backfill
+_MAX_RAW_RANGE = timedelta(days=1)
+
+
+def floor_time(value: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return value.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ceil_time(value: datetime, granularity: str) -> datetime:
+    floored = floor_time(value, granularity)
+    return floored if floored == value else floored + _STEPS[granularity]
+
+
+def cover(start: datetime, end: datetime, levels: Tuple[str, ...] = ("day", "hour", "minute")) -> List[Tuple[str, datetime, datetime]]:
+    """Fewest aligned buckets exactly covering [start, end), both minute-aligned
+
+    A 90-day range resolves to at most 89 days, 46 hours and 118 minutes
+    of buckets regardless of event volume.
+    """
+    if start >= end:
+        return []
+    granularity = levels[0]
+    low, high = ceil_time(start, granularity), floor_time(end, granularity)
+    if low >= high:
+        return cover(start, end, levels[1:]) if len(levels) > 1 else []
+    pieces = cover(start, low, levels[1:]) if start < low else []
+    pieces.append((granularity, low, high))
+    if high < end:
+        pieces.extend(cover(high, end, levels[1:]))
+    return pieces
+
+
+def contiguous(buckets: Iterable[datetime], step: timedelta, limit: Optional[timedelta] = None) -> List[Tuple[datetime, datetime]]:
+    """Merge bucket starts into [start, end) ranges, optionally capped in length"""
+    ranges: List[Tuple[datetime, datetime]] = []
+    for bucket in sorted(set(buckets)):
+        if ranges and ranges[-1][1] == bucket and (limit is None or bucket + step - ranges[-1][0] <= limit):
+            ranges[-1] = (ranges[-1][0], bucket + step)
+        else:
+            ranges.append((bucket, bucket + step))
+    return ranges
+
+
+@dataclass
+class Aggregate:
+    """Mergeable summary of a metric over one or more buckets"""
+    metric_type: str
+    count: int = 0
+    total: float = 0.0
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    sketch: Optional[DDSketch] = None
+
+    def merge(self, other: "Aggregate") -> None:
+        self.count += other.count
+        self.total += other.total
+        if other.min_value is not None:
+            self.min_value = other.min_value if self.min_value is None else min(self.min_value, other.min_value)
+        if other.max_value is not None:
+            self.max_value = other.max_value if self.max_value is None else max(self.max_value, other.max_value)
+        if other.sketch is not None:
+            if self.sketch is None:
+                self.sketch = DDSketch(other.sketch.alpha)
+            self.sketch.merge(other.sketch)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    @classmethod
+    def from_row(cls, row: Any) -> "Aggregate":
+        return cls(
+            metric_type=row.metric_type,
+            count=row.count,
+            total=row.total,
+            min_value=row.min_value,
+            max_value=row.max_value,
+            sketch=DDSketch.from_bytes(row.sketch) if row.sketch else None,
+        )
+
+
+AggregateKey = Tuple[str, str, datetime]  # tenant, metric, bucket start
+
+
+@dataclass
+class RefreshReport:
+    """What one refresh recomputed"""
+    buckets: Dict[str, int] = field(default_factory=dict)
+    pruned: int = 0
+    watermark: Optional[datetime] = None
+    seconds: float = 0.0
+
+
+class AnalyticsRollupService:
+    """Maintains and reads the analytics rollup tables
+
+    Refresh is incremental and idempotent. Every analytics row carries an
+    ``ingested_at`` time; the minutes holding events ingested since the
+    last watermark (less a safety margin for slow transactions) are
+    recomputed from raw rows and replaced, then the hours and days that
+    contain them are rebuilt from the finer buckets. A late event, however
+    old its timestamp, therefore lands in the right buckets, and running
+    a refresh twice changes nothing. Minute buckets are kept for
+    ``ANALYTICS_MINUTE_RETENTION_DAYS``; older hours are rebuilt from raw
+    rows when a late event touches them.
+    """
+
+    def __init__(self, alpha: Optional[float] = None):
+        self.alpha = alpha or settings.ANALYTICS_SKETCH_ACCURACY
+        self.minute_retention = timedelta(days=settings.ANALYTICS_MINUTE_RETENTION_DAYS)
+        self.safety = timedelta(seconds=settings.ANALYTICS_ROLLUP_SAFETY_SECONDS)
+
+    async def refresh(self, since: Optional[datetime] = None) -> Optional[RefreshReport]:
+        """Recompute buckets touched by newly ingested events; None if another worker holds the lock
+
+        ``since`` overrides the watermark, e.g. to rebuild after restoring raw rows.
+        """
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            locked = (await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})).scalar()
+            if not locked:
+                return None
+            # Buckets are UTC regardless of the server's timezone setting
+            await db.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+            now = (await db.execute(select(func.now()))).scalar()
+            if since is None:
+                watermark = await db.get(RollupWatermark, WATERMARK_NAME)
+                since = watermark.watermark - self.safety if watermark is not None else None
+
+            minute_expr = func.date_trunc("minute", Analytics.timestamp)
+            dirty_query = select(minute_expr).distinct()
+            if since is not None:
+                dirty_query = dirty_query.where(Analytics.ingested_at >= since)
+            minutes = [bucket for (bucket,) in await db.execute(dirty_query) if bucket is not None]
+
+            report = RefreshReport(watermark=now)
+            cutoff = floor_time(now - self.minute_retention, "day")
+            if minutes:
+                report.buckets["minute"] = await self._rebuild_minutes(db, minutes)
+                hours = {floor_time(minute, "hour") for minute in minutes}
+                report.buckets["hour"] = await self._rebuild_hours(db, hours, cutoff)
+                days = {floor_time(hour, "day") for hour in hours}
+                report.buckets["day"] = await self._rebuild_from(db, "hour", "day", days)
+
+            pruned = await db.execute(
+                delete(AnalyticsRollup).where(
+                    AnalyticsRollup.granularity == "minute", AnalyticsRollup.bucket_start < cutoff
+                )
+            )
+            report.pruned = pruned.rowcount or 0
+            await self._set_watermark(db, now)
+            await db.commit()
+        report.seconds = time.perf_counter() - started
+        if minutes:
+            logger.info("Analytics rollup refreshed", buckets=report.buckets, pruned=report.pruned, seconds=round(report.seconds, 3))
+        return report
+
+    async def _rebuild_minutes(self, db: AsyncSession, minutes: List[datetime]) -> int:
+        written = 0
+        for low, high in contiguous(minutes, _STEPS["minute"], _MAX_RAW_RANGE):
+            aggregates = await self._from_raw(db, "minute", low, high)
+            written += await self._replace(db, "minute", [(low, high)], aggregates)
+        return written
+
+    async def _rebuild_hours(self, db: AsyncSession, hours: Set[datetime], cutoff: datetime) -> int:
+        recent = {hour for hour in hours if hour >= cutoff}
+        written = await self._rebuild_from(db, "minute", "hour", recent)
+        for low, high in contiguous(hours - recent, _STEPS["hour"], _MAX_RAW_RANGE):
+            # Minute buckets for these hours are gone; rebuild from raw rows
+            written += await self._replace(db, "hour", [(low, high)], await self._from_raw(db, "hour", low, high))
+        return written
+
+    async def _rebuild_from(self, db: AsyncSession, source: str, target: str, buckets: Set[datetime]) -> int:
+        if not buckets:
+            return 0
+        ranges = contiguous(buckets, _STEPS[target])
+        rows = await db.execute(
+            select(
+                AnalyticsRollup.tenant_id, AnalyticsRollup.metric_name, AnalyticsRollup.bucket_start,
+                AnalyticsRollup.metric_type, AnalyticsRollup.count, AnalyticsRollup.total,
+                AnalyticsRollup.min_value, AnalyticsRollup.max_value, AnalyticsRollup.sketch,
+            ).where(
+                AnalyticsRollup.granularity == source,
+                or_(*(and_(AnalyticsRollup.bucket_start >= low, AnalyticsRollup.bucket_start < high) for low, high in ranges)),
+            )
+        )
+        aggregates: Dict[AggregateKey, Aggregate] = {}
+        for row in rows:
+            key = (row.tenant_id, row.metric_name, floor_time(row.bucket_start, target))
+            part = Aggregate.from_row(row)
+            if key in aggregates:
+                aggregates[key].merge(part)
+            else:
+                aggregates[key] = part
+        return await self._replace(db, target, ranges, aggregates)
+
+    async def _from_raw(self, db: AsyncSession, unit: str, low: datetime, high: datetime) -> Dict[AggregateKey, Aggregate]:
+        bucket = func.date_trunc(unit, Analytics.timestamp).label("bucket")
+        in_range = and_(Analytics.timestamp >= low, Analytics.timestamp < high)
+        aggregates: Dict[AggregateKey, Aggregate] = {}
+        rows = await db.execute(
+            select(
+                Analytics.tenant_id, Analytics.metric_name, Analytics.metric_type, bucket,
+                func.count(), func.sum(Analytics.metric_value),
+                func.min(Analytics.metric_value), func.max(Analytics.metric_value),
+            ).where(in_range).group_by(Analytics.tenant_id, Analytics.metric_name, Analytics.metric_type, bucket)
+        )
+        for tenant_id, metric_name, metric_type, start, count, total, low_value, high_value in rows:
+            key = (tenant_id, metric_name, start)
+            aggregate = Aggregate(metric_type, count, total or 0.0, low_value, high_value)
+            if key in aggregates:
+                # The same metric recorded under two types; keep one bucket
+                aggregates[key].merge(aggregate)
+            else:
+                aggregates[key] = aggregate
+
+        values = await db.stream(
+            select(Analytics.tenant_id, Analytics.metric_name, bucket, Analytics.metric_value)
+            .where(in_range, Analytics.metric_type == "histogram")
+            .execution_options(yield_per=5000)
+        )
+        async for tenant_id, metric_name, start, value in values:
+            aggregate = aggregates.get((tenant_id, metric_name, start))
+            if aggregate is None:
+                # Committed between the two reads; the next refresh picks it up
+                continue
+            if aggregate.sketch is None:
+                aggregate.sketch = DDSketch(self.alpha)
+            aggregate.sketch.add(value)
+        return aggregates
+
+    async def _replace(
+        self, db: AsyncSession, granularity: str, ranges: List[Tuple[datetime, datetime]], aggregates: Dict[AggregateKey, Aggregate]
+    ) -> int:
+        """Swap every bucket of ``granularity`` in ``ranges`` for ``aggregates``"""
+        await db.execute(
+            delete(AnalyticsRollup).where(
+                AnalyticsRollup.granularity == granularity,
+                or_(*(and_(AnalyticsRollup.bucket_start >= low, AnalyticsRollup.bucket_start < high) for low, high in ranges)),
+            )
+        )
+        if aggregates:
+            await db.execute(insert(AnalyticsRollup), [
+                {
+                    "tenant_id": tenant_id,
+                    "granularity": granularity,
+                    "metric_name": metric_name,
+                    "bucket_start": start,
+                    "metric_type": aggregate.metric_type,
+                    "count": aggregate.count,
+                    "total": aggregate.total,
+                    "min_value": aggregate.min_value,
+                    "max_value": aggregate.max_value,
+                    "sketch": aggregate.sketch.to_bytes() if aggregate.sketch is not None else None,
+                }
+                for (tenant_id, metric_name, start), aggregate in aggregates.items()
+            ])
+        return len(aggregates)
+
+    @staticmethod
+    async def _set_watermark(db: AsyncSession, value: datetime) -> None:
+        watermark = await db.get(RollupWatermark, WATERMARK_NAME)
+        if watermark is None:
+            db.add(RollupWatermark(name=WATERMARK_NAME, watermark=value))
+        else:
+            watermark.watermark = value
+
+    async def run_forever(self, interval: Optional[float] = None) -> None:
+        """Refresh on a fixed interval until cancelled"""
+        interval = interval or settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Analytics rollup refresh failed", error=str(e))
+            await asyncio.sleep(interval)
+
+    def series_granularity(self, start: datetime, end: datetime) -> str:
+        span = end - start
+        if span <= timedelta(hours=6) and start >= datetime.now(timezone.utc) - self.minute_retention:
+            return "minute"
+        return "hour" if span <= timedelta(days=7) else "day"
+
+    async def read(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        start: datetime,
+        end: datetime,
+        metrics: Iterable[str] = DASHBOARD_METRICS,
+        granularity: Optional[str] = None,
+    ) -> Tuple[Dict[str, Aggregate], Dict[datetime, Dict[str, Aggregate]], str]:
+        """Totals over [start, end) and a per-bucket series, from O(buckets) rows
+
+        Ranges that begin before the minute retention are widened to the
+        hour, since their minute buckets no longer exist.
+        """
+        start = floor_time(start, "minute")
+        end = ceil_time(end, "minute")
+        if start < datetime.now(timezone.utc) - self.minute_retention:
+            start = floor_time(start, "hour")
+        granularity = granularity or self.series_granularity(start, end)
+        metrics = list(metrics)
+        columns = (
+            AnalyticsRollup.granularity, AnalyticsRollup.metric_name, AnalyticsRollup.bucket_start,
+            AnalyticsRollup.metric_type, AnalyticsRollup.count, AnalyticsRollup.total,
+            AnalyticsRollup.min_value, AnalyticsRollup.max_value, AnalyticsRollup.sketch,
+        )
+        pieces = cover(start, end)
+        series_start = floor_time(start, granularity)
+        rows = await db.execute(
+            select(*columns).where(
+                AnalyticsRollup.tenant_id == tenant_id,
+                AnalyticsRollup.metric_name.in_(metrics),
+                or_(
+                    *(
+                        and_(AnalyticsRollup.granularity == piece, AnalyticsRollup.bucket_start >= low, AnalyticsRollup.bucket_start < high)
+                        for piece, low, high in pieces
+                    ),
+                    and_(AnalyticsRollup.granularity == granularity, AnalyticsRollup.bucket_start >= series_start, AnalyticsRollup.bucket_start < end),
+                ),
+            )
+        )
+
+        totals: Dict[str, Aggregate] = {}
+        series: Dict[datetime, Dict[str, Aggregate]] = {}
+        for row in rows:
+            aggregate = Aggregate.from_row(row)
+            if row.granularity == granularity:
+                series.setdefault(row.bucket_start, {})[row.metric_name] = aggregate
+            if any(row.granularity == piece and low <= row.bucket_start < high for piece, low, high in pieces):
+                part = Aggregate.from_row(row) if row.granularity == granularity else aggregate
+                if row.metric_name in totals:
+                    totals[row.metric_name].merge(part)
+                else:
+                    totals[row.metric_name] = part
+        return totals, dict(sorted(series.items())), granularity
+
+    async def watermark(self, db: AsyncSession) -> Optional[datetime]:
+        row = await db.get(RollupWatermark, WATERMARK_NAME)
+        return row.watermark if row is not None else None
+
+
+def dashboard_kpis(aggregates: Dict[str, Aggregate]) -> Dict[str, Optional[float]]:
+    """Headline support metrics from merged aggregates"""
+    def total(name: str) -> float:
+        aggregate = aggregates.get(name)
+        return aggregate.total if aggregate is not None else 0.0
+
+    def quantile(name: str, q: float) -> Optional[float]:
+        aggregate = aggregates.get(name)
+        if aggregate is None or aggregate.sketch is None:
+            return None
+        value = aggregate.sketch.quantile(q)
+        return round(value, 3) if value is not None else None
+
+    started = total(SESSIONS_STARTED)
+    csat = aggregates.get(CSAT_SCORE)
+    return {
+        "sessions": int(started),
+        "deflection_rate": round(total(SESSIONS_DEFLECTED) / started, 4) if started else None,
+        "containment_rate": round(1 - total(SESSIONS_ESCALATED) / started, 4) if started else None,
+        "csat_average": round(csat.mean, 3) if csat is not None and csat.count else None,
+        "csat_satisfied_rate": (
+            round(1 - csat.sketch.rank(3.5), 4) if csat is not None and csat.sketch is not None and csat.count else None
+        ),
+        "csat_responses": csat.count if csat is not None else 0,
+        "first_response_p50_seconds": quantile(FIRST_RESPONSE_SECONDS, 0.50),
+        "first_response_p90_seconds": quantile(FIRST_RESPONSE_SECONDS, 0.90),
+        "response_p90_seconds": quantile(RESPONSE_SECONDS, 0.90),
+    }
+
+
+_ANALYTICS_COLUMNS = {"ingested_at": "TIMESTAMP WITH TIME ZONE DEFAULT now()"}
+
+
+async def ensure_analytics_columns() -> None:
+    """Add rollup columns and indexes to analytics tables created before they existed"""
+    async with engine.begin() as conn:
+        for column, column_type in _ANALYTICS_COLUMNS.items():
+            await conn.execute(text(f"ALTER TABLE analytics ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_analytics_ingested_at ON analytics (ingested_at)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_analytics_timestamp ON analytics (timestamp)"))
+
+
+_rollup_service: Optional[AnalyticsRollupService] = None
+
+
+def get_rollup_service() -> AnalyticsRollupService:
+    """Return the process-wide analytics rollup service"""
+    global _rollup_service
+    if _rollup_service is None:
+        _rollup_service = AnalyticsRollupService()
+    return _rollup_service
+
+
+async def _refresh(args: argparse.Namespace) -> None:
+    await ensure_analytics_columns()
+    since = datetime.fromisoformat(args.since).replace(tzinfo=timezone.utc) if getattr(args, "since", None) else None
+    report = await get_rollup_service().refresh(since=since)
+    if report is None:
+        print("Another worker is refreshing the rollup; try again shortly")
+    else:
+        print(f"Rebuilt {report.buckets} buckets, pruned {report.pruned} minute buckets in {report.seconds:.2f}s")
+
+
+def main() -> None:
+    setup_logging()
+    parser = argparse.ArgumentParser(description="HeliosCS analytics rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("refresh", help="Fold newly ingested events into the rollup")
+    backfill = commands.add_parser("backfill", help="Rebuild every bucket with events ingested since a date")
+    backfill.add_argument("--since", required=True, help="ISO date or datetime, UTC")
+    args = parser.parse_args()
+    asyncio.run(_refresh(args))
+
+
+if __name__ == "__main__":
+    main()
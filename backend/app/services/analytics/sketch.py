@@ -0,0 +1,145 @@
+from typing import Dict, Iterable, Optional, Tuple
+import math
+import struct
+import numpy as np
+
+# alpha, zero count, total count, then (offset, length) for the positive and negative stores
+_HEADER = struct.Struct("<dddiIiI")
+
+# Values closer to zero than this are counted in the zero bucket
+MIN_INDEXABLE = 1e-9
+
+
+class SketchError(ValueError):
+    """Raised when sketches cannot be decoded or merged"""
+    pass
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative-error guarantees (DDSketch)
+
+    Values land in logarithmic buckets of ratio ``gamma = (1 + a) / (1 - a)``,
+    so every reported quantile is within ``a`` relative error of the exact
+    value. Two sketches with the same accuracy merge by adding bucket
+    counts, which makes them safe to combine across minutes, hours and days
+    in any order. Buckets are held in dense arrays, so a sketch of latencies
+    spanning 1ms to 1000s at 1% accuracy is under 6KB serialized.
+    """
+
+    __slots__ = ("alpha", "gamma", "_log_gamma", "zero_count", "count", "_positive", "_negative")
+
+    def __init__(self, alpha: float = 0.01):
+        if not 0 < alpha < 1:
+            raise SketchError(f"Relative accuracy must be in (0, 1), got {alpha}")
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.zero_count = 0.0
+        self.count = 0.0
+        self._positive: Dict[int, float] = {}
+        self._negative: Dict[int, float] = {}
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint of the bucket (gamma^(i-1), gamma^i], within alpha of every value in it
+        return 2 * self.gamma ** index / (1 + self.gamma)
+
+    def add(self, value: float, count: float = 1.0) -> None:
+        if value > MIN_INDEXABLE:
+            index = self._index(value)
+            self._positive[index] = self._positive.get(index, 0.0) + count
+        elif value < -MIN_INDEXABLE:
+            index = self._index(-value)
+            self._negative[index] = self._negative.get(index, 0.0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "DDSketch") -> None:
+        if other.alpha != self.alpha:
+            raise SketchError(f"Cannot merge sketches with accuracy {self.alpha} and {other.alpha}")
+        for index, count in other._positive.items():
+            self._positive[index] = self._positive.get(index, 0.0) + count
+        for index, count in other._negative.items():
+            self._negative[index] = self._negative.get(index, 0.0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate value at quantile ``q`` in [0, 1]; None when empty"""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0.0
+        for index in sorted(self._negative, reverse=True):
+            seen += self._negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self._positive):
+            seen += self._positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self._positive)) if self._positive else 0.0
+
+    def rank(self, value: float) -> float:
+        """Approximate share of values less than or equal to ``value``"""
+        if self.count <= 0:
+            return 0.0
+        below = sum(self._negative.values())
+        if value < -MIN_INDEXABLE:
+            limit = self._index(-value)
+            below = sum(count for index, count in self._negative.items() if index >= limit)
+        elif value >= -MIN_INDEXABLE:
+            below += self.zero_count
+            if value > MIN_INDEXABLE:
+                limit = self._index(value)
+                below += sum(count for index, count in self._positive.items() if index <= limit)
+        return below / self.count
+
+    @staticmethod
+    def _pack(store: Dict[int, float]) -> Tuple[int, np.ndarray]:
+        if not store:
+            return 0, np.empty(0, dtype=np.float64)
+        low, high = min(store), max(store)
+        dense = np.zeros(high - low + 1, dtype=np.float64)
+        for index, count in store.items():
+            dense[index - low] = count
+        return low, dense
+
+    def to_bytes(self) -> bytes:
+        positive_offset, positive = self._pack(self._positive)
+        negative_offset, negative = self._pack(self._negative)
+        header = _HEADER.pack(
+            self.alpha, self.zero_count, self.count,
+            positive_offset, len(positive), negative_offset, len(negative),
+        )
+        return header + positive.tobytes() + negative.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDSketch":
+        if len(data) < _HEADER.size:
+            raise SketchError("Sketch blob is truncated")
+        alpha, zero_count, count, positive_offset, positive_length, negative_offset, negative_length = (
+            _HEADER.unpack_from(data)
+        )
+        if len(data) != _HEADER.size + 8 * (positive_length + negative_length):
+            raise SketchError("Sketch blob length does not match its header")
+        sketch = cls(alpha)
+        sketch.zero_count = zero_count
+        sketch.count = count
+        counts = np.frombuffer(data, dtype=np.float64, offset=_HEADER.size)
+        for i in np.flatnonzero(counts[:positive_length]):
+            sketch._positive[positive_offset + int(i)] = float(counts[i])
+        negative = counts[positive_length:]
+        for i in np.flatnonzero(negative):
+            sketch._negative[negative_offset + int(i)] = float(negative[i])
+        return sketch
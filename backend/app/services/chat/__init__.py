@@ -0,0 +1,44 @@
+# Chat orchestration services
+
+from .answer_cache import AnswerCache, CachedAnswer, get_answer_cache
+from .context import SessionContext, SessionContextCache, Turn, get_context_cache
+from .message_processor import MessageProcessor, SessionNotFoundError, get_message_processor, message_payload
+from .orchestrator import Orchestrator, Graph, Node, Finish, OrchestrationError, get_orchestrator
+from .pipeline import ReplyPipeline, ComposedAnswer
+from .websocket import Connection, ConnectionManager, ConnectionStats, get_connection_manager
+from .fanout import SessionFanout, InMemoryBroker, RedisBroker, get_fanout, set_fanout, close_fanout
+from .handoff import take_over, hand_back
+
+__all__ = [
+    "AnswerCache",
+    "CachedAnswer",
+    "get_answer_cache",
+    "SessionContext",
+    "SessionContextCache",
+    "Turn",
+    "get_context_cache",
+    "MessageProcessor",
+    "ComposedAnswer",
+    "SessionNotFoundError",
+    "get_message_processor",
+    "message_payload",
+    "Orchestrator",
+    "Graph",
+    "Node",
+    "Finish",
+    "OrchestrationError",
+    "get_orchestrator",
+    "ReplyPipeline",
+    "Connection",
+    "ConnectionManager",
+    "ConnectionStats",
+    "get_connection_manager",
+    "SessionFanout",
+    "InMemoryBroker",
+    "RedisBroker",
+    "get_fanout",
+    "set_fanout",
+    "close_fanout",
+    "take_over",
+    "hand_back",
+]
@@ -0,0 +1,180 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import time
+import numpy as np
+from app.core.cache import CacheStats
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import register_cache
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    """A composed, compliance-checked answer and the sources it relied on"""
+    content: str
+    citations: List[Dict[str, Any]]
+    source_versions: Dict[str, int]  # knowledge_source_id -> version at compose time
+    confidence: Optional[float] = None
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class _Scope:
+    """Answers for one (tenant, jurisdiction) pair, with query vectors in one matrix"""
+
+    def __init__(self, jurisdiction: str, dimension: int, capacity: int):
+        self.jurisdiction = jurisdiction
+        self.capacity = capacity
+        size = min(capacity, 64)
+        self.vectors = np.zeros((size, dimension), dtype=np.float32)
+        self.entries: List[Optional[CachedAnswer]] = [None] * size
+        self.last_used = np.zeros(size, dtype=np.float64)
+        self.live = np.zeros(size, dtype=bool)
+
+    def free_slot(self) -> int:
+        empty = np.flatnonzero(~self.live)
+        if empty.shape[0]:
+            return int(empty[0])
+        size = self.vectors.shape[0]
+        if size < self.capacity:
+            # Grow geometrically up to the configured capacity
+            grown = min(size * 2, self.capacity)
+            self.vectors = np.concatenate([self.vectors, np.zeros((grown - size, self.vectors.shape[1]), dtype=np.float32)])
+            self.entries.extend([None] * (grown - size))
+            self.last_used = np.concatenate([self.last_used, np.zeros(grown - size)])
+            self.live = np.concatenate([self.live, np.zeros(grown - size, dtype=bool)])
+            return size
+        # Full: evict the least recently used answer
+        return int(np.argmin(self.last_used))
+
+
+class AnswerCache:
+    """Semantic cache of FAQ answers keyed on query embedding
+
+    Entries are scoped by tenant and jurisdiction. Each entry records the
+    versions of the knowledge sources it cites; a hit is only served if
+    every cited source is still current at that version, and
+    ``invalidate_source`` drops entries eagerly when a source changes.
+    """
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.dimension = dimension or settings.EMBEDDING_DIMENSION or settings.PGVECTOR_DIMENSION
+        self.threshold = settings.ANSWER_CACHE_SIMILARITY if threshold is None else threshold
+        self.max_entries = max_entries or settings.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl = settings.ANSWER_CACHE_TTL if ttl is None else ttl
+        self.stats = CacheStats()
+        self._scopes: Dict[Tuple[str, str], _Scope] = {}
+        self._by_source: Dict[Tuple[str, str], set] = {}
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def lookup(
+        self,
+        tenant_id: str,
+        jurisdiction: str,
+        query_vector: np.ndarray,
+        current_version: Callable[[str], Optional[int]],
+    ) -> Optional[CachedAnswer]:
+        """Closest cached answer above the similarity threshold, if still valid
+
+        ``current_version`` maps a knowledge source id to its version in
+        force now, or None if it is inactive or expired.
+        """
+        scope = self._scopes.get((tenant_id, jurisdiction))
+        if scope is None or not scope.live.any():
+            self.stats.misses += 1
+            return None
+
+        scores = scope.vectors @ self._normalize(query_vector)
+        scores[~scope.live] = -1.0
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.threshold:
+            self.stats.misses += 1
+            return None
+
+        entry = scope.entries[slot]
+        expired = self.ttl and time.monotonic() - entry.created_at > self.ttl
+        stale = any(current_version(source_id) != version for source_id, version in entry.source_versions.items())
+        if expired or stale:
+            self._drop(tenant_id, scope, slot)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+
+        scope.last_used[slot] = time.monotonic()
+        self.stats.hits += 1
+        return entry
+
+    def store(self, tenant_id: str, jurisdiction: str, query_vector: np.ndarray, answer: CachedAnswer) -> None:
+        """Cache an answer; callers must only pass cited, compliance-checked answers"""
+        if not answer.source_versions:
+            return
+        key = (tenant_id, jurisdiction)
+        scope = self._scopes.get(key)
+        if scope is None:
+            scope = self._scopes[key] = _Scope(jurisdiction, self.dimension, self.max_entries)
+
+        slot = scope.free_slot()
+        if scope.live[slot]:
+            self._drop(tenant_id, scope, slot)
+            self.stats.evictions += 1
+        scope.vectors[slot] = self._normalize(query_vector)
+        scope.entries[slot] = answer
+        scope.last_used[slot] = time.monotonic()
+        scope.live[slot] = True
+        for source_id in answer.source_versions:
+            self._by_source.setdefault((tenant_id, source_id), set()).add((jurisdiction, slot))
+
+    def invalidate_source(self, tenant_id: str, source_id: str) -> int:
+        """Drop every cached answer citing the given knowledge source"""
+        refs = self._by_source.pop((tenant_id, source_id), set())
+        dropped = 0
+        for jurisdiction, slot in refs:
+            scope = self._scopes.get((tenant_id, jurisdiction))
+            entry = scope.entries[slot] if scope is not None else None
+            if entry is not None and source_id in entry.source_versions:
+                self._drop(tenant_id, scope, slot)
+                dropped += 1
+        if dropped:
+            logger.info("Answer cache invalidated", tenant_id=tenant_id, source_id=source_id, entries=dropped)
+        return dropped
+
+    def invalidate_tenant(self, tenant_id: str) -> None:
+        for key in [key for key in self._scopes if key[0] == tenant_id]:
+            del self._scopes[key]
+        for key in [key for key in self._by_source if key[0] == tenant_id]:
+            del self._by_source[key]
+
+    def _drop(self, tenant_id: str, scope: _Scope, slot: int) -> None:
+        entry = scope.entries[slot]
+        scope.live[slot] = False
+        scope.entries[slot] = None
+        if entry is None:
+            return
+        for source_id in entry.source_versions:
+            refs = self._by_source.get((tenant_id, source_id))
+            if refs is not None:
+                refs.discard((scope.jurisdiction, slot))
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    """Return the process-wide answer cache"""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+        register_cache("answer", _answer_cache.stats)
+    return _answer_cache
@@ -0,0 +1,242 @@
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import json
+import re
+import time
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import CacheStats, LRUCache, SharedCache, get_shared_cache
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import register_cache
+from app.models.message import Message
+from app.services.ai.llm import ChatMessages
+
+logger = get_logger(__name__)
+
+_ROLES = {"user": "user", "bot": "assistant", "agent": "assistant"}
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or the encoding cannot be fetched offline
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens for ``text``; approximated from word and punctuation count without tiktoken"""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return int(len(_WORD_RE.findall(text)) * 1.3) + 1
+
+
+class Turn:
+    """One message in the context window, with its token count computed once"""
+
+    __slots__ = ("id", "role", "content", "tokens")
+
+    def __init__(self, id: str, role: str, content: str, tokens: Optional[int] = None):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.tokens = count_tokens(content) if tokens is None else tokens
+
+    def gist(self, limit: int) -> str:
+        """First sentence of the turn, clipped, for the rolling summary"""
+        sentence = _SENTENCE_RE.split(self.content.strip(), maxsplit=1)[0]
+        if len(sentence) > limit:
+            sentence = sentence[:limit].rsplit(" ", 1)[0] + "..."
+        return f"{'Customer' if self.role == 'user' else 'Assistant'}: {sentence}"
+
+
+class SessionContext:
+    """Recent turns of a conversation plus a rolling summary of older ones
+
+    Turns beyond CONTEXT_MAX_TURNS or CONTEXT_MAX_TOKENS leave the window
+    oldest first and are folded into the summary as one-line gists; the
+    summary keeps its newest lines within CONTEXT_SUMMARY_MAX_TOKENS.
+    Updating is O(1) per message and never touches the database.
+    """
+
+    __slots__ = ("session_id", "turns", "window_tokens", "summary", "summary_tokens", "last_id", "updated_at")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turns: Deque[Turn] = deque()
+        self.window_tokens = 0
+        self.summary: Deque[Turn] = deque()  # gists, as turns so their token counts are kept
+        self.summary_tokens = 0
+        self.last_id: Optional[str] = None
+        self.updated_at = time.time()
+
+    def append(self, turn: Turn) -> None:
+        self.turns.append(turn)
+        self.window_tokens += turn.tokens
+        self.last_id = turn.id
+        self.updated_at = time.time()
+        while len(self.turns) > 1 and (
+            len(self.turns) > settings.CONTEXT_MAX_TURNS or self.window_tokens > settings.CONTEXT_MAX_TOKENS
+        ):
+            self._fold(self.turns.popleft())
+
+    def _fold(self, turn: Turn) -> None:
+        self.window_tokens -= turn.tokens
+        gist = Turn(turn.id, "summary", turn.gist(settings.CONTEXT_GIST_CHARS))
+        self.summary.append(gist)
+        self.summary_tokens += gist.tokens
+        while len(self.summary) > 1 and self.summary_tokens > settings.CONTEXT_SUMMARY_MAX_TOKENS:
+            self.summary_tokens -= self.summary.popleft().tokens
+
+    @property
+    def tokens(self) -> int:
+        return self.window_tokens + self.summary_tokens
+
+    def to_messages(self, before: Optional[str] = None) -> ChatMessages:
+        """Prompt messages for the conversation so far, summary first, stopping at message ``before``"""
+        messages: ChatMessages = []
+        if self.summary:
+            lines = "\n".join(gist.content for gist in self.summary)
+            messages.append({"role": "system", "content": f"Earlier in this conversation:\n{lines}"})
+        for turn in self.turns:
+            if turn.id == before:
+                break
+            messages.append({"role": turn.role, "content": turn.content})
+        return messages
+
+    def to_bytes(self) -> bytes:
+        # The last message id leads the payload so a cached copy can be checked without decoding it
+        body = json.dumps({
+            "s": [[gist.id, gist.content, gist.tokens] for gist in self.summary],
+            "t": [[turn.id, turn.role, turn.content, turn.tokens] for turn in self.turns],
+            "u": self.updated_at,
+        }, separators=(",", ":"))
+        return f"{self.last_id or ''}\n{body}".encode()
+
+    @classmethod
+    def from_bytes(cls, session_id: str, data: bytes) -> "SessionContext":
+        last_id, body = data.decode().split("\n", 1)
+        payload = json.loads(body)
+        context = cls(session_id)
+        for id, content, tokens in payload["s"]:
+            context.summary.append(Turn(id, "summary", content, tokens))
+            context.summary_tokens += tokens
+        for id, role, content, tokens in payload["t"]:
+            context.turns.append(Turn(id, role, content, tokens))
+            context.window_tokens += tokens
+        context.last_id = last_id or None
+        context.updated_at = payload["u"]
+        return context
+
+
+def _version(data: Optional[bytes]) -> Optional[str]:
+    return data.split(b"\n", 1)[0].decode() if data else None
+
+
+class SessionContextCache:
+    """Per-session context windows shared between workers
+
+    The shared cache (Redis) holds the encoded context, so any worker can
+    continue a conversation without reading message history from the
+    database; only a cold session is rebuilt from its latest messages. A
+    local LRU keeps decoded contexts; when the shared copy's leading
+    message id matches the local one, the turn skips decoding entirely.
+    """
+
+    def __init__(self, shared: Optional[SharedCache] = None):
+        self.shared = shared
+        self.ttl = settings.CONTEXT_CACHE_TTL_SECONDS
+        self.local: LRUCache[SessionContext] = LRUCache(settings.CONTEXT_CACHE_MAX_SESSIONS, ttl=self.ttl)
+        self.stats = CacheStats()  # shared-cache hits and database rebuilds
+
+    def _shared(self) -> SharedCache:
+        if self.shared is None:
+            self.shared = get_shared_cache()
+        return self.shared
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"ctx:{session_id}"
+
+    async def _fetch(self, session_id: str) -> Optional[bytes]:
+        try:
+            return (await self._shared().get_many([self._key(session_id)]))[0]
+        except Exception as e:
+            logger.warning("Shared context cache unavailable", error=str(e))
+            return None
+
+    async def get(self, db: AsyncSession, session_id: str) -> SessionContext:
+        """The session's context; call before adding new messages to ``db``"""
+        data = await self._fetch(session_id)
+        local = self.local.get(session_id)
+        if data is not None:
+            self.stats.hits += 1
+            if local is not None and local.last_id == _version(data):
+                return local
+            context = SessionContext.from_bytes(session_id, data)
+        elif local is not None:
+            # Shared copy expired or unreachable; the local one is still this worker's latest
+            return local
+        else:
+            self.stats.misses += 1
+            context = await self._load(db, session_id)
+            await self._store(context)
+        self.local.set(session_id, context)
+        return context
+
+    async def _load(self, db: AsyncSession, session_id: str) -> SessionContext:
+        # Read enough older messages to seed the summary, newest first, then replay them in order
+        limit = settings.CONTEXT_MAX_TURNS * 2
+        rows = (await db.execute(
+            select(Message.id, Message.message_type, Message.content)
+            .where(Message.session_id == session_id, Message.message_type.in_(list(_ROLES)))
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(limit)
+        )).all()
+        context = SessionContext(session_id)
+        for message_id, message_type, content in reversed(rows):
+            context.append(Turn(message_id, _ROLES[message_type], content))
+        return context
+
+    async def append(self, context: SessionContext, *messages: Optional[Message]) -> None:
+        """Add committed messages to the context and publish it to other workers in one write"""
+        turns = [
+            Turn(message.id, _ROLES[message.message_type], message.content)
+            for message in messages if message is not None and message.message_type in _ROLES
+        ]
+        if not turns:
+            return
+        for turn in turns:
+            context.append(turn)
+        self.local.set(context.session_id, context)
+        await self._store(context)
+
+    async def _store(self, context: SessionContext) -> None:
+        try:
+            await self._shared().set_many({self._key(context.session_id): context.to_bytes()}, ttl=self.ttl)
+        except Exception as e:
+            logger.warning("Shared context cache unavailable", error=str(e))
+
+    async def invalidate(self, session_id: str) -> None:
+        self.local.pop(session_id)
+        try:
+            await self._shared().delete(self._key(session_id))
+        except Exception as e:
+            logger.warning("Shared context cache unavailable", error=str(e))
+
+    def stats_dict(self) -> Dict[str, Any]:
+        return {"local": self.local.stats.to_dict(), "shared": self.stats.to_dict(), "sessions": len(self.local)}
+
+
+_context_cache: Optional[SessionContextCache] = None
+
+
+def get_context_cache() -> SessionContextCache:
+    """Return the process-wide session context cache"""
+    global _context_cache
+    if _context_cache is None:
+        _context_cache = SessionContextCache()
+        register_cache("context_local", _context_cache.local.stats)
+        register_cache("context_shared", _context_cache.stats)
+    return _context_cache
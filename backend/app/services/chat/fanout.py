@@ -0,0 +1,315 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional, Protocol, Set
+import asyncio
+import json
+import time
+import uuid
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.chat.websocket import ConnectionManager, get_connection_manager, merge_events
+
+logger = get_logger(__name__)
+
+CHANNEL_PREFIX = "helioscs:session:"
+
+# Events published to other workers without waiting for the batch window
+URGENT_EVENTS = {"handoff", "message", "message_end"}
+
+MessageHandler = Callable[[str, bytes], None]
+
+
+class Broker(Protocol):
+    """Pub/sub transport between workers"""
+
+    def on_message(self, handler: MessageHandler) -> None: ...
+
+    async def publish(self, channel: str, payload: bytes) -> None: ...
+
+    async def subscribe(self, channel: str) -> None: ...
+
+    async def unsubscribe(self, channel: str) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class InMemoryBroker:
+    """Process-local broker; brokers sharing a hub behave like workers sharing Redis"""
+
+    _default_hub: Dict[str, Set["InMemoryBroker"]] = {}
+
+    def __init__(self, hub: Optional[Dict[str, Set["InMemoryBroker"]]] = None):
+        self._hub = self._default_hub if hub is None else hub
+        self._handler: Optional[MessageHandler] = None
+
+    def on_message(self, handler: MessageHandler) -> None:
+        self._handler = handler
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        loop = asyncio.get_running_loop()
+        for broker in list(self._hub.get(channel, ())):
+            if broker._handler is not None:
+                loop.call_soon(broker._handler, channel, payload)
+
+    async def subscribe(self, channel: str) -> None:
+        self._hub.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel: str) -> None:
+        subscribers = self._hub.get(channel)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self._hub[channel]
+
+    async def close(self) -> None:
+        for channel in [channel for channel, subscribers in self._hub.items() if self in subscribers]:
+            await self.unsubscribe(channel)
+
+
+class RedisBroker:
+    """Broker backed by Redis pub/sub at REDIS_URL"""
+
+    def __init__(self, url: Optional[str] = None):
+        import redis.asyncio as redis
+        self._client = redis.from_url(url or settings.REDIS_URL)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._handler: Optional[MessageHandler] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def on_message(self, handler: MessageHandler) -> None:
+        self._handler = handler
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        await self._client.publish(channel, payload)
+
+    async def subscribe(self, channel: str) -> None:
+        await self._pubsub.subscribe(channel)
+        if self._reader is None:
+            # The pub/sub connection only exists after the first subscribe
+            self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, channel: str) -> None:
+        await self._pubsub.unsubscribe(channel)
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Fanout subscription read failed", error=str(e))
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message["type"] != "message" or self._handler is None:
+                continue
+            channel = message["channel"]
+            self._handler(channel.decode() if isinstance(channel, bytes) else channel, message["data"])
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        await self._pubsub.close()
+        await self._client.close()
+
+
+@dataclass
+class FanoutStats:
+    """Counters for cross-worker session fanout"""
+    subscriptions: int = 0
+    batches_published: int = 0
+    events_published: int = 0
+    events_coalesced: int = 0
+    events_received: int = 0
+    publish_errors: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class SessionFanout:
+    """Routes session events between workers through a broker
+
+    Events are delivered to this worker's connections immediately and
+    queued for other workers. Queued events are batched per session for
+    ``FANOUT_BATCH_DELAY_MS`` (typing and token deltas coalesced on the
+    way), while handoffs and stored messages are flushed at once. Batches
+    for one session are published in the order they were queued, even
+    when flushes overlap. A worker subscribes to a session's channel only
+    while it holds at least one connection for that session, so idle
+    sessions cost nothing.
+    """
+
+    def __init__(
+        self,
+        manager: Optional[ConnectionManager] = None,
+        broker: Optional[Broker] = None,
+        batch_delay: Optional[float] = None,
+        batch_max_events: Optional[int] = None,
+    ):
+        self.manager = manager or get_connection_manager()
+        self.broker = broker or _create_broker()
+        self.broker.on_message(self._receive)
+        self.batch_delay = settings.FANOUT_BATCH_DELAY_MS / 1000 if batch_delay is None else batch_delay
+        self.batch_max_events = batch_max_events or settings.FANOUT_BATCH_MAX_EVENTS
+        self.worker_id = uuid.uuid4().hex
+        self.stats = FanoutStats()
+        self._refs: Dict[str, int] = {}
+        self._subscribed: Set[str] = set()
+        self._subscription_lock = asyncio.Lock()
+        self._outbox: Dict[str, List[Dict[str, Any]]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._sending: Dict[str, asyncio.Task] = {}  # latest batch publish per session
+
+    async def acquire(self, session_id: str) -> None:
+        """Register a local connection for a session, subscribing on the first"""
+        self._refs[session_id] = self._refs.get(session_id, 0) + 1
+        if self._refs[session_id] == 1:
+            await self._sync_subscription(session_id)
+
+    async def release(self, session_id: str) -> None:
+        """Drop a local connection, unsubscribing after the last"""
+        count = self._refs.get(session_id, 0) - 1
+        if count > 0:
+            self._refs[session_id] = count
+            return
+        self._refs.pop(session_id, None)
+        await self._sync_subscription(session_id)
+
+    async def _sync_subscription(self, session_id: str) -> None:
+        # Serialized so an unsubscribe racing a new connection cannot win
+        async with self._subscription_lock:
+            wanted = session_id in self._refs
+            channel = CHANNEL_PREFIX + session_id
+            try:
+                if wanted and session_id not in self._subscribed:
+                    await self.broker.subscribe(channel)
+                    self._subscribed.add(session_id)
+                elif not wanted and session_id in self._subscribed:
+                    self._subscribed.discard(session_id)
+                    await self.broker.unsubscribe(channel)
+            except Exception as e:
+                logger.warning("Fanout subscription change failed", session_id=session_id, error=str(e))
+            self.stats.subscriptions = len(self._subscribed)
+
+    def publish(self, session_id: str, event: Dict[str, Any], urgent: bool = False) -> None:
+        """Deliver an event to every connection on the session, on any worker"""
+        self.manager.publish(session_id, event)
+
+        events = self._outbox.setdefault(session_id, [])
+        merged = merge_events(events[-1], event) if events else None
+        if merged is not None:
+            events[-1] = merged
+            self.stats.events_coalesced += 1
+        else:
+            events.append(event)
+
+        urgent = urgent or event.get("type") in URGENT_EVENTS or len(events) >= self.batch_max_events
+        self._schedule_flush(urgent)
+
+    def _schedule_flush(self, urgent: bool) -> None:
+        if urgent:
+            if self._flusher is not None:
+                self._flusher.cancel()
+            self._flusher = asyncio.create_task(self._flush_after(0))
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_after(self.batch_delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Past this point the task is never cancelled, so the swapped batch is always sent
+        self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Publish everything queued for other workers"""
+        outbox, self._outbox = self._outbox, {}
+        if not outbox:
+            return
+        sends = []
+        for session_id, events in outbox.items():
+            # Chained behind the session's previous batch, which an urgent flush may have overtaken
+            previous = self._sending.get(session_id)
+            send = asyncio.ensure_future(self._publish_batch(session_id, events, previous))
+            self._sending[session_id] = send
+            send.add_done_callback(lambda done, session_id=session_id: self._sent(session_id, done))
+            sends.append(send)
+        await asyncio.gather(*sends)
+
+    def _sent(self, session_id: str, send: asyncio.Task) -> None:
+        if self._sending.get(session_id) is send:
+            del self._sending[session_id]
+
+    async def _publish_batch(
+        self, session_id: str, events: List[Dict[str, Any]], previous: Optional[asyncio.Task] = None
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait({previous})
+        payload = json.dumps({"w": self.worker_id, "e": events}, default=str).encode()
+        try:
+            await self.broker.publish(CHANNEL_PREFIX + session_id, payload)
+        except Exception as e:
+            # Local connections already have the events; only other workers miss them
+            self.stats.publish_errors += 1
+            logger.warning("Fanout publish failed", session_id=session_id, events=len(events), error=str(e))
+            return
+        self.stats.batches_published += 1
+        self.stats.events_published += len(events)
+
+    def _receive(self, channel: str, data: bytes) -> None:
+        if not channel.startswith(CHANNEL_PREFIX):
+            return
+        try:
+            batch = json.loads(data)
+        except ValueError:
+            logger.warning("Discarding malformed fanout batch", channel=channel)
+            return
+        if batch.get("w") == self.worker_id:
+            return
+        session_id = channel[len(CHANNEL_PREFIX):]
+        events = batch.get("e", [])
+        self.stats.events_received += len(events)
+        for event in events:
+            self.manager.publish(session_id, event)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        await self.broker.close()
+
+
+def handoff_event(status: str, agent_id: Optional[str], reason: Optional[str] = None) -> Dict[str, Any]:
+    return {"type": "handoff", "status": status, "agent_id": agent_id, "reason": reason, "ts": time.time()}
+
+
+def _create_broker() -> Broker:
+    if settings.FANOUT_BACKEND == "redis":
+        return RedisBroker()
+    return InMemoryBroker()
+
+
+_fanout: Optional[SessionFanout] = None
+
+
+def get_fanout() -> SessionFanout:
+    """Return the process-wide session fanout selected by FANOUT_BACKEND"""
+    global _fanout
+    if _fanout is None:
+        _fanout = SessionFanout()
+        logger.info("Session fanout initialized", backend=settings.FANOUT_BACKEND, worker_id=_fanout.worker_id)
+    return _fanout
+
+
+def set_fanout(fanout: Optional[SessionFanout]) -> None:
+    """Replace the session fanout, e.g. with an in-memory one in tests"""
+    global _fanout
+    _fanout = fanout
+
+
+async def close_fanout() -> None:
+    global _fanout
+    if _fanout is not None:
+        await _fanout.close()
+    _fanout = None
@@ -0,0 +1,51 @@
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.logging import get_logger
+from app.models.customer import Customer
+from app.models.session import Session
+from app.services.analytics.events import get_event_writer
+from app.services.analytics.rollup import SESSIONS_ESCALATED
+from app.services.chat.fanout import SessionFanout, handoff_event
+from app.services.chat.message_processor import SessionNotFoundError
+
+logger = get_logger(__name__)
+
+
+async def take_over(
+    db: AsyncSession, fanout: SessionFanout, session_id: str, agent_id: str, reason: Optional[str] = None
+) -> Session:
+    """Escalate a session to an agent and tell both sides, wherever they are connected"""
+    session = await db.get(Session, session_id)
+    if session is None or session.status == "ended":
+        raise SessionNotFoundError(session_id)
+    session.status = "escalated"
+    session.agent_id = agent_id
+    session.escalation_reason = reason or session.escalation_reason
+    await db.commit()
+    fanout.publish(session_id, handoff_event("escalated", agent_id, reason))
+    events = get_event_writer()
+    customer = await db.get(Customer, session.customer_id)
+    tenant_id = customer.tenant_id if customer is not None else None
+    if tenant_id is not None:
+        events.record(tenant_id, SESSIONS_ESCALATED, 1, session_id=session_id, user_id=agent_id)
+    await events.audit("escalation", user_id=agent_id, session_id=session_id, details={"reason": reason}, tenant_id=tenant_id)
+    logger.info("Session taken over", session_id=session_id, agent_id=agent_id)
+    return session
+
+
+async def hand_back(db: AsyncSession, fanout: SessionFanout, session_id: str) -> Session:
+    """Return an escalated session to the bot"""
+    session = await db.get(Session, session_id)
+    if session is None or session.status == "ended":
+        raise SessionNotFoundError(session_id)
+    previous_agent = session.agent_id
+    session.status = "active"
+    session.agent_id = None
+    await db.commit()
+    fanout.publish(session_id, handoff_event("active", None))
+    customer = await db.get(Customer, session.customer_id)
+    await get_event_writer().audit(
+        "hand_back", user_id=previous_agent, session_id=session_id, tenant_id=customer.tenant_id if customer else None
+    )
+    logger.info("Session handed back", session_id=session_id, agent_id=previous_agent)
+    return session
@@ -0,0 +1,303 @@
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import uuid
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.customer import Customer
+from app.models.message import Message
+from app.models.session import Session
+from app.schemas.message import BotReply, Citation, SendMessageRequest, SendMessageResponse
+from app.services.analytics.events import EventWriter, get_event_writer
+from app.services.analytics.rollup import RESPONSE_SECONDS
+from app.services.chat.answer_cache import AnswerCache, get_answer_cache
+from app.services.ai.llm import ChatMessages
+from app.services.chat.context import SessionContextCache, get_context_cache
+from app.services.chat.orchestrator import Orchestrator, get_orchestrator
+from app.services.chat.pipeline import ComposedAnswer, ReplyPipeline, TokenSink, tokens
+from app.services.compliance.pii import PIIRedactionService, get_pii_service
+from app.services.knowledge.search import SearchService, get_search_service
+from app.services.tenant.config import TenantConfigService, get_tenant_config_service
+
+logger = get_logger(__name__)
+
+
+class SessionNotFoundError(Exception):
+    """Raised when a message targets an unknown or closed session"""
+    pass
+
+
+def _redactions_json(redactions: List[Dict[str, Any]]) -> Optional[str]:
+    return json.dumps(redactions) if redactions else None
+
+
+def message_payload(message: Message) -> Dict[str, Any]:
+    """Wire form of a stored message for WebSocket clients"""
+    return {
+        "id": message.id,
+        "session_id": message.session_id,
+        "content": message.content,
+        "message_type": message.message_type,
+        "status": message.status,
+        "confidence": message.confidence,
+        "citations": json.loads(message.citations) if message.citations else [],
+        "created_at": message.created_at.isoformat() if message.created_at else None,
+    }
+
+
+class MessageProcessor:
+    """Handles a customer message: store it, answer it, store the answer"""
+
+    def __init__(
+        self,
+        search_service: Optional[SearchService] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        pii_service: Optional[PIIRedactionService] = None,
+        orchestrator: Optional[Orchestrator] = None,
+        events: Optional[EventWriter] = None,
+        contexts: Optional[SessionContextCache] = None,
+        tenant_configs: Optional[TenantConfigService] = None,
+    ):
+        self.search_service = search_service or get_search_service()
+        self.answer_cache = answer_cache or get_answer_cache()
+        self.pii_service = pii_service or get_pii_service()
+        self.orchestrator = orchestrator or get_orchestrator()
+        self.events = events or get_event_writer()
+        self.contexts = contexts or get_context_cache()
+        self.tenant_configs = tenant_configs or get_tenant_config_service()
+        self.pipeline = ReplyPipeline(self.search_service, self.answer_cache, self.pii_service, self.orchestrator)
+
+    async def resolve_session(self, db: AsyncSession, session_id: str) -> Tuple[Session, str]:
+        """Load an open session and the tenant it belongs to"""
+        session = await db.get(Session, session_id)
+        if session is None or session.status == "ended":
+            raise SessionNotFoundError(session_id)
+        customer = await db.get(Customer, session.customer_id)
+        if customer is None:
+            raise SessionNotFoundError(session_id)
+        return session, customer.tenant_id
+
+    async def _store_user_message(
+        self, db: AsyncSession, session: Session, tenant_id: str, request: SendMessageRequest
+    ) -> Message:
+        # PII never reaches storage, the embedding API or the answer cache
+        content, redactions = await self.pii_service.redact(db, tenant_id, request.content)
+        message = Message(
+            id=uuid.uuid4().hex,
+            session_id=session.id,
+            content=content,
+            message_type=request.message_type,
+            status="sent",
+            redactions=_redactions_json([redaction.to_dict() for redaction in redactions]),
+        )
+        db.add(message)
+        await self.events.audit(
+            "message",
+            session_id=session.id,
+            details={"message_id": message.id, "message_type": message.message_type, "redactions": len(redactions)},
+            tenant_id=tenant_id,
+        )
+        return message
+
+    @staticmethod
+    def _bot_message(session: Session, answer: ComposedAnswer, message_id: Optional[str] = None) -> Message:
+        return Message(
+            id=message_id or uuid.uuid4().hex,
+            session_id=session.id,
+            content=answer.content,
+            message_type="bot",
+            status="sent",
+            confidence=answer.confidence,
+            citations=json.dumps(answer.citations),
+            redactions=_redactions_json(answer.redactions),
+        )
+
+    @staticmethod
+    def _should_answer(session: Session, request: SendMessageRequest) -> bool:
+        return request.message_type == "user" and session.status != "escalated"
+
+    async def handle(self, db: AsyncSession, request: SendMessageRequest) -> SendMessageResponse:
+        """Persist the user message and, for customer messages, compose a reply"""
+        session, tenant_id = await self.resolve_session(db, request.session_id)
+        now = datetime.now(timezone.utc)
+        context = await self.contexts.get(db, session.id)
+        history = context.to_messages()
+        user_message = await self._store_user_message(db, session, tenant_id, request)
+
+        reply = bot_message = None
+        if self._should_answer(session, request):
+            answer = await self.answer(db, tenant_id, user_message, session.id, history=history)
+            bot_message = self._bot_message(session, answer)
+            db.add(bot_message)
+            reply = BotReply(
+                message_id=bot_message.id,
+                content=answer.content,
+                citations=[Citation(**citation) for citation in answer.citations],
+                confidence=answer.confidence,
+                cached=answer.cached,
+            )
+
+        await db.commit()
+        await self.contexts.append(context, user_message, bot_message)
+        return SendMessageResponse(
+            message_id=user_message.id,
+            session_id=session.id,
+            content=user_message.content,
+            message_type=request.message_type,
+            timestamp=now,
+            status="sent",
+            reply=reply,
+        )
+
+    async def stream(self, db: AsyncSession, request: SendMessageRequest) -> AsyncIterator[Dict[str, Any]]:
+        """Persist the user message and stream the reply as WebSocket events
+
+        Yields the stored user message, then ``token`` deltas that have
+        already passed streaming redaction, then ``message_end`` with the
+        stored bot message. The stored content is authoritative: if the
+        compliance check replaces a streamed draft, clients show the
+        ``message_end`` content instead.
+        """
+        session, tenant_id = await self.resolve_session(db, request.session_id)
+        context = await self.contexts.get(db, session.id)
+        history = context.to_messages()
+        user_message = await self._store_user_message(db, session, tenant_id, request)
+        await db.commit()
+        await self.contexts.append(context, user_message)
+        yield {"type": "message", "message": message_payload(user_message)}
+        if not self._should_answer(session, request):
+            return
+
+        message_id = uuid.uuid4().hex
+        deltas: asyncio.Queue = asyncio.Queue()
+        running = asyncio.create_task(
+            self.answer(db, tenant_id, user_message, session.id, on_token=deltas.put, history=history)
+        )
+        try:
+            while not running.done() or not deltas.empty():
+                if deltas.empty():
+                    getter = asyncio.ensure_future(deltas.get())
+                    await asyncio.wait({getter, running}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    delta = getter.result()
+                else:
+                    delta = deltas.get_nowait()
+                yield {"type": "token", "message_id": message_id, "delta": delta}
+            answer = running.result()
+        finally:
+            if not running.done():
+                running.cancel()
+
+        if not answer.streamed:
+            # Cached answers skip the draft stage, so send them in one piece
+            async for delta in tokens(answer.content):
+                yield {"type": "token", "message_id": message_id, "delta": delta}
+
+        bot_message = self._bot_message(session, answer, message_id)
+        db.add(bot_message)
+        await db.commit()
+        await self.contexts.append(context, bot_message)
+        yield {"type": "message_end", "message": message_payload(bot_message), "cached": answer.cached}
+
+    async def replay(self, db: AsyncSession, session_id: str, last_ack: Optional[str], limit: Optional[int] = None) -> List[Message]:
+        """Messages a reconnecting client missed after ``last_ack``
+
+        Messages stored in one transaction share a timestamp, so everything
+        from the acknowledged message's timestamp on is returned except the
+        acknowledged message itself; clients de-duplicate by id.
+        """
+        limit = limit or settings.WS_REPLAY_LIMIT
+        query = select(Message).where(Message.session_id == session_id)
+        if last_ack:
+            acked = await db.get(Message, last_ack)
+            if acked is not None and acked.session_id == session_id:
+                query = query.where(Message.created_at >= acked.created_at, Message.id != acked.id)
+        result = await db.execute(query.order_by(Message.created_at, Message.id).limit(limit))
+        return list(result.scalars())
+
+    async def resume(self, db: AsyncSession, message_id: str) -> BotReply:
+        """Finish answering a stored user message, reusing checkpointed stages"""
+        user_message = await db.get(Message, message_id)
+        if user_message is None or user_message.message_type != "user":
+            raise SessionNotFoundError(message_id)
+        session, tenant_id = await self.resolve_session(db, user_message.session_id)
+        context = await self.contexts.get(db, session.id)
+        history = context.to_messages(before=user_message.id)
+        answer = await self.answer(db, tenant_id, user_message, session.id, resume=True, history=history)
+        bot_message = self._bot_message(session, answer)
+        db.add(bot_message)
+        await db.commit()
+        await self.contexts.append(context, bot_message)
+        return BotReply(
+            message_id=bot_message.id,
+            content=answer.content,
+            citations=[Citation(**citation) for citation in answer.citations],
+            confidence=answer.confidence,
+            cached=answer.cached,
+        )
+
+    async def answer(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        user_message: Message,
+        session_id: str,
+        on_token: Optional[TokenSink] = None,
+        resume: bool = False,
+        history: Optional[ChatMessages] = None,
+    ) -> ComposedAnswer:
+        """Run the reply pipeline for a stored user message; the run id is the message id"""
+        answer, run = await self.pipeline.run(
+            db,
+            tenant_id,
+            user_message.content,
+            run_id=user_message.id,
+            session_id=session_id,
+            on_token=on_token,
+            resume=resume,
+            history=history,
+            config=await self.tenant_configs.get(tenant_id),
+        )
+        if answer.intent:
+            user_message.intent = answer.intent
+        # Written behind the request by the event writer, not in this transaction
+        self.events.record(tenant_id, RESPONSE_SECONDS, run.seconds, "histogram", session_id=session_id)
+        await self.events.audit(
+            "bot_reply",
+            session_id=session_id,
+            details={"reply_to": user_message.id, "cached": answer.cached, "compliant": answer.compliant},
+            tenant_id=tenant_id,
+        )
+        logger.info(
+            "Message answered",
+            session_id=session_id,
+            cached=answer.cached,
+            compliant=answer.compliant,
+            citations=len(answer.citations),
+            duration=run.seconds,
+            stages={name: round(seconds * 1000, 2) for name, seconds in run.timings.items()},
+            restored=run.restored or None,
+        )
+        return answer
+
+
+_message_processor: Optional[MessageProcessor] = None
+
+
+def get_message_processor() -> MessageProcessor:
+    """Return the process-wide message processor"""
+    global _message_processor
+    if _message_processor is None:
+        _message_processor = MessageProcessor()
+        # Drop cached answers as soon as a cited knowledge source changes
+        _message_processor.search_service.add_listener(_message_processor.answer_cache.invalidate_source)
+        # Cached answers were checked against the old policies
+        _message_processor.pipeline.checker.engine.add_listener(_message_processor.answer_cache.invalidate_tenant)
+        # A tenant's jurisdiction or answer-cache flag may have changed
+        _message_processor.tenant_configs.add_listener(_message_processor.answer_cache.invalidate_tenant)
+    return _message_processor
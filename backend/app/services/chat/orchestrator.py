@@ -0,0 +1,410 @@
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Protocol, Set, Tuple
+import asyncio
+import json
+import time
+from sqlalchemy import delete, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logging import get_logger
+from app.core.metrics import STAGE_LATENCY
+from app.models.orchestration import OrchestrationCheckpoint
+
+logger = get_logger(__name__)
+
+NodeFunction = Callable[["RunContext"], Awaitable[Any]]
+
+
+class OrchestrationError(Exception):
+    """Raised when a required node fails or the graph is invalid"""
+    pass
+
+
+class NodeTimeoutError(OrchestrationError):
+    """Raised when a required node exceeds its timeout"""
+    pass
+
+
+@dataclass
+class Finish:
+    """Returned by a node to end the run early with ``value`` as the output
+
+    Every node still running is cancelled and no further nodes start.
+    """
+    value: Any
+
+
+@dataclass
+class Node:
+    """One step in a graph
+
+    ``optional`` nodes that fail or time out resolve to ``fallback``
+    instead of failing the run. Nodes with ``encode``/``decode`` are
+    checkpointed and restored on resume; others are recomputed. Each
+    checkpoint is a database write, so give codecs only to nodes that
+    cost more to recompute than to store.
+    """
+    name: str
+    run: NodeFunction
+    deps: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    optional: bool = False
+    fallback: Any = None
+    encode: Optional[Callable[[Any], Any]] = None
+    decode: Optional[Callable[[Any], Any]] = None
+
+
+class Graph:
+    """A validated DAG of nodes; the output is the value of ``output``"""
+
+    def __init__(self, name: str, nodes: Iterable[Node], output: str):
+        self.name = name
+        self.nodes: Dict[str, Node] = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise OrchestrationError(f"Duplicate node {node.name!r} in graph {name!r}")
+            self.nodes[node.name] = node
+        if output not in self.nodes:
+            raise OrchestrationError(f"Output node {output!r} not in graph {name!r}")
+        self.output = output
+        self.dependents: Dict[str, List[str]] = {node: [] for node in self.nodes}
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise OrchestrationError(f"Node {node.name!r} depends on unknown node {dep!r}")
+                self.dependents[dep].append(node.name)
+        self._check_acyclic()
+
+    def needed(self, done: Set[str]) -> Set[str]:
+        """Nodes still to run to produce the output, given already completed ones"""
+        needed: Set[str] = set()
+        stack = [self.output]
+        while stack:
+            name = stack.pop()
+            if name in done or name in needed:
+                continue
+            needed.add(name)
+            stack.extend(self.nodes[name].deps)
+        return needed
+
+    def _check_acyclic(self) -> None:
+        remaining = {name: len(node.deps) for name, node in self.nodes.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        visited = 0
+        while ready:
+            name = ready.pop()
+            visited += 1
+            for dependent in self.dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if visited != len(self.nodes):
+            raise OrchestrationError(f"Graph {self.name!r} has a cycle")
+
+
+class RunContext:
+    """Inputs and completed node outputs visible to running nodes"""
+
+    def __init__(self, run_id: str, inputs: Dict[str, Any]):
+        self.run_id = run_id
+        self.inputs = inputs
+        self.results: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.results.get(name, default)
+
+
+@dataclass
+class RunResult:
+    """Output of a run and how long each node took"""
+    run_id: str
+    output: Any
+    timings: Dict[str, float] = field(default_factory=dict)  # seconds per executed node
+    restored: List[str] = field(default_factory=list)  # nodes restored from a checkpoint
+    skipped: List[str] = field(default_factory=list)  # nodes cancelled or never started
+    finished_early: Optional[str] = None  # node that returned Finish
+    seconds: float = 0.0
+
+
+class CheckpointStore(Protocol):
+    """Persistence for completed node outputs"""
+
+    async def load(self, run_id: str) -> Optional[Dict[str, Any]]: ...
+
+    async def save(
+        self, run_id: str, graph: str, state: Dict[str, Any], timings: Dict[str, float], status: str,
+        session_id: Optional[str] = None,
+    ) -> None: ...
+
+
+class LatencyStats:
+    """Recent per-node latencies for percentile reporting"""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._counts: Dict[Tuple[str, str], int] = {}
+
+    def record(self, graph: str, node: str, seconds: float) -> None:
+        key = (graph, node)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._counts[key] = self._counts.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        report: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (graph, node), samples in self._samples.items():
+            ordered = sorted(samples)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            report.setdefault(graph, {})[node] = {
+                "count": self._counts[(graph, node)],
+                "p50_ms": round(pick(0.50) * 1000, 2),
+                "p95_ms": round(pick(0.95) * 1000, 2),
+                "p99_ms": round(pick(0.99) * 1000, 2),
+            }
+        return report
+
+
+class Orchestrator:
+    """Runs graphs with maximal concurrency
+
+    A node starts as soon as all of its dependencies have finished, so
+    independent branches overlap and a run takes as long as its critical
+    path rather than the sum of its stages.
+    """
+
+    def __init__(self, store: Optional[CheckpointStore] = None, default_timeout: Optional[float] = None):
+        self.store = store
+        self.default_timeout = settings.ORCHESTRATOR_NODE_TIMEOUT if default_timeout is None else default_timeout
+        self.latency = LatencyStats()
+
+    async def run(
+        self,
+        graph: Graph,
+        run_id: str,
+        inputs: Optional[Dict[str, Any]] = None,
+        resume: bool = False,
+        session_id: Optional[str] = None,
+    ) -> RunResult:
+        """Execute a graph; with ``resume`` restore checkpointed nodes first"""
+        started = time.perf_counter()
+        context = RunContext(run_id, inputs or {})
+        result = RunResult(run_id=run_id, output=None)
+        checkpointed: Dict[str, Any] = {}
+
+        if resume and self.store is not None:
+            saved = await self.store.load(run_id) or {}
+            for name, encoded in saved.items():
+                node = graph.nodes.get(name)
+                if node is not None and node.decode is not None:
+                    context.results[name] = node.decode(encoded)
+                    checkpointed[name] = encoded
+                    result.restored.append(name)
+
+        saver = _CheckpointWriter(self.store, graph.name, run_id, session_id) if self.store is not None else None
+        done: Set[str] = set(context.results)
+        needed = graph.needed(done)
+        waiting = {name: sum(dep not in done for dep in graph.nodes[name].deps) for name in needed}
+        running: Dict[asyncio.Task, str] = {}
+
+        def start_ready() -> None:
+            for name in [name for name, count in waiting.items() if count == 0]:
+                del waiting[name]
+                task = asyncio.create_task(self._run_node(graph.nodes[name], context))
+                running[task] = name
+
+        try:
+            start_ready()
+            while running:
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name = running.pop(task)
+                    value, seconds = task.result()
+                    result.timings[name] = seconds
+                    self.latency.record(graph.name, name, seconds)
+                    STAGE_LATENCY.labels(graph.name, name).observe(seconds)
+
+                    if isinstance(value, Finish):
+                        result.output = value.value
+                        result.finished_early = name
+                        result.skipped = sorted(set(running.values()) | set(waiting))
+                        await _cancel(running)
+                        running.clear()
+                        waiting.clear()
+                        break
+
+                    context.results[name] = value
+                    node = graph.nodes[name]
+                    if saver is not None and node.encode is not None:
+                        checkpointed[name] = node.encode(value)
+                        saver.save(dict(checkpointed), dict(result.timings), "running")
+                    for dependent in graph.dependents[name]:
+                        if dependent in waiting:
+                            waiting[dependent] -= 1
+                start_ready()
+        except BaseException:
+            await _cancel(running)
+            if saver is not None:
+                saver.save(dict(checkpointed), dict(result.timings), "failed")
+            raise
+
+        if result.finished_early is None:
+            result.output = context.results[graph.output]
+        result.seconds = time.perf_counter() - started
+        if saver is not None:
+            saver.save(dict(checkpointed), dict(result.timings), "completed")
+        return result
+
+    async def _run_node(self, node: Node, context: RunContext) -> Tuple[Any, float]:
+        timeout = node.timeout if node.timeout is not None else self.default_timeout
+        started = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(node.run(context), timeout=timeout or None)
+        except asyncio.TimeoutError:
+            if not node.optional:
+                raise NodeTimeoutError(f"Node {node.name!r} timed out after {timeout}s")
+            logger.warning("Optional node timed out", node=node.name, run_id=context.run_id, timeout=timeout)
+            value = node.fallback
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not node.optional:
+                raise
+            logger.warning("Optional node failed", node=node.name, run_id=context.run_id, error=str(e))
+            value = node.fallback
+        return value, time.perf_counter() - started
+
+
+async def _cancel(running: Dict[asyncio.Task, str]) -> None:
+    for task in running:
+        task.cancel()
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+# Strong references to in-flight checkpoint writes
+_background: Set[asyncio.Task] = set()
+
+
+class _CheckpointWriter:
+    """Writes a run's checkpoints in the background, latest snapshot wins
+
+    Snapshots queued while a write is in flight replace each other, so a
+    run that finishes quickly writes only its final status.
+    """
+
+    def __init__(self, store: CheckpointStore, graph: str, run_id: str, session_id: Optional[str]):
+        self.store = store
+        self.graph = graph
+        self.run_id = run_id
+        self.session_id = session_id
+        self._pending: Optional[Tuple[Dict[str, Any], Dict[str, float], str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._started = False
+
+    def save(self, state: Dict[str, Any], timings: Dict[str, float], status: str) -> None:
+        if not state and not self._started:
+            # Nothing worth resuming and no row to update: runs that never checkpoint never write
+            return
+        self._started = True
+        self._pending = (state, timings, status)
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush())
+            _background.add(self._task)
+            self._task.add_done_callback(_background.discard)
+
+    async def _flush(self) -> None:
+        try:
+            while self._pending is not None:
+                state, timings, status = self._pending
+                self._pending = None
+                try:
+                    await self.store.save(self.run_id, self.graph, state, timings, status, self.session_id)
+                except Exception as e:
+                    # A lost checkpoint only costs recomputation on resume
+                    logger.warning("Checkpoint write failed", run_id=self.run_id, status=status, error=str(e))
+        finally:
+            self._task = None
+
+
+class DatabaseCheckpointStore:
+    """Checkpoints in the orchestration_checkpoints table, one row per run
+
+    Writes use their own short-lived sessions so they never share a
+    transaction with the request being served. Completed runs are deleted
+    unless ``ORCHESTRATOR_KEEP_COMPLETED`` is set, lazily: their ids are
+    collected and removed ``ORCHESTRATOR_DELETE_BATCH`` at a time, along
+    with any row older than ``ORCHESTRATOR_CHECKPOINT_TTL_HOURS`` that a
+    crashed worker left behind.
+    """
+
+    def __init__(self, keep_completed: Optional[bool] = None, delete_batch: Optional[int] = None):
+        self.keep_completed = settings.ORCHESTRATOR_KEEP_COMPLETED if keep_completed is None else keep_completed
+        self.delete_batch = delete_batch or settings.ORCHESTRATOR_DELETE_BATCH
+        self.ttl = timedelta(hours=settings.ORCHESTRATOR_CHECKPOINT_TTL_HOURS)
+        self._completed: List[str] = []
+
+    async def load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        async with AsyncSessionLocal() as db:
+            checkpoint = await db.get(OrchestrationCheckpoint, run_id)
+            if checkpoint is None or not checkpoint.state:
+                return None
+            return json.loads(checkpoint.state)
+
+    async def save(
+        self, run_id: str, graph: str, state: Dict[str, Any], timings: Dict[str, float], status: str,
+        session_id: Optional[str] = None,
+    ) -> None:
+        if status == "completed" and not self.keep_completed:
+            self._completed.append(run_id)
+            if len(self._completed) >= self.delete_batch:
+                await self.purge()
+            return
+        values = {
+            "graph": graph,
+            "session_id": session_id,
+            "status": status,
+            "state": json.dumps(state),
+            "timings": json.dumps(timings),
+        }
+        statement = insert(OrchestrationCheckpoint).values(id=run_id, **values)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[OrchestrationCheckpoint.id],
+                    set_={**values, "updated_at": func.now()},
+                )
+            )
+            await db.commit()
+
+    async def purge(self) -> None:
+        """Delete the checkpoints of completed runs collected so far, and expired ones"""
+        # Taken up front: if the delete fails, the rows expire and a later batch sweeps them
+        run_ids, self._completed = self._completed, []
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(OrchestrationCheckpoint).where(or_(
+                OrchestrationCheckpoint.id.in_(run_ids),
+                OrchestrationCheckpoint.created_at < cutoff,
+            )))
+            await db.commit()
+
+
+_orchestrator: Optional[Orchestrator] = None
+
+
+def get_orchestrator() -> Orchestrator:
+    """Return the process-wide orchestrator"""
+    global _orchestrator
+    if _orchestrator is None:
+        store = DatabaseCheckpointStore() if settings.ORCHESTRATOR_CHECKPOINTS else None
+        _orchestrator = Orchestrator(store=store)
+    return _orchestrator
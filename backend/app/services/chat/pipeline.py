@@ -0,0 +1,410 @@
+from dataclasses import dataclass, field, asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import re
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.rate_limit import LLMTokenMeter, get_token_meter
+from app.core.logging import get_logger
+from app.services.ai.intent import DEFAULT_INTENT, IntentClassifier, IntentResult, get_intent_classifier
+from app.services.ai.llm import ChatMessages, LLMError, LLMPool, get_llm_pool
+from app.services.chat.answer_cache import AnswerCache, CachedAnswer
+from app.services.chat.context import count_tokens
+from app.services.chat.orchestrator import Finish, Graph, Node, Orchestrator, RunContext, RunResult
+from app.services.compliance.checker import ComplianceChecker, PolicyRef
+from app.services.compliance.pii import PIIRedactionService
+from app.services.compliance.policy_engine import RuleSet
+from app.services.compliance.streaming import StreamingGuard, guard_stream, redact_stream
+from app.services.knowledge.search import SearchHit, SearchService
+from app.services.tenant.config import TenantConfig
+
+logger = get_logger(__name__)
+
+NO_SOURCE_REPLY = (
+    "I couldn't find this in our published policies or help articles. "
+    "I can connect you with a support agent who can help."
+)
+
+ESCALATION_REPLY = "I'm connecting you with a support agent. Please stay in this chat."
+
+SYSTEM_PROMPT = (
+    "You are a customer support assistant for a regulated financial services company. "
+    "Answer the customer's question using only the numbered sources below, citing them like [1]. "
+    "If the sources do not answer the question, say that you will connect the customer with an agent. "
+    "Never ask for or repeat account numbers, card numbers or other personal data."
+)
+
+TokenSink = Callable[[str], Awaitable[None]]
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+@dataclass
+class ComposedAnswer:
+    """A bot answer with the knowledge it was grounded in"""
+    content: str
+    citations: List[Dict[str, Any]] = field(default_factory=list)
+    source_versions: Dict[str, int] = field(default_factory=dict)
+    confidence: Optional[float] = None
+    compliant: bool = True
+    cached: bool = False
+    intent: Optional[str] = None
+    redactions: List[Dict[str, Any]] = field(default_factory=list)
+    policy_ids: List[str] = field(default_factory=list)
+    streamed: bool = False
+
+    @property
+    def cacheable(self) -> bool:
+        """Only cited, compliance-checked answers may be replayed to other customers"""
+        return self.compliant and bool(self.citations) and not self.cached
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ComposedAnswer":
+        return cls(**data)
+
+
+async def tokens(text: str) -> AsyncIterator[str]:
+    """Word-sized deltas of a composed answer"""
+    for match in _TOKEN_RE.finditer(text):
+        yield match.group(0)
+
+
+class _Generation:
+    """LLM deltas holding a provider stream and a token reservation
+
+    ``aclose`` closes the stream and hands back the unused part of the
+    completion reservation whether or not iteration ever started, so a
+    run cancelled between the provider race and the first read leaks
+    neither. It is idempotent and also runs when the stream ends.
+    """
+
+    def __init__(self, stream: AsyncIterator[str], token_meter: LLMTokenMeter, tenant_id: str, max_tokens: int):
+        self._stream = stream
+        self._token_meter = token_meter
+        self._tenant_id = tenant_id
+        self._max_tokens = max_tokens
+        self._parts: List[str] = []
+        self._first: Optional[str] = None
+        self._closed = False
+
+    async def start(self) -> None:
+        """Wait for the first delta, settling the provider race"""
+        try:
+            self._first = await self._stream.__anext__()
+        except StopAsyncIteration:
+            self._first = ""
+        self._parts.append(self._first)
+
+    def __aiter__(self) -> "_Generation":
+        return self
+
+    async def __anext__(self) -> str:
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        try:
+            delta = await self._stream.__anext__()
+        except StopAsyncIteration:
+            await self.aclose()
+            raise
+        self._parts.append(delta)
+        return delta
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._stream.aclose()
+        finally:
+            # The completion limit was reserved up front; hand back what was not generated
+            used = count_tokens("".join(self._parts))
+            await self._token_meter.release(self._tenant_id, max(0, self._max_tokens - used))
+
+
+def grounded_prompt(question: str, hits: List[SearchHit], history: Optional[ChatMessages] = None) -> ChatMessages:
+    sources = "\n\n".join(f"[{i}] {hit.source_name}\n{hit.content}" for i, hit in enumerate(hits, start=1))
+    return [
+        {"role": "system", "content": f"{SYSTEM_PROMPT}\n\nSources:\n{sources}"},
+        *(history or []),
+        {"role": "user", "content": question},
+    ]
+
+
+class ReplyPipeline:
+    """The reply graph: Intent, Retrieve, Draft, Redact, ComplyCheck, Answer
+
+    ::
+
+        index ─┬─ cache ───┐
+        embed ─┴─ retrieve ┼─ draft ─ redact ─┬─ comply ─ answer
+        intent ────────────┘                  │
+        policies ─────────────────────────────┘
+
+    Intent classification and policy lookup run alongside retrieval and
+    redaction; a semantic cache hit finishes the run and cancels the
+    retrieval still in flight. Only one node at a time uses the request's
+    database session; retrieval and policy lookups, which run alongside
+    other nodes and may be cancelled, open their own.
+    """
+
+    GRAPH_NAME = "reply"
+
+    def __init__(
+        self,
+        search_service: SearchService,
+        answer_cache: AnswerCache,
+        pii_service: PIIRedactionService,
+        orchestrator: Orchestrator,
+        intent_classifier: Optional[IntentClassifier] = None,
+        checker: Optional[ComplianceChecker] = None,
+        llm_pool: Optional[LLMPool] = None,
+        token_meter: Optional[LLMTokenMeter] = None,
+    ):
+        self.search_service = search_service
+        self.answer_cache = answer_cache
+        self.pii_service = pii_service
+        self.orchestrator = orchestrator
+        self.intent_classifier = intent_classifier or get_intent_classifier()
+        self.checker = checker or ComplianceChecker(safe_replies=[NO_SOURCE_REPLY, ESCALATION_REPLY])
+        self.llm_pool = llm_pool or get_llm_pool()
+        self.token_meter = token_meter or get_token_meter()
+        self.graph = self._build_graph()
+
+    def _build_graph(self) -> Graph:
+        return Graph(
+            self.GRAPH_NAME,
+            [
+                # A cold tenant's first build loads and partitions its whole corpus
+                Node("index", self._index, timeout=settings.SEARCH_INDEX_BUILD_TIMEOUT),
+                Node("embed", self._embed, timeout=3.0, optional=True),
+                Node(
+                    "intent", self._intent, timeout=1.0, optional=True,
+                    fallback=IntentResult(intent=DEFAULT_INTENT, confidence=0.0),
+                ),
+                Node("policies", self._policies, timeout=2.0, optional=True, fallback=[]),
+                Node("cache", self._cache, deps=("index", "embed")),
+                Node("retrieve", self._retrieve, deps=("index", "embed"), timeout=5.0),
+                # Only the LLM draft is worth a checkpoint; the stages around it are cheaper to rerun
+                Node(
+                    "draft", self._draft, deps=("cache", "intent", "retrieve"),
+                    timeout=settings.LLM_TIMEOUT, encode=ComposedAnswer.to_dict, decode=ComposedAnswer.from_dict,
+                ),
+                Node("redact", self._redact, deps=("draft",)),
+                Node("comply", self._comply, deps=("redact", "policies")),
+                Node("answer", self._answer, deps=("comply", "embed")),
+            ],
+            output="answer",
+        )
+
+    async def run(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        question: str,
+        run_id: str,
+        session_id: Optional[str] = None,
+        on_token: Optional[TokenSink] = None,
+        resume: bool = False,
+        history: Optional[ChatMessages] = None,
+        config: Optional[TenantConfig] = None,
+    ) -> Tuple[ComposedAnswer, RunResult]:
+        """Compose a redacted, compliance-checked answer to a customer question
+
+        With ``on_token`` the draft is streamed through the streaming
+        redactor and policy guard as it is produced. ``history`` is the conversation before
+        the question, as prompt messages. ``config`` is the tenant's parsed
+        configuration, which picks the jurisdiction and feature flags.
+        """
+        inputs = {
+            "db": db,
+            "tenant_id": tenant_id,
+            "question": question,
+            "on_token": on_token,
+            "history": history,
+            "config": config or TenantConfig(tenant_id=tenant_id),
+        }
+        result = await self.orchestrator.run(self.graph, run_id, inputs, resume=resume, session_id=session_id)
+        return result.output, result
+
+    async def _index(self, context: RunContext):
+        return await self.search_service.get_index(context.inputs["db"], context.inputs["tenant_id"])
+
+    async def _embed(self, context: RunContext):
+        return await self.search_service.embedding_service.embed_query(context.inputs["question"])
+
+    async def _intent(self, context: RunContext) -> IntentResult:
+        return await self.intent_classifier.classify(context.inputs["question"])
+
+    async def _policies(self, context: RunContext) -> List[PolicyRef]:
+        return await self.checker.active_policies(
+            context.inputs["tenant_id"], jurisdiction=context.inputs["config"].jurisdiction
+        )
+
+    async def _policy_rules(self, context: RunContext) -> Optional[RuleSet]:
+        # Usually served from the compiled snapshot the policies node just refreshed
+        try:
+            snapshot = await self.checker.snapshot(context.inputs["tenant_id"], context.inputs["config"].jurisdiction)
+        except Exception as e:
+            logger.warning("Policy rules unavailable", run_id=context.run_id, error=str(e))
+            return None
+        return snapshot.rules()
+
+    async def _cache(self, context: RunContext) -> Optional[Finish]:
+        config: TenantConfig = context.inputs["config"]
+        query_vector = context["embed"]
+        if query_vector is None or not config.enabled("answer_cache"):
+            return None
+        cached = self.answer_cache.lookup(
+            context.inputs["tenant_id"], config.jurisdiction, query_vector, context["index"].version_of
+        )
+        if cached is None:
+            return None
+        # Cached answers were redacted and compliance-checked when stored
+        return Finish(ComposedAnswer(
+            content=cached.content,
+            citations=cached.citations,
+            source_versions=cached.source_versions,
+            confidence=cached.confidence,
+            cached=True,
+        ))
+
+    async def _retrieve(self, context: RunContext) -> List[SearchHit]:
+        async with AsyncSessionLocal() as db:
+            return await self.search_service.search(
+                db,
+                context.inputs["tenant_id"],
+                context.inputs["question"],
+                k=3,
+                query_vector=context["embed"],
+            )
+
+    async def _draft(self, context: RunContext) -> ComposedAnswer:
+        intent: IntentResult = context["intent"]
+        hits: List[SearchHit] = context["retrieve"]
+        if intent.intent == "escalation":
+            answer = ComposedAnswer(content=ESCALATION_REPLY)
+        elif not hits:
+            answer = ComposedAnswer(content=NO_SOURCE_REPLY)
+        else:
+            versions = {hit.knowledge_source_id: context["index"].version_of(hit.knowledge_source_id) for hit in hits}
+            answer = ComposedAnswer(
+                content=hits[0].content,  # extractive fallback when no provider answers
+                citations=[
+                    {
+                        "chunk_id": hit.chunk_id,
+                        "knowledge_source_id": hit.knowledge_source_id,
+                        "source_name": hit.source_name,
+                        "score": hit.score,
+                    }
+                    for hit in hits
+                ],
+                source_versions={source_id: version for source_id, version in versions.items() if version is not None},
+            )
+        answer.intent = intent.intent
+
+        source = tokens(answer.content)
+        if answer.citations and self.llm_pool.available and context.inputs["config"].enabled("llm_generation"):
+            source = await self._generate(context, hits, answer.content)
+
+        try:
+            on_token = context.inputs.get("on_token")
+            if on_token is not None:
+                redactor = await self.pii_service.streaming_redactor(context.inputs["db"], context.inputs["tenant_id"])
+                stream = redact_stream(source, redactor)
+                rules = await self._policy_rules(context)
+                guard = StreamingGuard(rules, answer.intent) if rules else None
+                if guard is not None:
+                    # Prohibited text is caught before it is sent; the full check still runs in comply
+                    stream = guard_stream(stream, guard)
+                parts: List[str] = []
+                async for delta in stream:
+                    parts.append(delta)
+                    await on_token(delta)
+                answer.content = "".join(parts)
+                answer.redactions = [redaction.to_dict() for redaction in redactor.redactions]
+                answer.streamed = True
+                if guard is not None and guard.tripped:
+                    logger.warning("Streamed draft cut by policy", run_id=context.run_id, reasons=guard.violations)
+                    answer.content = guard.text
+                    answer.compliant = False
+            else:
+                answer.content = "".join([delta async for delta in source])
+        finally:
+            # Releases the LLM stream and token reservation even if cancelled before the first read
+            await source.aclose()
+        return answer
+
+    async def _generate(self, context: RunContext, hits: List[SearchHit], fallback: str) -> AsyncIterator[str]:
+        """LLM deltas for a grounded answer, or the extractive answer if no provider responds
+
+        The provider race is settled before anything is returned, so a
+        failover never follows partially streamed text. A tenant over its
+        LLM token budget gets the extractive answer too.
+        """
+        tenant_id = context.inputs["tenant_id"]
+        messages = grounded_prompt(context.inputs["question"], hits, context.inputs.get("history"))
+        max_tokens = settings.LLM_MAX_TOKENS
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        if not await self.token_meter.reserve(tenant_id, prompt_tokens + max_tokens):
+            logger.warning("LLM token budget exhausted, using extractive answer", run_id=context.run_id, tenant_id=tenant_id)
+            return tokens(fallback)
+
+        generation = _Generation(self.llm_pool.stream(messages, max_tokens), self.token_meter, tenant_id, max_tokens)
+        try:
+            await generation.start()
+        except LLMError as e:
+            logger.warning("Falling back to extractive answer", run_id=context.run_id, error=str(e))
+            await generation.aclose()
+            return tokens(fallback)
+        except BaseException:
+            await generation.aclose()
+            raise
+        return generation
+
+    async def _redact(self, context: RunContext) -> ComposedAnswer:
+        draft: ComposedAnswer = context["draft"]
+        if draft.streamed:
+            return draft
+        content, redactions = await self.pii_service.redact(context.inputs["db"], context.inputs["tenant_id"], draft.content)
+        return ComposedAnswer.from_dict({
+            **draft.to_dict(),
+            "content": content,
+            "redactions": [redaction.to_dict() for redaction in redactions],
+        })
+
+    async def _comply(self, context: RunContext) -> ComposedAnswer:
+        answer: ComposedAnswer = context["redact"]
+        rules = await self._policy_rules(context)
+        outcome = self.checker.check(answer.content, answer.citations, context["policies"], rules, answer.intent)
+        if outcome.compliant and answer.compliant:
+            return ComposedAnswer.from_dict({
+                **answer.to_dict(),
+                "content": "\n\n".join([answer.content, *outcome.disclaimers]),
+                "compliant": True,
+                "policy_ids": outcome.policy_ids,
+            })
+        logger.warning("Answer failed compliance check", run_id=context.run_id, reasons=outcome.reasons)
+        return ComposedAnswer(
+            content=NO_SOURCE_REPLY,
+            compliant=False,
+            intent=answer.intent,
+            policy_ids=outcome.policy_ids,
+            streamed=answer.streamed,
+        )
+
+    async def _answer(self, context: RunContext) -> ComposedAnswer:
+        answer: ComposedAnswer = context["comply"]
+        config: TenantConfig = context.inputs["config"]
+        query_vector = context["embed"]
+        if query_vector is not None and answer.cacheable and config.enabled("answer_cache"):
+            self.answer_cache.store(
+                context.inputs["tenant_id"],
+                config.jurisdiction,
+                query_vector,
+                CachedAnswer(answer.content, answer.citations, answer.source_versions, answer.confidence),
+            )
+        return answer
@@ -0,0 +1,223 @@
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Deque, Dict, Optional, Set
+import asyncio
+import json
+import time
+from fastapi import WebSocket
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import register_gauge
+
+logger = get_logger(__name__)
+
+# Events that only matter in their latest state and may be dropped under pressure
+COALESCED_EVENTS = {"typing", "presence"}
+
+# Close code sent to consumers that cannot keep up (RFC 6455 "try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def merge_events(last: Dict[str, Any], event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Single event equivalent to ``last`` followed by ``event``, if one exists
+
+    Typing and presence keep only the latest state per role; token deltas
+    for the same message are concatenated. Events may be shared between
+    connections, so merges return a new dict rather than mutating.
+    """
+    kind = event.get("type")
+    if last.get("type") != kind:
+        return None
+    if kind in COALESCED_EVENTS and last.get("role") == event.get("role"):
+        return event
+    if kind == "token" and last.get("message_id") == event.get("message_id"):
+        return {**last, "delta": last["delta"] + event["delta"]}
+    return None
+
+
+@dataclass
+class ConnectionStats:
+    """Counters for the WebSocket layer of this worker"""
+    connections: int = 0
+    opened: int = 0
+    events_sent: int = 0
+    events_coalesced: int = 0
+    events_dropped: int = 0
+    slow_disconnects: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class Connection:
+    """One WebSocket attached to a session
+
+    Idle connections hold no queue and no task; both are created when the
+    first event is sent and released once the queue drains, so idle
+    sockets cost little more than the socket itself.
+    """
+
+    __slots__ = ("websocket", "session_id", "role", "queue", "drainer", "closed")
+
+    def __init__(self, websocket: WebSocket, session_id: str, role: str):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.role = role
+        self.queue: Optional[Deque[Dict[str, Any]]] = None
+        self.drainer: Optional[asyncio.Task] = None
+        self.closed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self.queue) if self.queue else 0
+
+
+class ConnectionManager:
+    """Session-scoped WebSocket connections with bounded per-connection send queues
+
+    ``publish`` never blocks: events are queued per connection and written
+    by a short-lived drain task. Typing and presence events replace an
+    equivalent event still waiting in the queue, token deltas for the same
+    message are merged, and a connection whose queue is full or whose
+    socket blocks longer than ``WS_SEND_TIMEOUT`` is closed as a slow
+    consumer rather than buffering without bound.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None, send_timeout: Optional[float] = None):
+        self.queue_size = queue_size or settings.WS_SEND_QUEUE_SIZE
+        self.send_timeout = settings.WS_SEND_TIMEOUT if send_timeout is None else send_timeout
+        self.stats = ConnectionStats()
+        self._sessions: Dict[str, Set[Connection]] = {}
+
+    def connections(self, session_id: str) -> Set[Connection]:
+        return self._sessions.get(session_id, set())
+
+    def has_connections(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    async def connect(self, websocket: WebSocket, session_id: str, role: str) -> Connection:
+        await websocket.accept()
+        connection = Connection(websocket, session_id, role)
+        self._sessions.setdefault(session_id, set()).add(connection)
+        self.stats.connections += 1
+        self.stats.opened += 1
+        return connection
+
+    def disconnect(self, connection: Connection) -> None:
+        if connection.closed:
+            return
+        connection.closed = True
+        connection.queue = None
+        if connection.drainer is not None and connection.drainer is not asyncio.current_task():
+            connection.drainer.cancel()
+        connections = self._sessions.get(connection.session_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._sessions[connection.session_id]
+        self.stats.connections -= 1
+
+    def publish(self, session_id: str, event: Dict[str, Any]) -> None:
+        """Queue an event for every connection on a session on this worker"""
+        for connection in list(self._sessions.get(session_id, ())):
+            self.send(connection, event)
+
+    def send(self, connection: Connection, event: Dict[str, Any]) -> None:
+        """Queue an event for one connection"""
+        if connection.closed:
+            return
+        queue = connection.queue
+        if queue is None:
+            queue = connection.queue = deque()
+
+        if queue:
+            merged = merge_events(queue[-1], event)
+            if merged is not None:
+                queue[-1] = merged
+                self.stats.events_coalesced += 1
+                return
+
+        if len(queue) >= self.queue_size:
+            if event.get("type") in COALESCED_EVENTS:
+                self.stats.events_dropped += 1
+                return
+            self._evict(connection, "send queue full")
+            return
+
+        queue.append(event)
+        if connection.drainer is None:
+            connection.drainer = asyncio.create_task(self._drain(connection))
+
+    async def _drain(self, connection: Connection) -> None:
+        try:
+            while connection.queue:
+                event = connection.queue.popleft()
+                await asyncio.wait_for(
+                    connection.websocket.send_text(json.dumps(event, default=str)),
+                    timeout=self.send_timeout,
+                )
+                self.stats.events_sent += 1
+        except asyncio.TimeoutError:
+            self._evict(connection, "send timed out")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("WebSocket send failed", session_id=connection.session_id, error=str(e))
+            self.disconnect(connection)
+        finally:
+            connection.drainer = None
+            if connection.queue is not None and not connection.queue:
+                connection.queue = None
+
+    def _evict(self, connection: Connection, reason: str) -> None:
+        """Disconnect a consumer that cannot keep up"""
+        if connection.closed:
+            return
+        logger.warning(
+            "Disconnecting slow WebSocket consumer",
+            session_id=connection.session_id,
+            role=connection.role,
+            reason=reason,
+            pending=connection.pending,
+        )
+        self.stats.slow_disconnects += 1
+        self.disconnect(connection)
+        asyncio.get_running_loop().create_task(self._close(connection.websocket, SLOW_CONSUMER_CLOSE_CODE))
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int) -> None:
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def backpressure(self, session_id: str) -> None:
+        """Wait while any connection on the session is more than half full
+
+        Producers of long token streams call this between tokens so a slow
+        reader slows the stream down before it gets disconnected.
+        """
+        high_water = self.queue_size // 2
+        waiting = [
+            connection.drainer
+            for connection in self._sessions.get(session_id, ())
+            if connection.drainer is not None and connection.pending > high_water
+        ]
+        if waiting:
+            await asyncio.wait(waiting, timeout=self.send_timeout)
+
+
+def presence_event(role: str, state: str) -> Dict[str, Any]:
+    return {"type": "presence", "role": role, "state": state, "ts": time.time()}
+
+
+_connection_manager: Optional[ConnectionManager] = None
+
+
+def get_connection_manager() -> ConnectionManager:
+    """Return the process-wide WebSocket connection manager"""
+    global _connection_manager
+    if _connection_manager is None:
+        _connection_manager = ConnectionManager()
+        register_gauge("websocket_connections", "Open WebSocket connections", lambda: _connection_manager.stats.connections)
+    return _connection_manager
@@ -0,0 +1,41 @@
+# Compliance services
+
+from .redaction import RedactionEngine, RedactionPattern, Redaction, default_patterns, mask
+from .streaming import StreamingGuard, StreamingRedactor, guard_stream, redact_stream
+from .pii import PIIRedactionService, get_pii_service
+from .policy_engine import PolicyEngine, PolicyRules, PolicySnapshot, RuleSet, get_policy_engine, parse_policy
+from .checker import ComplianceChecker, ComplianceResult, PolicyRef
+from .audit_store import AuditStore, BlockRef, VerifyReport, get_audit_store
+from .transcript import BulkExport, TranscriptExporter, TranscriptNotFoundError, get_transcript_exporter, stream_transcript
+
+__all__ = [
+    "RedactionEngine",
+    "RedactionPattern",
+    "Redaction",
+    "default_patterns",
+    "mask",
+    "StreamingGuard",
+    "StreamingRedactor",
+    "guard_stream",
+    "redact_stream",
+    "PIIRedactionService",
+    "get_pii_service",
+    "PolicyEngine",
+    "PolicyRules",
+    "PolicySnapshot",
+    "RuleSet",
+    "get_policy_engine",
+    "parse_policy",
+    "ComplianceChecker",
+    "ComplianceResult",
+    "PolicyRef",
+    "AuditStore",
+    "BlockRef",
+    "VerifyReport",
+    "get_audit_store",
+    "BulkExport",
+    "TranscriptExporter",
+    "TranscriptNotFoundError",
+    "get_transcript_exporter",
+    "stream_transcript",
+]
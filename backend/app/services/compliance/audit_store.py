@@ -0,0 +1,479 @@
+"""Append-only, hash-chained audit segments
+
+Audit records are appended in zlib-compressed blocks to segment files.
+Every record is chained to the one before it with SHA-256, and each block
+header carries the chain hash after its last record, so editing,
+removing or reordering any record breaks verification from that point on.
+A sidecar index per segment lists each block's sequence range, time
+range and the tenants, sessions and users it holds. Queries only decompress the
+blocks that can match, which are read through memory maps.
+
+From the backend directory:
+
+    python -m app.services.compliance.audit_store verify
+    python -m app.services.compliance.audit_store export --session <id>
+    python -m app.services.compliance.audit_store export --user <id> --start 2024-05-01 --end 2024-06-01
+    python -m app.services.compliance.audit_store export --tenant <id> --start 2024-05-01
+"""
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import argparse
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.database import engine
+from app.core.logging import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+# magic, compressed length, first sequence number, record count, chain hash after the block
+_BLOCK = struct.Struct("<4sIQI32s")
+_MAGIC = b"HAB1"
+GENESIS = bytes(32)
+
+_SEGMENT = re.compile(r"^seg-(\d{8})\.log$")
+
+
+def canonical(record: Dict[str, Any]) -> bytes:
+    """Byte form of a record that the chain hash covers"""
+    return json.dumps(
+        record, sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+        default=lambda value: value.isoformat(),
+    ).encode()
+
+
+def chain(previous: bytes, line: bytes) -> bytes:
+    return hashlib.sha256(previous + line).digest()
+
+
+def _epoch(value: Any) -> float:
+    """Epoch seconds of a datetime or ISO string; naive values are UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return (value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value).timestamp()
+    return float(value or 0)
+
+
+@dataclass
+class BlockRef:
+    """Index entry for one compressed block"""
+    segment: int
+    offset: int  # of the block header
+    length: int  # compressed payload bytes
+    first_seq: int
+    count: int
+    start: float  # earliest created_at in the block, epoch seconds
+    end: float
+    hash: str
+    sessions: List[str] = field(default_factory=list)
+    users: List[str] = field(default_factory=list)
+    tenants: List[str] = field(default_factory=list)
+
+    @property
+    def next_offset(self) -> int:
+        return self.offset + _BLOCK.size + self.length
+
+
+@dataclass
+class VerifyReport:
+    """Outcome of walking the whole chain"""
+    ok: bool = True
+    segments: int = 0
+    blocks: int = 0
+    records: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    head: str = GENESIS.hex()
+    broken_at: Optional[int] = None  # first sequence number that failed
+    reason: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["mb_per_second"] = round(self.bytes / self.seconds / 1e6, 1) if self.seconds else None
+        return data
+
+
+class AuditStore:
+    """Append-only audit segments with a sparse time index and session/user indexes
+
+    Appends hold an exclusive file lock, so several API workers can share
+    one store directory and still extend a single chain. Each worker
+    follows the others' appends by tailing the sidecar index files.
+    """
+
+    def __init__(self, directory: Optional[str] = None, segment_max_bytes: Optional[int] = None, level: Optional[int] = None):
+        self.directory = directory or settings.AUDIT_STORE_DIR
+        self.segment_max_bytes = segment_max_bytes or settings.AUDIT_SEGMENT_MAX_MB * 1024 * 1024
+        self.level = settings.AUDIT_COMPRESSION_LEVEL if level is None else level
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._blocks: List[BlockRef] = []
+        self._starts: List[Tuple[float, int]] = []  # (block start, block number), sorted
+        self._max_span = 0.0  # widest block time range, bounds the sparse index lookup
+        self._by_session: Dict[str, List[int]] = {}
+        self._by_user: Dict[str, List[int]] = {}
+        self._by_tenant: Dict[str, List[int]] = {}
+        self._index_read: Dict[int, int] = {}  # segment -> bytes of its index already loaded
+        self._maps: Dict[int, Tuple[int, mmap.mmap]] = {}
+        with self._locked():
+            self._refresh()
+            self._recover()
+
+    # Paths and locking
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"seg-{segment:08d}.log")
+
+    def _index_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"seg-{segment:08d}.idx")
+
+    def _segments(self) -> List[int]:
+        return sorted(int(match.group(1)) for match in map(_SEGMENT.match, os.listdir(self.directory)) if match)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusive across threads of this worker and across worker processes"""
+        with self._lock:
+            fd = os.open(os.path.join(self.directory, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    # Index
+
+    def _add_block(self, ref: BlockRef) -> None:
+        number = len(self._blocks)
+        self._blocks.append(ref)
+        insort(self._starts, (ref.start, number))
+        self._max_span = max(self._max_span, ref.end - ref.start)
+        for session_id in ref.sessions:
+            self._by_session.setdefault(session_id, []).append(number)
+        for user_id in ref.users:
+            self._by_user.setdefault(user_id, []).append(number)
+        for tenant_id in ref.tenants:
+            self._by_tenant.setdefault(tenant_id, []).append(number)
+
+    def _refresh(self) -> None:
+        """Load index entries appended since the last look, by this or any other worker"""
+        for segment in self._segments():
+            path = self._index_path(segment)
+            if not os.path.exists(path):
+                continue
+            offset = self._index_read.get(segment, 0)
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partially written by a crashed worker; _recover rewrites it
+                    self._add_block(BlockRef(**json.loads(line)))
+                    offset += len(line)
+            self._index_read[segment] = offset
+
+    def _recover(self) -> None:
+        """Index blocks written before a crash hit the sidecar, and cut off torn writes"""
+        segments = self._segments()
+        if not segments:
+            return
+        segment = segments[-1]
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        last = self._blocks[-1] if self._blocks else None
+        offset = last.next_offset if last is not None and last.segment == segment else 0
+        if size == offset:
+            return
+        index_path = self._index_path(segment)
+        with open(index_path, "ab") as index:
+            # Drop a torn trailing index line before appending to it
+            index.truncate(self._index_read.get(segment, 0))
+        with open(path, "rb") as f:
+            while offset + _BLOCK.size <= size:
+                f.seek(offset)
+                magic, length, first_seq, count, digest = _BLOCK.unpack(f.read(_BLOCK.size))
+                if magic != _MAGIC or offset + _BLOCK.size + length > size:
+                    break
+                records = [json.loads(line) for line in zlib.decompress(f.read(length)).split(b"\n")]
+                ref = self._block_ref(segment, offset, length, first_seq, records, digest)
+                self._write_index(ref)
+                self._add_block(ref)
+                offset = ref.next_offset
+        if offset < size:
+            logger.warning("Truncating torn audit block", segment=segment, offset=offset, size=size)
+            with open(path, "rb+") as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _block_ref(segment: int, offset: int, length: int, first_seq: int, records: List[Dict[str, Any]], digest: bytes) -> BlockRef:
+        times = [_epoch(record.get("created_at")) for record in records]
+        return BlockRef(
+            segment=segment,
+            offset=offset,
+            length=length,
+            first_seq=first_seq,
+            count=len(records),
+            start=min(times),
+            end=max(times),
+            hash=digest.hex(),
+            sessions=sorted({record["session_id"] for record in records if record.get("session_id")}),
+            users=sorted({record["user_id"] for record in records if record.get("user_id")}),
+            tenants=sorted({record["tenant_id"] for record in records if record.get("tenant_id")}),
+        )
+
+    def _write_index(self, ref: BlockRef) -> None:
+        line = (json.dumps(asdict(ref), separators=(",", ":")) + "\n").encode()
+        with open(self._index_path(ref.segment), "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._index_read[ref.segment] = self._index_read.get(ref.segment, 0) + len(line)
+
+    # Writing
+
+    def head(self) -> Tuple[int, str]:
+        """Last sequence number and chain hash; publish this to anchor the chain externally"""
+        if not self._blocks:
+            return 0, GENESIS.hex()
+        last = self._blocks[-1]
+        return last.first_seq + last.count - 1, last.hash
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> Tuple[int, str]:
+        """Chain and durably append a batch of records as one block; returns the new head"""
+        records = list(records)
+        if not records:
+            return self.head()
+        with self._locked():
+            self._refresh()
+            self._recover()  # a worker may have died mid-append
+            seq, previous = self.head()
+            previous_hash = bytes.fromhex(previous)
+
+            segments = self._segments()
+            segment = segments[-1] if segments else 0
+            path = self._segment_path(segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+                os.chmod(path, 0o444)  # sealed
+                segment += 1
+                path = self._segment_path(segment)
+
+            lines, stored = [], []
+            digest = previous_hash
+            for i, record in enumerate(records, start=1):
+                record = {**record, "seq": seq + i}
+                line = canonical(record)
+                digest = chain(digest, line)
+                lines.append(line)
+                stored.append(record)
+            payload = zlib.compress(b"\n".join(lines), self.level)
+
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                offset = os.fstat(fd).st_size
+                os.write(fd, _BLOCK.pack(_MAGIC, len(payload), seq + 1, len(lines), digest) + payload)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            ref = self._block_ref(segment, offset, len(payload), seq + 1, stored, digest)
+            self._write_index(ref)
+            self._add_block(ref)
+            return seq + len(lines), digest.hex()
+
+    # Reading
+
+    def _map(self, segment: int) -> mmap.mmap:
+        size = os.path.getsize(self._segment_path(segment))
+        cached = self._maps.get(segment)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        if cached is not None:
+            cached[1].close()
+        with open(self._segment_path(segment), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[segment] = (size, mapped)
+        return mapped
+
+    def _read_block(self, ref: BlockRef, needles: Tuple[bytes, ...] = ()) -> List[Dict[str, Any]]:
+        """Decode a block; lines missing any of ``needles`` are skipped without parsing"""
+        mapped = self._map(ref.segment)
+        start = ref.offset + _BLOCK.size
+        lines = zlib.decompress(mapped[start:start + ref.length]).split(b"\n")
+        return [json.loads(line) for line in lines if all(needle in line for needle in needles)]
+
+    def _candidates(
+        self, tenant_id: Optional[str], session_id: Optional[str], user_id: Optional[str], start: Optional[float], end: Optional[float]
+    ) -> List[int]:
+        sets: List[Set[int]] = []
+        if tenant_id is not None:
+            sets.append(set(self._by_tenant.get(tenant_id, ())))
+        if session_id is not None:
+            sets.append(set(self._by_session.get(session_id, ())))
+        if user_id is not None:
+            sets.append(set(self._by_user.get(user_id, ())))
+        if start is not None or end is not None:
+            # Blocks are time-ordered only roughly, so look back by the widest block span
+            low = bisect_left(self._starts, ((start if start is not None else float("-inf")) - self._max_span, -1))
+            high = bisect_left(self._starts, (end, -1)) if end is not None else len(self._starts)
+            sets.append({
+                number for _, number in self._starts[low:high]
+                if start is None or self._blocks[number].end >= start
+            })
+        if not sets:
+            return list(range(len(self._blocks)))
+        return sorted(set.intersection(*sets))
+
+    def query(
+        self,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tenant_id: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Records matching every given filter in sequence order; ``end`` is exclusive"""
+        with self._lock:
+            self._refresh()
+            low = _epoch(start) if start is not None else None
+            high = _epoch(end) if end is not None else None
+            refs = [self._blocks[number] for number in self._candidates(tenant_id, session_id, user_id, low, high)]
+        # Records are stored canonically, so key filters can be matched on the raw bytes first
+        filters = (("tenant_id", tenant_id), ("session_id", session_id), ("user_id", user_id))
+        needles = tuple(canonical({key: value})[1:-1] for key, value in filters if value is not None)
+        for ref in refs:
+            for record in self._read_block(ref, needles):
+                if tenant_id is not None and record.get("tenant_id") != tenant_id:
+                    continue
+                if session_id is not None and record.get("session_id") != session_id:
+                    continue
+                if user_id is not None and record.get("user_id") != user_id:
+                    continue
+                if low is not None or high is not None:
+                    at = _epoch(record.get("created_at"))
+                    if (low is not None and at < low) or (high is not None and at >= high):
+                        continue
+                yield record
+
+    def verify(self, chunk_size: int = 8 * 1024 * 1024) -> VerifyReport:
+        """Recompute the whole chain from the segment files alone"""
+        report = VerifyReport()
+        started = time.perf_counter()
+        digest, expected_seq = GENESIS, 1
+        indexed = {(ref.segment, ref.offset): ref.hash for ref in self._blocks}
+        for segment in self._segments():
+            report.segments += 1
+            with open(self._segment_path(segment), "rb", buffering=chunk_size) as f:
+                offset = 0
+                while True:
+                    header = f.read(_BLOCK.size)
+                    if not header:
+                        break
+                    failure = None
+                    if len(header) < _BLOCK.size:
+                        failure = "truncated block header"
+                    else:
+                        magic, length, first_seq, count, block_hash = _BLOCK.unpack(header)
+                        payload = f.read(length)
+                        if magic != _MAGIC or len(payload) != length:
+                            failure = "malformed block"
+                        elif first_seq != expected_seq:
+                            failure = f"sequence gap: expected {expected_seq}, found {first_seq}"
+                    if failure is None:
+                        try:
+                            lines = zlib.decompress(payload).split(b"\n")
+                        except zlib.error:
+                            lines, failure = [], "block does not decompress"
+                        for line in lines:
+                            digest = chain(digest, line)
+                        if failure is None and (len(lines) != count or digest != block_hash):
+                            failure = "chain hash mismatch"
+                        elif failure is None and indexed.get((segment, offset), block_hash.hex()) != block_hash.hex():
+                            failure = "block hash differs from index"
+                    if failure is not None:
+                        report.ok, report.broken_at, report.reason = False, expected_seq, f"segment {segment}: {failure}"
+                        report.seconds = time.perf_counter() - started
+                        return report
+                    report.blocks += 1
+                    report.records += count
+                    report.bytes += _BLOCK.size + length
+                    expected_seq += count
+                    offset += _BLOCK.size + length
+        report.head = digest.hex()
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def close(self) -> None:
+        for _, mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+
+async def ensure_audit_indexes() -> None:
+    """Add the tenant column and index the audits table for tenant, session, user and time-range lookups"""
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE audits ADD COLUMN IF NOT EXISTS tenant_id VARCHAR REFERENCES tenants (id)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audits_tenant_created ON audits (tenant_id, created_at)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audits_session_created ON audits (session_id, created_at)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audits_user_created ON audits (user_id, created_at)"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audits_created_at ON audits (created_at)"))
+
+
+_store: Optional[AuditStore] = None
+
+
+def get_audit_store() -> Optional[AuditStore]:
+    """Return the process-wide audit store, or None when it is disabled"""
+    global _store
+    if _store is None and settings.AUDIT_STORE_ENABLED:
+        _store = AuditStore()
+    return _store
+
+
+def _date(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed
+
+
+def main() -> None:
+    setup_logging()
+    parser = argparse.ArgumentParser(description="HeliosCS audit segment store")
+    parser.add_argument("--dir", default=None, help="Store directory (default AUDIT_STORE_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("verify", help="Recompute the hash chain over every segment")
+    export = commands.add_parser("export", help="Write matching records as JSON lines to stdout")
+    export.add_argument("--tenant", default=None)
+    export.add_argument("--session", default=None)
+    export.add_argument("--user", default=None)
+    export.add_argument("--start", default=None, help="ISO date or datetime, UTC if no offset")
+    export.add_argument("--end", default=None, help="Exclusive")
+    args = parser.parse_args()
+
+    store = AuditStore(args.dir)
+    if args.command == "verify":
+        report = store.verify()
+        print(json.dumps(report.to_dict(), indent=2))
+        sys.exit(0 if report.ok else 1)
+    records = store.query(
+        session_id=args.session, user_id=args.user, start=_date(args.start), end=_date(args.end), tenant_id=args.tenant
+    )
+    for record in records:
+        sys.stdout.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+from app.core.logging import get_logger
+from app.services.compliance.policy_engine import PolicyEngine, PolicySnapshot, RuleSet, get_policy_engine
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class PolicyRef:
+    """An active policy an answer was checked against"""
+    id: str
+    type: str
+
+
+@dataclass
+class ComplianceResult:
+    """Outcome of checking a drafted answer"""
+    compliant: bool
+    reasons: List[str] = field(default_factory=list)
+    policy_ids: List[str] = field(default_factory=list)
+    disclaimers: List[str] = field(default_factory=list)
+
+
+class ComplianceChecker:
+    """Validates bot answers before they are sent
+
+    An answer is compliant when it is grounded in cited knowledge or is
+    one of the fixed safe replies, and breaks none of the tenant's policies
+    in force. Policies come from the compiled snapshots of the policy
+    engine, which refreshes them with its own database session.
+    """
+
+    def __init__(self, safe_replies: Optional[List[str]] = None, engine: Optional[PolicyEngine] = None):
+        self.safe_replies = set(safe_replies or [])
+        self.engine = engine or get_policy_engine()
+
+    async def snapshot(self, tenant_id: str, jurisdiction: Optional[str] = None) -> PolicySnapshot:
+        return await self.engine.snapshot(tenant_id, jurisdiction)
+
+    async def active_policies(
+        self, tenant_id: str, as_of: Optional[datetime] = None, jurisdiction: Optional[str] = None
+    ) -> List[PolicyRef]:
+        snapshot = await self.engine.snapshot(tenant_id, jurisdiction)
+        return [PolicyRef(id=policy.id, type=policy.type) for policy in snapshot.rules(as_of).policies]
+
+    def check(
+        self,
+        content: str,
+        citations: List[dict],
+        policies: List[PolicyRef],
+        rules: Optional[RuleSet] = None,
+        intent: Optional[str] = None,
+    ) -> ComplianceResult:
+        reasons: List[str] = []
+        disclaimers: List[str] = []
+        safe = content in self.safe_replies
+        if not citations and not safe:
+            reasons.append("ungrounded")
+        # Safe replies stand in for rejected answers, so policies never reject them
+        if rules is not None and not safe:
+            evaluation = rules.evaluate(content, len(citations), intent)
+            reasons.extend(evaluation.reasons)
+            disclaimers = evaluation.disclaimers
+        return ComplianceResult(
+            compliant=not reasons,
+            reasons=reasons,
+            policy_ids=[policy.id for policy in policies],
+            disclaimers=disclaimers if not reasons else [],
+        )
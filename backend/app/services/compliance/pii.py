@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import time
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.redaction_rule import RedactionRule
+from app.services.compliance.redaction import Redaction, RedactionEngine, RedactionPattern, default_patterns
+from app.services.compliance.streaming import StreamingRedactor
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class _CompiledRules:
+    fingerprint: Tuple[int, Optional[datetime]]
+    engine: RedactionEngine
+    checked_at: float
+
+
+class PIIRedactionService:
+    """Per-tenant redaction engines compiled from active RedactionRule rows
+
+    The compiled engine is reused until the tenant's rule fingerprint
+    (active rule count and latest ``updated_at``) changes. The fingerprint
+    is rechecked at most every ``REDACTION_RULES_REFRESH_SECONDS``; call
+    ``invalidate`` after editing rules to pick changes up immediately.
+    """
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        self.refresh_seconds = settings.REDACTION_RULES_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._engines: Dict[str, _CompiledRules] = {}
+        self._default_engine: Optional[RedactionEngine] = None
+
+    @property
+    def default_engine(self) -> RedactionEngine:
+        if self._default_engine is None:
+            self._default_engine = RedactionEngine(default_patterns())
+        return self._default_engine
+
+    async def _fingerprint(self, db: AsyncSession, tenant_id: str) -> Tuple[int, Optional[datetime]]:
+        result = await db.execute(
+            select(
+                func.count(RedactionRule.id),
+                func.max(func.coalesce(RedactionRule.updated_at, RedactionRule.created_at)),
+            ).where(RedactionRule.tenant_id == tenant_id, RedactionRule.is_active.is_(True))
+        )
+        count, latest = result.one()
+        return int(count or 0), latest
+
+    async def _compile(self, db: AsyncSession, tenant_id: str) -> RedactionEngine:
+        result = await db.execute(
+            select(RedactionRule.id, RedactionRule.type, RedactionRule.pattern)
+            .where(RedactionRule.tenant_id == tenant_id, RedactionRule.is_active.is_(True))
+            .order_by(RedactionRule.created_at)
+        )
+        patterns = [RedactionPattern(rule_id=rule_id, type=kind, pattern=pattern) for rule_id, kind, pattern in result.all()]
+        if not patterns:
+            return self.default_engine
+        engine = RedactionEngine(patterns)
+        logger.info("Redaction rules compiled", tenant_id=tenant_id, rules=engine.rule_count)
+        return engine
+
+    async def get_engine(self, db: AsyncSession, tenant_id: str) -> RedactionEngine:
+        """Compiled engine for a tenant, recompiled only when its rules change"""
+        now = time.monotonic()
+        compiled = self._engines.get(tenant_id)
+        if compiled is not None and now - compiled.checked_at < self.refresh_seconds:
+            return compiled.engine
+
+        fingerprint = await self._fingerprint(db, tenant_id)
+        if compiled is not None and compiled.fingerprint == fingerprint:
+            compiled.checked_at = now
+            return compiled.engine
+
+        engine = await self._compile(db, tenant_id)
+        self._engines[tenant_id] = _CompiledRules(fingerprint, engine, now)
+        return engine
+
+    def invalidate(self, tenant_id: str) -> None:
+        self._engines.pop(tenant_id, None)
+
+    async def redact(self, db: AsyncSession, tenant_id: str, text: str) -> Tuple[str, List[Redaction]]:
+        """Masked text and span-level redactions, or the text unchanged when redaction is off"""
+        if not settings.PII_REDACTION_ENABLED or not text:
+            return text, []
+        engine = await self.get_engine(db, tenant_id)
+        return engine.redact(text)
+
+    async def streaming_redactor(self, db: AsyncSession, tenant_id: str) -> StreamingRedactor:
+        """Incremental redactor for streamed output; passes text through when redaction is off"""
+        if not settings.PII_REDACTION_ENABLED:
+            return StreamingRedactor(RedactionEngine([]), lookahead=0)
+        return StreamingRedactor(await self.get_engine(db, tenant_id))
+
+
+_pii_service: Optional[PIIRedactionService] = None
+
+
+def get_pii_service() -> PIIRedactionService:
+    """Return the process-wide PII redaction service"""
+    global _pii_service
+    if _pii_service is None:
+        _pii_service = PIIRedactionService()
+    return _pii_service
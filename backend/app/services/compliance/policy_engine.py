@@ -0,0 +1,448 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import asyncio
+import hashlib
+import json
+import re
+import time
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logging import get_logger
+from app.models.policy import Policy
+from app.services.compliance.redaction import RedactionEngine, RedactionPattern
+
+logger = get_logger(__name__)
+
+# Line directives accepted in plain-text policies; any other line is narrative and ignored
+_DIRECTIVE_RE = re.compile(r"^\s*(prohibit|pattern|disclaimer|trigger|jurisdiction|intent)\s*:\s*(.+?)\s*$", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _phrase_key(text: str) -> str:
+    return _SPACE_RE.sub(" ", text.strip().lower())
+
+
+def _strings(value: Any) -> Tuple[str, ...]:
+    if isinstance(value, str):
+        value = [value]
+    return tuple(str(item).strip() for item in value or [] if str(item).strip())
+
+
+@dataclass(frozen=True)
+class PolicyRules:
+    """The enforceable part of one policy, parsed from ``Policy.content``"""
+    id: str
+    type: str
+    effective_date: Optional[datetime] = None
+    expiry_date: Optional[datetime] = None
+    prohibited: Tuple[str, ...] = ()
+    patterns: Tuple[str, ...] = ()
+    disclaimer: Optional[str] = None
+    triggers: Tuple[str, ...] = ()  # disclaimer is added only when one appears; always when empty
+    jurisdictions: FrozenSet[str] = frozenset()  # empty applies everywhere
+    intents: FrozenSet[str] = frozenset()  # empty applies to every intent
+    max_length: Optional[int] = None
+    min_citations: int = 0
+
+    def in_force(self, as_of: datetime) -> bool:
+        return (self.effective_date is None or self.effective_date <= as_of) and (
+            self.expiry_date is None or self.expiry_date > as_of
+        )
+
+    def applies_to(self, jurisdiction: str) -> bool:
+        return not self.jurisdictions or jurisdiction.upper() in self.jurisdictions
+
+    def covers(self, intent: Optional[str]) -> bool:
+        return not self.intents or intent in self.intents
+
+
+def parse_policy(
+    policy_id: str,
+    policy_type: str,
+    content: str,
+    effective_date: Optional[datetime] = None,
+    expiry_date: Optional[datetime] = None,
+) -> PolicyRules:
+    """Rules from a policy's content: a JSON object, or text with ``prohibit:``-style directive lines
+
+    JSON keys are ``prohibited``, ``patterns``, ``disclaimer``,
+    ``disclaimer_triggers``, ``jurisdictions``, ``intents``, ``max_length``
+    and ``min_citations``. Invalid regexes are logged and skipped so one bad
+    rule does not disable the rest of the tenant's policies.
+    """
+    data: Dict[str, Any] = {}
+    try:
+        parsed = json.loads(content)
+        if isinstance(parsed, dict):
+            data = parsed
+    except ValueError:
+        pass
+    if not data:
+        directives: Dict[str, List[str]] = {}
+        for line in content.splitlines():
+            match = _DIRECTIVE_RE.match(line)
+            if match:
+                directives.setdefault(match.group(1).lower(), []).append(match.group(2))
+        data = {
+            "prohibited": directives.get("prohibit"),
+            "patterns": directives.get("pattern"),
+            "disclaimer": " ".join(directives.get("disclaimer", [])) or None,
+            "disclaimer_triggers": directives.get("trigger"),
+            "jurisdictions": directives.get("jurisdiction"),
+            "intents": directives.get("intent"),
+        }
+
+    patterns = []
+    for pattern in _strings(data.get("patterns")):
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            logger.warning("Skipping invalid policy pattern", policy_id=policy_id, pattern=pattern, error=str(e))
+            continue
+        patterns.append(pattern)
+
+    return PolicyRules(
+        id=policy_id,
+        type=policy_type,
+        effective_date=_utc(effective_date),
+        expiry_date=_utc(expiry_date),
+        prohibited=tuple(_phrase_key(phrase) for phrase in _strings(data.get("prohibited"))),
+        patterns=tuple(patterns),
+        disclaimer=(str(data["disclaimer"]).strip() or None) if data.get("disclaimer") else None,
+        triggers=tuple(_phrase_key(phrase) for phrase in _strings(data.get("disclaimer_triggers"))),
+        jurisdictions=frozenset(code.upper() for code in _strings(data.get("jurisdictions"))),
+        intents=frozenset(_strings(data.get("intents"))),
+        max_length=int(data["max_length"]) if data.get("max_length") else None,
+        min_citations=int(data.get("min_citations") or 0),
+    )
+
+
+def _trie_regex(node: Dict[str, Any]) -> str:
+    """Alternation for a character trie; shared prefixes are matched once"""
+    branches: List[str] = []
+    singles: List[str] = []
+    for char in sorted(key for key in node if key):
+        atom = r"\s+" if char == " " else re.escape(char)
+        rest = _trie_regex(node[char])
+        if rest or char == " ":
+            branches.append(atom + rest)
+        else:
+            singles.append(atom)
+    if len(singles) == 1:
+        branches.append(singles[0])
+    elif singles:
+        branches.append(f"[{''.join(singles)}]")
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    # An end-of-phrase marker makes the rest optional; greedy, so the longest phrase is tried first
+    return f"(?:{body})?" if "" in node else body
+
+
+class PhraseMatcher:
+    """Whole-word search for lowercase phrases in a single regex pass
+
+    Phrases are merged into a trie-shaped alternation, so the cost of a
+    scan barely grows with the number of phrases. A lookahead reports the
+    longest phrase at every start position, and each phrase also carries
+    the owners of any shorter phrase it contains, so overlapping phrases
+    never hide one another.
+    """
+
+    def __init__(self, owners: Dict[str, Set[int]]):
+        trie: Dict[str, Any] = {}
+        for phrase in owners:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        self.regex = re.compile(rf"(?<!\w)(?=({_trie_regex(trie)})(?!\w))") if owners else None
+
+        tokens = {phrase: f" {' '.join(_TOKEN_RE.findall(phrase))} " for phrase in owners}
+        self.owners: Dict[str, FrozenSet[int]] = {}
+        for phrase, padded in tokens.items():
+            combined = set(owners[phrase])
+            for other, other_padded in tokens.items():
+                if other != phrase and other_padded in padded:
+                    combined |= owners[other]
+            self.owners[phrase] = frozenset(combined)
+
+    def find(self, lowered: str) -> Set[int]:
+        """Owners of every phrase in ``lowered``, which must already be lowercase"""
+        found: Set[int] = set()
+        if self.regex is None:
+            return found
+        for match in self.regex.finditer(lowered):
+            found |= self.owners.get(_SPACE_RE.sub(" ", match.group(1)), frozenset())
+        return found
+
+
+@dataclass
+class PolicyEvaluation:
+    """Policy outcome for one drafted answer"""
+    reasons: List[str] = field(default_factory=list)
+    violated: List[str] = field(default_factory=list)
+    disclaimers: List[str] = field(default_factory=list)
+
+
+class RuleSet:
+    """The policies in force at one moment, compiled for matching
+
+    Prohibited phrases and disclaimer triggers each become one phrase
+    matcher, and regexes run through a redaction engine, which joins them
+    into one alternation gated on their literal anchors. Evaluating a
+    draft is a handful of C-level scans whatever the number of policies.
+    """
+
+    def __init__(self, policies: Sequence[PolicyRules]):
+        self.policies: Tuple[PolicyRules, ...] = tuple(policies)
+        prohibited: Dict[str, Set[int]] = {}
+        triggers: Dict[str, Set[int]] = {}
+        patterns: List[RedactionPattern] = []
+        self._always_disclose: List[int] = []
+        for index, policy in enumerate(self.policies):
+            for phrase in policy.prohibited:
+                prohibited.setdefault(phrase, set()).add(index)
+            for pattern in policy.patterns:
+                patterns.append(RedactionPattern(rule_id=str(index), type="policy", pattern=pattern))
+            if policy.disclaimer:
+                if policy.triggers:
+                    for phrase in policy.triggers:
+                        triggers.setdefault(phrase, set()).add(index)
+                else:
+                    self._always_disclose.append(index)
+        self._prohibited = PhraseMatcher(prohibited)
+        self._phrase_width = max((len(phrase) for phrase in prohibited), default=0)
+        self._triggers = PhraseMatcher(triggers)
+        self._patterns = RedactionEngine(patterns) if patterns else None
+        self._limits = [
+            index for index, policy in enumerate(self.policies) if policy.max_length or policy.min_citations
+        ]
+
+    def __len__(self) -> int:
+        return len(self.policies)
+
+    def _content_violations(self, content: str, lowered: str) -> Iterator[Tuple[int, str]]:
+        """``(policy index, reason)`` for prohibited phrases and patterns in the text"""
+        for index in sorted(self._prohibited.find(lowered)):
+            yield index, "prohibited"
+        if self._patterns is not None:
+            for index in sorted({int(match.rule_id) for match in self._patterns.find(content)}):
+                yield index, "pattern"
+
+    def screen(self, content: str, intent: Optional[str] = None) -> List[str]:
+        """Reasons the text breaks a prohibited phrase or pattern; the checks that hold for part of a draft"""
+        reasons: List[str] = []
+        for index, reason in self._content_violations(content, content.lower()):
+            policy = self.policies[index]
+            if policy.covers(intent) and f"{reason}:{policy.id}" not in reasons:
+                reasons.append(f"{reason}:{policy.id}")
+        return reasons
+
+    def holdback(self, text: str, limit: int) -> int:
+        """Trailing characters of ``text`` that could still be the start of a prohibited phrase or pattern"""
+        # +1 for the character that shows the phrase's last word has ended
+        hold = min(self._phrase_width + 1, limit) if self._phrase_width else 0
+        if self._patterns is not None:
+            hold = max(hold, self._patterns.holdback(text, limit))
+        return min(hold, len(text))
+
+    def evaluate(self, content: str, citations: int = 0, intent: Optional[str] = None) -> PolicyEvaluation:
+        evaluation = PolicyEvaluation()
+        if not self.policies:
+            return evaluation
+
+        def violate(index: int, reason: str) -> None:
+            policy = self.policies[index]
+            if policy.covers(intent) and f"{reason}:{policy.id}" not in evaluation.reasons:
+                evaluation.reasons.append(f"{reason}:{policy.id}")
+                if policy.id not in evaluation.violated:
+                    evaluation.violated.append(policy.id)
+
+        lowered = content.lower()
+        for index, reason in self._content_violations(content, lowered):
+            violate(index, reason)
+        for index in self._limits:
+            policy = self.policies[index]
+            if policy.max_length and len(content) > policy.max_length:
+                violate(index, "max_length")
+            if citations < policy.min_citations:
+                violate(index, "citations")
+
+        if not evaluation.violated:
+            for index in sorted(set(self._always_disclose) | self._triggers.find(lowered)):
+                policy = self.policies[index]
+                disclaimer = policy.disclaimer
+                if policy.covers(intent) and disclaimer.lower() not in lowered and disclaimer not in evaluation.disclaimers:
+                    evaluation.disclaimers.append(disclaimer)
+        return evaluation
+
+
+class PolicySnapshot:
+    """A tenant's compiled policies for one jurisdiction, at one version
+
+    Snapshots are never modified once published. The effective and expiry
+    dates of the policies split time into segments with a fixed set of
+    policies in force; each segment's rule set is compiled on first use,
+    so evaluating as of any date costs one bisect.
+    """
+
+    def __init__(self, tenant_id: str, jurisdiction: str, version: str, policies: Iterable[PolicyRules]):
+        self.tenant_id = tenant_id
+        self.jurisdiction = jurisdiction
+        self.version = version
+        self.policies: Tuple[PolicyRules, ...] = tuple(policy for policy in policies if policy.applies_to(jurisdiction))
+        self.boundaries: List[datetime] = sorted({
+            date for policy in self.policies for date in (policy.effective_date, policy.expiry_date) if date is not None
+        })
+        self._segments: Dict[int, RuleSet] = {}
+
+    def rules(self, as_of: Optional[datetime] = None) -> RuleSet:
+        """Rule set in force at ``as_of``, now by default"""
+        as_of = _utc(as_of) or datetime.now(timezone.utc)
+        segment = bisect_right(self.boundaries, as_of)
+        rules = self._segments.get(segment)
+        if rules is None:
+            rules = self._segments[segment] = RuleSet([policy for policy in self.policies if policy.in_force(as_of)])
+        return rules
+
+
+@dataclass
+class _TenantPolicies:
+    fingerprint: Tuple[int, Optional[datetime]]
+    version: str
+    policies: List[PolicyRules]
+    checked_at: float
+    snapshots: Dict[str, PolicySnapshot] = field(default_factory=dict)
+
+    def snapshot(self, tenant_id: str, jurisdiction: str) -> PolicySnapshot:
+        snapshot = self.snapshots.get(jurisdiction)
+        if snapshot is None:
+            snapshot = self.snapshots[jurisdiction] = PolicySnapshot(tenant_id, jurisdiction, self.version, self.policies)
+        return snapshot
+
+
+class PolicyEngine:
+    """Per-tenant policy snapshots compiled from active Policy rows
+
+    A tenant's policies are parsed once and reused until its fingerprint
+    (active policy count and latest ``updated_at``) changes, rechecked at
+    most every ``POLICY_REFRESH_SECONDS``. A change is compiled off to the
+    side and swapped in with a single assignment, so checks in flight keep
+    the snapshot they started with. Listeners hear about every swap.
+    """
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        self.refresh_seconds = settings.POLICY_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._tenants: Dict[str, _TenantPolicies] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._listeners: List[Callable[[str], None]] = []
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """Register a callback invoked with the tenant id when its policies change"""
+        self._listeners.append(listener)
+
+    def _lock(self, tenant_id: str) -> asyncio.Lock:
+        lock = self._locks.get(tenant_id)
+        if lock is None:
+            lock = self._locks[tenant_id] = asyncio.Lock()
+        return lock
+
+    async def _fingerprint(self, db: AsyncSession, tenant_id: str) -> Tuple[int, Optional[datetime]]:
+        result = await db.execute(
+            select(func.count(Policy.id), func.max(func.coalesce(Policy.updated_at, Policy.created_at)))
+            .where(Policy.tenant_id == tenant_id, Policy.is_active.is_(True))
+        )
+        count, latest = result.one()
+        return int(count or 0), latest
+
+    async def _load(self, db: AsyncSession, tenant_id: str) -> Tuple[str, List[PolicyRules]]:
+        result = await db.execute(
+            select(Policy.id, Policy.type, Policy.content, Policy.effective_date, Policy.expiry_date)
+            .where(Policy.tenant_id == tenant_id, Policy.is_active.is_(True))
+            .order_by(Policy.created_at, Policy.id)
+        )
+        rows = result.all()
+        # Derived from content rather than a counter, so every worker agrees on the version
+        digest = hashlib.sha256()
+        for policy_id, policy_type, content, effective_date, expiry_date in rows:
+            digest.update(repr((policy_id, policy_type, content, effective_date, expiry_date)).encode())
+        policies = [parse_policy(*row) for row in rows]
+        return digest.hexdigest()[:16], policies
+
+    async def snapshot(self, tenant_id: str, jurisdiction: Optional[str] = None) -> PolicySnapshot:
+        """Current snapshot for a tenant and jurisdiction, recompiled only when its policies change
+
+        If the database cannot be reached the last snapshot is kept; the
+        error is raised only when there is none.
+        """
+        jurisdiction = (jurisdiction or settings.COMPLIANCE_JURISDICTION).upper()
+        compiled = self._tenants.get(tenant_id)
+        if compiled is not None and time.monotonic() - compiled.checked_at < self.refresh_seconds:
+            return compiled.snapshot(tenant_id, jurisdiction)
+
+        async with self._lock(tenant_id):
+            compiled = self._tenants.get(tenant_id)
+            now = time.monotonic()
+            if compiled is not None and now - compiled.checked_at < self.refresh_seconds:
+                return compiled.snapshot(tenant_id, jurisdiction)
+            try:
+                async with AsyncSessionLocal() as db:
+                    fingerprint = await self._fingerprint(db, tenant_id)
+                    if compiled is not None and compiled.fingerprint == fingerprint:
+                        compiled.checked_at = now
+                        return compiled.snapshot(tenant_id, jurisdiction)
+                    version, policies = await self._load(db, tenant_id)
+            except Exception as e:
+                if compiled is None:
+                    raise
+                logger.warning("Policy refresh failed, keeping last snapshot", tenant_id=tenant_id, error=str(e))
+                compiled.checked_at = now
+                return compiled.snapshot(tenant_id, jurisdiction)
+
+            if compiled is not None and compiled.version == version:
+                compiled.fingerprint, compiled.checked_at = fingerprint, now
+                return compiled.snapshot(tenant_id, jurisdiction)
+            fresh = _TenantPolicies(fingerprint, version, policies, now)
+            snapshot = fresh.snapshot(tenant_id, jurisdiction)
+            self._tenants[tenant_id] = fresh
+        logger.info("Policies compiled", tenant_id=tenant_id, version=version, policies=len(policies))
+        if compiled is not None:
+            for listener in self._listeners:
+                listener(tenant_id)
+        return snapshot
+
+    def cached(self, tenant_id: str, jurisdiction: Optional[str] = None) -> Optional[PolicySnapshot]:
+        """Last compiled snapshot without touching the database"""
+        compiled = self._tenants.get(tenant_id)
+        if compiled is None:
+            return None
+        return compiled.snapshot(tenant_id, (jurisdiction or settings.COMPLIANCE_JURISDICTION).upper())
+
+    def invalidate(self, tenant_id: str) -> None:
+        """Recheck the tenant's policies on the next lookup"""
+        compiled = self._tenants.get(tenant_id)
+        if compiled is not None:
+            compiled.checked_at = float("-inf")
+
+
+_policy_engine: Optional[PolicyEngine] = None
+
+
+def get_policy_engine() -> PolicyEngine:
+    """Return the process-wide policy engine"""
+    global _policy_engine
+    if _policy_engine is None:
+        _policy_engine = PolicyEngine()
+    return _policy_engine
@@ -0,0 +1,318 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import re
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Built-in detectors used when a tenant has not configured any rules
+DEFAULT_PATTERNS: List[Tuple[str, str, str]] = [
+    ("ssn", "ssn", r"\b\d{3}-\d{2}-\d{4}\b"),
+    ("credit_card", "credit_card", r"\b(?:\d[ -]?){12,15}\d\b"),
+    ("email", "email", r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b"),
+    ("phone", "phone", r"(?<!\d)(?:\+?1[ .-]?)?\(?\d{3}\)?[ .-]?\d{3}[ .-]?\d{4}(?!\d)"),
+    ("iban", "account_number", r"\b[A-Z]{2}\d{2}[A-Z0-9]{11,30}\b"),
+]
+
+# Types masked with last-4 logic so customers and agents can still tell accounts apart
+KEEP_LAST_FOUR = {"credit_card", "account_number"}
+
+# Leading global inline flags, e.g. "(?i)", which cannot appear mid-alternation
+_GLOBAL_FLAGS_RE = re.compile(r"^\(\?([aiLmsux]+)\)")
+# Constructs that depend on group numbering or names and would break when combined
+_UNCOMBINABLE_RE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(")
+
+
+@dataclass
+class RedactionPattern:
+    """One redaction rule in engine form"""
+    rule_id: str
+    type: str
+    pattern: str
+
+
+@dataclass
+class Redaction:
+    """A masked span in the original text"""
+    start: int
+    end: int
+    type: str
+    rule_id: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _scoped(pattern: str) -> str:
+    """Turn leading global flags into a scoped group so patterns can be joined"""
+    match = _GLOBAL_FLAGS_RE.match(pattern)
+    if match:
+        return f"(?{match.group(1)}:{pattern[match.end():]})"
+    return pattern
+
+
+def mask(value: str, redaction_type: str, mask_char: Optional[str] = None) -> str:
+    mask_char = mask_char or settings.PII_MASKING_CHAR
+    if redaction_type in KEEP_LAST_FOUR:
+        digits = [i for i, char in enumerate(value) if char.isdigit()]
+        keep = set(digits[-4:]) if len(digits) > 4 else set()
+        return "".join(char if i in keep or not char.isalnum() else mask_char for i, char in enumerate(value))
+    return mask_char * len(value)
+
+
+def required_literal(pattern: str) -> Optional[Tuple[str, bool]]:
+    """Longest literal every match must contain, and whether it is case-insensitive
+
+    Only literals in the top-level sequence are considered, which covers
+    the usual anchored rule shapes ("ACCT-\\d{8}", "@", "SSN:"). Returns None
+    when no usable literal exists; such rules are always run.
+    """
+    parsed = sre_parse.parse(pattern)
+    state = getattr(parsed, "state", None) or parsed.pattern
+    ignorecase = bool(state.flags & re.IGNORECASE)
+
+    best = ""
+    run: List[str] = []
+    for op, av in list(parsed) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if len(run) > len(best):
+            best = "".join(run)
+        run = []
+    if not best or (ignorecase and not best.isascii()):
+        return None
+    return (best.lower() if ignorecase else best), ignorecase
+
+
+_CATEGORY_CLASSES = {
+    sre_parse.CATEGORY_DIGIT: r"\d",
+    sre_parse.CATEGORY_WORD: r"\w",
+    sre_parse.CATEGORY_SPACE: r"\s",
+}
+
+
+def _collect_alphabet(items, out: List[str]) -> bool:
+    """Append class members for every character the pattern can consume"""
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            out.append(re.escape(chr(av)))
+        elif op is sre_parse.IN:
+            for member_op, member in av:
+                if member_op is sre_parse.LITERAL:
+                    out.append(re.escape(chr(member)))
+                elif member_op is sre_parse.RANGE:
+                    out.append(f"{re.escape(chr(member[0]))}-{re.escape(chr(member[1]))}")
+                elif member_op is sre_parse.CATEGORY and member in _CATEGORY_CLASSES:
+                    out.append(_CATEGORY_CLASSES[member])
+                else:
+                    return False  # negated sets and categories
+        elif op is sre_parse.SUBPATTERN:
+            if not _collect_alphabet(av[-1], out):
+                return False
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT":
+            if not _collect_alphabet(av[2], out):
+                return False
+        elif op is sre_parse.BRANCH:
+            if not all(_collect_alphabet(branch, out) for branch in av[1]):
+                return False
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) or op.name == "ATOMIC_GROUP":
+            if not _collect_alphabet(av[1] if isinstance(av, tuple) else av, out):
+                return False
+        elif op is sre_parse.GROUPREF_EXISTS:
+            if not all(_collect_alphabet(branch, out) for branch in av[1:] if branch is not None):
+                return False
+        elif op in (sre_parse.AT, sre_parse.GROUPREF):
+            continue
+        else:
+            return False  # ANY, NOT_LITERAL and anything unrecognised
+    return True
+
+
+def alphabet_run(pattern: str) -> Optional[re.Pattern]:
+    """Matcher for a run of characters the pattern could consume
+
+    None when the pattern can consume arbitrary characters (``.``,
+    negated classes). Case-insensitive flags anywhere widen the whole set.
+    """
+    members: List[str] = []
+    if not _collect_alphabet(sre_parse.parse(pattern), members) or not members:
+        return None
+    flags = re.IGNORECASE if re.search(r"\(\?[aLmsux]*i", pattern) else 0
+    return re.compile(f"[{''.join(dict.fromkeys(members))}]*", flags)
+
+
+class RedactionEngine:
+    """All of a tenant's redaction rules compiled into one matcher
+
+    Rules are joined into a single alternation with one named group per
+    rule, so a message is scanned once regardless of how many rules the
+    tenant has. Rules with a required literal anchor only join the
+    alternation for messages that contain the anchor; the matcher for each
+    combination of present anchors is compiled once and reused. Patterns
+    that rely on group numbering or names cannot be joined safely and are
+    run separately after the combined pass.
+    """
+
+    MATCHER_CACHE_SIZE = 256
+
+    def __init__(self, patterns: Sequence[RedactionPattern], mask_char: Optional[str] = None):
+        self.mask_char = mask_char or settings.PII_MASKING_CHAR
+        self._groups: Dict[str, RedactionPattern] = {}
+        self._order: Dict[str, int] = {}
+        self._always: List[str] = []
+        self._anchored: List[Tuple[str, bool, str]] = []  # (literal, ignorecase, group name)
+        self._separate: List[Tuple[re.Pattern, RedactionPattern]] = []
+        self._matchers: Dict[Tuple[str, ...], Optional[re.Pattern]] = {}
+
+        for i, rule in enumerate(patterns):
+            try:
+                compiled = re.compile(rule.pattern)
+            except re.error as e:
+                logger.warning("Skipping invalid redaction rule", rule_id=rule.rule_id, error=str(e))
+                continue
+            if _UNCOMBINABLE_RE.search(rule.pattern):
+                self._separate.append((compiled, rule))
+                continue
+            name = f"r{i}"
+            self._groups[name] = rule
+            self._order[name] = i
+            anchor = required_literal(rule.pattern)
+            if anchor is None:
+                self._always.append(name)
+            else:
+                self._anchored.append((anchor[0], anchor[1], name))
+
+        # Per character alphabet, the longest match any rule over it can produce
+        tails: Dict[Optional[str], Tuple[Optional[re.Pattern], Optional[int]]] = {}
+        for rule in list(self._groups.values()) + [rule for _, rule in self._separate]:
+            run = alphabet_run(rule.pattern)
+            high = sre_parse.parse(rule.pattern).getwidth()[1]
+            width = None if high >= sre_parse.MAXREPEAT else high
+            key = run.pattern if run is not None else None
+            if key in tails:
+                previous = tails[key][1]
+                width = None if previous is None or width is None else max(previous, width)
+            tails[key] = (run, width)
+        self._tails = list(tails.values())
+
+    @property
+    def rule_count(self) -> int:
+        return len(self._groups) + len(self._separate)
+
+    def holdback(self, text: str, limit: int) -> int:
+        """How many trailing characters could still be part of an unfinished match
+
+        A match that is still growing at the end of ``text`` must lie in the
+        trailing run of characters its rule can consume, and can be no
+        longer than the rule's maximum width. The result is capped at ``limit``.
+        """
+        if limit <= 0 or not self._tails:
+            return 0
+        reversed_tail = text[-limit:][::-1]
+        hold = 0
+        for run, width in self._tails:
+            bound = limit if width is None else min(width, limit)
+            if run is not None:
+                bound = min(bound, run.match(reversed_tail).end())
+            hold = max(hold, bound)
+            if hold >= limit:
+                break
+        return hold
+
+    def _matcher(self, text: str) -> Optional[re.Pattern]:
+        """Combined matcher for the rules that can possibly match this text"""
+        names = self._always
+        if self._anchored:
+            lowered = None
+            present = []
+            for literal, ignorecase, name in self._anchored:
+                if ignorecase:
+                    if lowered is None:
+                        lowered = text.lower()
+                    if literal in lowered:
+                        present.append(name)
+                elif literal in text:
+                    present.append(name)
+            if present:
+                names = sorted(self._always + present, key=self._order.__getitem__)
+
+        key = tuple(names)
+        try:
+            return self._matchers[key]
+        except KeyError:
+            pass
+        matcher = None
+        if names:
+            matcher = re.compile("|".join(f"(?P<{name}>{_scoped(self._groups[name].pattern)})" for name in names))
+        if len(self._matchers) >= self.MATCHER_CACHE_SIZE:
+            self._matchers.clear()
+        self._matchers[key] = matcher
+        return matcher
+
+    def find(self, text: str, pos: int = 0) -> List[Redaction]:
+        """Non-overlapping spans to redact at or after ``pos``, in text order
+
+        Text before ``pos`` is not redacted but is still visible to ``\\b``
+        and lookbehind assertions.
+        """
+        spans: List[Redaction] = []
+        matcher = self._matcher(text)
+        if matcher is not None:
+            for match in matcher.finditer(text, pos):
+                if match.end() == match.start():
+                    continue
+                rule = self._groups[match.lastgroup]
+                spans.append(Redaction(match.start(), match.end(), rule.type, rule.rule_id))
+
+        if self._separate:
+            for compiled, rule in self._separate:
+                for match in compiled.finditer(text, pos):
+                    if match.end() > match.start():
+                        spans.append(Redaction(match.start(), match.end(), rule.type, rule.rule_id))
+            spans = self._merge(spans)
+        return spans
+
+    @staticmethod
+    def _merge(spans: List[Redaction]) -> List[Redaction]:
+        """Drop spans overlapping an earlier, longer-or-equal span"""
+        spans.sort(key=lambda span: (span.start, -(span.end - span.start)))
+        merged: List[Redaction] = []
+        for span in spans:
+            if merged and span.start < merged[-1].end:
+                continue
+            merged.append(span)
+        return merged
+
+    def apply(self, text: str, spans: Sequence[Redaction]) -> str:
+        if not spans:
+            return text
+        parts: List[str] = []
+        cursor = 0
+        for span in spans:
+            parts.append(text[cursor:span.start])
+            parts.append(mask(text[span.start:span.end], span.type, self.mask_char))
+            cursor = span.end
+        parts.append(text[cursor:])
+        return "".join(parts)
+
+    def redact(self, text: str) -> Tuple[str, List[Redaction]]:
+        """Masked text and the spans that were masked"""
+        spans = self.find(text)
+        return self.apply(text, spans), spans
+
+
+def default_patterns() -> List[RedactionPattern]:
+    return [RedactionPattern(rule_id=f"builtin:{name}", type=kind, pattern=pattern) for name, kind, pattern in DEFAULT_PATTERNS]
+
+
+def naive_redact(patterns: Sequence[RedactionPattern], text: str, mask_char: str = "*") -> str:
+    """Reference implementation: one regex pass per rule, used for benchmarking"""
+    for rule in patterns:
+        text = re.sub(rule.pattern, lambda match: mask(match.group(0), rule.type, mask_char), text)
+    return text
@@ -0,0 +1,170 @@
+from typing import AsyncIterator, List, Optional
+from app.core.config import settings
+from app.services.compliance.policy_engine import RuleSet
+from app.services.compliance.redaction import Redaction, RedactionEngine, mask
+
+
+class StreamingRedactor:
+    """Incremental redaction over a stream of text chunks
+
+    Text is released as soon as no rule can still match across the end of
+    what has been received: only the trailing run of characters some rule
+    could still be consuming is held back (see ``RedactionEngine.holdback``),
+    never more than ``lookahead`` characters. Span offsets in
+    ``redactions`` are positions in the full stream.
+    """
+
+    # Characters kept before the scan point so \b and lookbehinds see real context
+    CONTEXT = 16
+
+    def __init__(self, engine: RedactionEngine, lookahead: Optional[int] = None):
+        self.engine = engine
+        self.lookahead = settings.REDACTION_STREAM_LOOKAHEAD if lookahead is None else lookahead
+        self.redactions: List[Redaction] = []
+        self._buffer = ""
+        self._pos = 0  # index in the buffer up to which text has been released
+        self._base = 0  # stream offset of buffer[0]
+        self._finished = False
+
+    @property
+    def pending(self) -> int:
+        """Characters received but not yet released"""
+        return len(self._buffer) - self._pos
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return whatever text is now safe to emit"""
+        if self._finished:
+            raise RuntimeError("StreamingRedactor already finished")
+        if not chunk:
+            return ""
+        self._buffer += chunk
+        return self._release(len(self._buffer) - self.engine.holdback(self._buffer, self.lookahead))
+
+    def finish(self) -> str:
+        """Flush the held-back tail at the end of the stream"""
+        if self._finished:
+            return ""
+        self._finished = True
+        return self._release(len(self._buffer))
+
+    def _release(self, cut: int) -> str:
+        if cut <= self._pos:
+            return ""
+        end = cut
+        parts: List[str] = []
+        cursor = self._pos
+        for span in self.engine.find(self._buffer, self._pos):
+            if span.start >= cut:
+                break
+            # A match starting before the cut is complete; release all of it
+            parts.append(self._buffer[cursor:span.start])
+            parts.append(mask(self._buffer[span.start:span.end], span.type, self.engine.mask_char))
+            cursor = span.end
+            end = max(end, span.end)
+            self.redactions.append(Redaction(self._base + span.start, self._base + span.end, span.type, span.rule_id))
+        parts.append(self._buffer[cursor:end])
+
+        keep = max(0, end - self.CONTEXT)
+        self._buffer = self._buffer[keep:]
+        self._base += keep
+        self._pos = end - keep
+        return "".join(parts)
+
+
+class StreamingGuard:
+    """Prohibited-phrase and policy-pattern screening over a stream of text chunks
+
+    Text is released only once no prohibited phrase or pattern can still be
+    completing at its end (see ``RuleSet.holdback``), so a violation is
+    caught before any of it reaches the customer. After a hit the guard
+    releases nothing more and ``violations`` holds the reasons; ``text`` is
+    everything received, for the full compliance check that follows.
+    """
+
+    def __init__(self, rules: RuleSet, intent: Optional[str] = None, lookahead: Optional[int] = None):
+        self.rules = rules
+        self.intent = intent
+        self.lookahead = settings.REDACTION_STREAM_LOOKAHEAD if lookahead is None else lookahead
+        self.violations: List[str] = []
+        self.text = ""
+        self._released = 0
+        self._scanned = 0  # end of the text screened so far
+
+    @property
+    def tripped(self) -> bool:
+        return bool(self.violations)
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return whatever text is now safe to emit"""
+        if self.tripped or not chunk:
+            return ""
+        self.text += chunk
+        # A word still being streamed is not screened yet: "guarantee" may become "guaranteed"
+        end = len(self.text)
+        while end > self._scanned and _word_char(self.text[end - 1]):
+            end -= 1
+        if not self._scan(end):
+            return ""
+        return self._release(min(end, len(self.text) - self.rules.holdback(self.text, self.lookahead)))
+
+    def finish(self) -> str:
+        """Flush the held-back tail at the end of the stream, unless it breaks a policy"""
+        if self.tripped or not self._scan(len(self.text)):
+            return ""
+        return self._release(len(self.text))
+
+    def _scan(self, end: int) -> bool:
+        if end <= self._scanned:
+            return True
+        # A new match ends past the last scan, so it starts at most ``lookahead`` before it;
+        # the window opens on a word boundary so a word's tail is never taken for a whole word
+        start = max(0, self._scanned - self.lookahead)
+        while start > 0 and _word_char(self.text[start - 1]):
+            start -= 1
+        self._scanned = end
+        self.violations = self.rules.screen(self.text[start:end], self.intent)
+        return not self.violations
+
+    def _release(self, cut: int) -> str:
+        if cut <= self._released:
+            return ""
+        safe = self.text[self._released:cut]
+        self._released = cut
+        return safe
+
+
+def _word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+async def redact_stream(chunks: AsyncIterator[str], redactor: StreamingRedactor) -> AsyncIterator[str]:
+    """Wrap a token stream so only masked text is yielded"""
+    try:
+        async for chunk in chunks:
+            safe = redactor.feed(chunk)
+            if safe:
+                yield safe
+        tail = redactor.finish()
+        if tail:
+            yield tail
+    finally:
+        await chunks.aclose()
+
+
+async def guard_stream(chunks: AsyncIterator[str], guard: StreamingGuard) -> AsyncIterator[str]:
+    """Wrap a token stream so only policy-screened text is yielded; it ends early on a violation
+
+    The source is closed on a violation, which stops generation.
+    """
+    try:
+        async for chunk in chunks:
+            safe = guard.feed(chunk)
+            if safe:
+                yield safe
+            if guard.tripped:
+                return
+        tail = guard.finish()
+        if tail:
+            yield tail
+    finally:
+        await chunks.aclose()
@@ -0,0 +1,551 @@
+"""Streaming, audited transcript export
+
+A transcript is the session header, every message (with its thread
+position, citations and redactions) in order, the session's audit events
+and a summary carrying the audit chain head. Messages are read through a
+server-side cursor and re-redacted with the tenant's current rules as
+they stream, so memory does not grow with transcript length and content
+stored before a rule existed is still masked.
+
+Bulk exports for regulatory requests run as jobs that write one file per
+session to ``EXPORT_DIR`` with bounded concurrency, outside the request:
+
+    python -m app.services.compliance.transcript bulk --format csv --sessions-file ids.txt
+"""
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+import argparse
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import uuid
+import zipfile
+import aiofiles
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logging import get_logger, setup_logging
+from app.models.audit import Audit
+from app.models.customer import Customer
+from app.models.message import Message
+from app.models.session import Session
+from app.models.thread import Thread
+from app.services.compliance.audit_store import AuditStore, get_audit_store
+from app.services.compliance.pii import PIIRedactionService, get_pii_service
+from app.services.compliance.redaction import RedactionEngine
+
+logger = get_logger(__name__)
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv", "pdf": "application/pdf"}
+EXTENSIONS = {"ndjson": "ndjson", "csv": "csv", "pdf": "pdf"}
+
+
+class TranscriptNotFoundError(Exception):
+    """Raised when an export targets an unknown session"""
+    pass
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _json(value: Optional[str]) -> Any:
+    return json.loads(value) if value else None
+
+
+def _details(value: Optional[str]) -> Any:
+    # Audit details are JSON; masking can in principle leave them unparseable
+    try:
+        return _json(value)
+    except ValueError:
+        return value
+
+
+class TranscriptExporter:
+    """Yields a session's transcript as records, then as NDJSON, CSV or PDF bytes"""
+
+    def __init__(self, pii_service: Optional[PIIRedactionService] = None, audit_store: Optional[AuditStore] = None):
+        self.pii_service = pii_service or get_pii_service()
+        self.audit_store = audit_store if audit_store is not None else get_audit_store()
+        self.fetch_size = settings.EXPORT_FETCH_SIZE
+
+    async def header(self, db: AsyncSession, session_id: str) -> Dict[str, Any]:
+        """Session fields for the transcript header; raises TranscriptNotFoundError"""
+        row = (await db.execute(
+            select(
+                Session.id, Session.status, Session.channel, Session.agent_id, Session.escalation_reason,
+                Session.created_at, Session.ended_at, Customer.id, Customer.tenant_id,
+            ).join(Customer, Customer.id == Session.customer_id).where(Session.id == session_id)
+        )).one_or_none()
+        if row is None:
+            raise TranscriptNotFoundError(session_id)
+        return {
+            "kind": "session",
+            "session_id": row[0],
+            "status": row[1],
+            "channel": row[2],
+            "agent_id": row[3],
+            "escalation_reason": row[4],
+            "created_at": _iso(row[5]),
+            "ended_at": _iso(row[6]),
+            "customer_id": row[7],
+            "tenant_id": row[8],
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def _redact(self, engine: Optional[RedactionEngine], text: Optional[str]) -> tuple:
+        if engine is None or not text:
+            return text, []
+        return engine.redact(text)
+
+    async def records(self, db: AsyncSession, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Header, messages, audit events and summary, one dict at a time"""
+        header = await self.header(db, session_id)
+        yield header
+        engine = await self.pii_service.get_engine(db, header["tenant_id"]) if settings.PII_REDACTION_ENABLED else None
+
+        messages = masked = 0
+        rows = await db.stream(
+            select(
+                Message.id, Message.created_at, Message.message_type, Message.status, Message.content,
+                Message.confidence, Message.intent, Message.citations, Message.redactions,
+                Thread.parent_message_id, Thread.thread_order,
+            )
+            .outerjoin(Thread, Thread.message_id == Message.id)
+            .where(Message.session_id == session_id)
+            .order_by(Message.created_at, Message.id)
+            .execution_options(yield_per=self.fetch_size)
+        )
+        async for row in rows:
+            content, spans = self._redact(engine, row.content)
+            messages += 1
+            masked += len(spans)
+            yield {
+                "kind": "message",
+                "id": row.id,
+                "created_at": _iso(row.created_at),
+                "message_type": row.message_type,
+                "status": row.status,
+                "content": content,
+                "confidence": row.confidence,
+                "intent": row.intent,
+                "citations": _json(row.citations) or [],
+                # Redactions made at write time, then any the current rules add
+                "redactions": (_json(row.redactions) or []) + [span.to_dict() for span in spans],
+                "parent_message_id": row.parent_message_id,
+                "thread_order": row.thread_order,
+            }
+
+        events = 0
+        async for event in self._audit_events(db, session_id):
+            details, spans = self._redact(engine, event.get("details"))
+            events += 1
+            masked += len(spans)
+            yield {
+                "kind": "audit",
+                "seq": event.get("seq"),
+                "id": event["id"],
+                "created_at": event["created_at"],
+                "event_type": event["event_type"],
+                "user_id": event.get("user_id"),
+                "details": _details(details),
+            }
+
+        head_seq, head_hash = self.audit_store.head() if self.audit_store is not None else (None, None)
+        yield {
+            "kind": "summary",
+            "messages": messages,
+            "audit_events": events,
+            "redactions_applied": masked,
+            "audit_head_seq": head_seq,
+            "audit_head_hash": head_hash,
+        }
+
+    async def _audit_events(self, db: AsyncSession, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        if self.audit_store is not None:
+            # The chained store is the record of truth; read it a chunk at a time off the event loop
+            events = self.audit_store.query(session_id=session_id)
+            while True:
+                chunk = await asyncio.to_thread(lambda: [event for _, event in zip(range(self.fetch_size), events)])
+                for event in chunk:
+                    yield event
+                if len(chunk) < self.fetch_size:
+                    return
+        rows = await db.stream(
+            select(Audit.id, Audit.event_type, Audit.user_id, Audit.details, Audit.created_at)
+            .where(Audit.session_id == session_id)
+            .order_by(Audit.created_at, Audit.id)
+            .execution_options(yield_per=self.fetch_size)
+        )
+        async for row in rows:
+            yield {
+                "id": row.id,
+                "event_type": row.event_type,
+                "user_id": row.user_id,
+                "details": row.details,
+                "created_at": _iso(row.created_at),
+            }
+
+    def export(self, db: AsyncSession, session_id: str, fmt: str) -> AsyncIterator[bytes]:
+        """Transcript bytes in ``fmt``; check the session exists with ``header`` first"""
+        records = self.records(db, session_id)
+        if fmt == "ndjson":
+            return ndjson(records)
+        if fmt == "csv":
+            return csv_chunks(records)
+        if fmt == "pdf":
+            return pdf_chunks(records, f"Transcript {session_id}")
+        raise ValueError(f"Unknown export format {fmt}")
+
+
+# Formatters; each holds at most one record (or one PDF page) at a time
+
+async def ndjson(records: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for record in records:
+        yield (json.dumps(record, ensure_ascii=False) + "\n").encode()
+
+
+CSV_COLUMNS = ["kind", "id", "seq", "created_at", "message_type", "event_type", "user_id", "content", "redactions", "citations", "confidence"]
+
+
+async def csv_chunks(records: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    async for record in records:
+        if record["kind"] in ("session", "summary"):
+            row = [record["kind"], record.get("session_id"), None, record.get("created_at"), None, None, None,
+                   json.dumps({key: value for key, value in record.items() if key != "kind"}), None, None, None]
+        else:
+            details = record.get("details")
+            row = [
+                record["kind"], record["id"], record.get("seq"), record["created_at"], record.get("message_type"),
+                record.get("event_type"), record.get("user_id"),
+                record.get("content") if record["kind"] == "message" else (details if isinstance(details, str) or details is None else json.dumps(details)),
+                json.dumps(record["redactions"]) if record.get("redactions") else None,
+                json.dumps(record["citations"]) if record.get("citations") else None,
+                record.get("confidence"),
+            ]
+        writer.writerow(row)
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _transcript_lines(record: Dict[str, Any]) -> List[str]:
+    kind = record["kind"]
+    if kind == "session":
+        return [
+            f"Session {record['session_id']} ({record['channel']}, {record['status']})",
+            f"Tenant {record['tenant_id']}  Customer {record['customer_id']}",
+            f"Started {record['created_at']}  Ended {record['ended_at'] or '-'}  Exported {record['exported_at']}",
+            "",
+        ]
+    if kind == "message":
+        lines = [f"[{record['created_at']}] {record['message_type'].upper()}:"]
+        lines.extend(f"    {line}" for line in (record["content"] or "").splitlines() or [""])
+        if record["redactions"]:
+            lines.append(f"    ({len(record['redactions'])} redaction(s))")
+        return lines
+    if kind == "audit":
+        return [f"[{record['created_at']}] AUDIT #{record.get('seq') or '-'} {record['event_type']} {record.get('user_id') or ''}".rstrip()]
+    return [
+        "",
+        f"{record['messages']} messages, {record['audit_events']} audit events, {record['redactions_applied']} redactions applied at export",
+        f"Audit chain head #{record['audit_head_seq']} {record['audit_head_hash']}",
+    ]
+
+
+class _PdfWriter:
+    """Minimal PDF 1.4 writer that emits each page as soon as it is full
+
+    Only object byte offsets and page ids are kept, so memory stays flat
+    however long the transcript is. Text uses the built-in Helvetica
+    font; characters outside Latin-1 are replaced.
+    """
+
+    PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+    MARGIN, FONT_SIZE, LEADING = 40, 9, 11
+    LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+    WRAP = 110
+
+    def __init__(self, title: str):
+        self.title = title
+        self.offset = 0
+        self.offsets: Dict[int, int] = {}
+        self.pages: List[int] = []
+        self.next_id = 4  # 1 catalog, 2 page tree, 3 font
+
+    def _object(self, object_id: int, body: bytes) -> bytes:
+        self.offsets[object_id] = self.offset
+        data = f"{object_id} 0 obj\n".encode() + body + b"\nendobj\n"
+        self.offset += len(data)
+        return data
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def start(self) -> bytes:
+        header = self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        return header + self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    @staticmethod
+    def _escape(line: str) -> bytes:
+        encoded = line.encode("latin-1", errors="replace")
+        return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+    def wrap(self, lines: Sequence[str]) -> Iterator[str]:
+        for line in lines:
+            line = line.replace("\t", "    ").replace("\r", "")
+            while len(line) > self.WRAP:
+                yield line[:self.WRAP]
+                line = "    " + line[self.WRAP:]
+            yield line
+
+    def page(self, lines: Sequence[str]) -> bytes:
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.pages.append(page_id)
+        top = self.PAGE_HEIGHT - self.MARGIN
+        stream = b"BT /F1 %d Tf %d TL %d %d Td " % (self.FONT_SIZE, self.LEADING, self.MARGIN, top)
+        stream += b"".join(b"(" + self._escape(line) + b") Tj T* " for line in lines)
+        footer = f"{self.title} - page {len(self.pages)}"
+        stream += b"ET BT /F1 7 Tf %d %d Td (" % (self.MARGIN, self.MARGIN // 2) + self._escape(footer) + b") Tj ET"
+        content = self._object(content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        return content + self._object(
+            page_id,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (self.PAGE_WIDTH, self.PAGE_HEIGHT, content_id),
+        )
+
+    def finish(self) -> bytes:
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.pages)
+        data = self._object(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self.pages))
+        data += self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.offset
+        count = self.next_id
+        xref = [b"xref\n0 %d\n" % count, b"0000000000 65535 f \n"]
+        xref.extend(
+            b"%010d 00000 n \n" % self.offsets[object_id] if object_id in self.offsets else b"0000000000 65535 f \n"
+            for object_id in range(1, count)
+        )
+        trailer = b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref_offset)
+        return data + b"".join(xref) + trailer
+
+
+async def pdf_chunks(records: AsyncIterator[Dict[str, Any]], title: str) -> AsyncIterator[bytes]:
+    writer = _PdfWriter(title)
+    yield writer.start()
+    lines: List[str] = []
+    async for record in records:
+        lines.extend(writer.wrap(_transcript_lines(record)))
+        while len(lines) >= writer.LINES_PER_PAGE:
+            yield writer.page(lines[:writer.LINES_PER_PAGE])
+            lines = lines[writer.LINES_PER_PAGE:]
+    if lines or not writer.pages:
+        yield writer.page(lines)
+    yield writer.finish()
+
+
+async def stream_transcript(
+    session_id: str, fmt: str, exporter: Optional["TranscriptExporter"] = None
+) -> AsyncIterator[bytes]:
+    """Export bytes from a database session held only while the transcript streams"""
+    exporter = exporter or get_transcript_exporter()
+    async with AsyncSessionLocal() as db:
+        async for chunk in exporter.export(db, session_id, fmt):
+            yield chunk
+
+
+# Bulk export jobs
+
+class BulkExport:
+    """Writes many transcripts to ``EXPORT_DIR/<job_id>`` with bounded concurrency
+
+    Each session streams through its own database connection straight to
+    disk, so the worker never holds more than ``EXPORT_CONCURRENCY``
+    transcripts' current records. Progress lives in ``status.json`` next
+    to the files, so any worker can report on or serve a job.
+    """
+
+    def __init__(self, job_id: str, fmt: str, exporter: Optional[TranscriptExporter] = None):
+        self.job_id = job_id
+        self.format = fmt
+        self.exporter = exporter or get_transcript_exporter()
+        self.directory = job_directory(job_id)
+        self.status: Dict[str, Any] = {}
+
+    @classmethod
+    def create(cls, session_ids: Sequence[str], fmt: str, tenant_id: Optional[str] = None) -> "BulkExport":
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt}")
+        job = cls(uuid.uuid4().hex, fmt)
+        os.makedirs(job.directory, exist_ok=True)
+        job.status = {
+            "job_id": job.job_id,
+            "tenant_id": tenant_id,
+            "format": fmt,
+            "state": "pending",
+            "sessions": len(session_ids),
+            "completed": 0,
+            "failed": [],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+        }
+        with open(os.path.join(job.directory, "sessions.txt"), "w") as f:
+            f.writelines(f"{session_id}\n" for session_id in session_ids)
+        job._save()
+        return job
+
+    def _save(self) -> None:
+        path = os.path.join(self.directory, "status.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.status, f)
+        os.replace(path + ".tmp", path)
+
+    def _session_ids(self) -> Iterator[str]:
+        with open(os.path.join(self.directory, "sessions.txt")) as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+    async def _export_one(self, session_id: str, checksums: Any) -> None:
+        name = f"{session_id}.{EXTENSIONS[self.format]}"
+        path = os.path.join(self.directory, name)
+        digest = hashlib.sha256()
+        try:
+            async with aiofiles.open(path + ".part", "wb") as f:
+                async for chunk in stream_transcript(session_id, self.format, self.exporter):
+                    digest.update(chunk)
+                    await f.write(chunk)
+            os.replace(path + ".part", path)
+            await checksums.write(f"{digest.hexdigest()}  {name}\n")
+            self.status["completed"] += 1
+        except Exception as e:
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+            self.status["failed"].append({"session_id": session_id, "error": str(e)})
+            logger.warning("Transcript export failed", job_id=self.job_id, session_id=session_id, error=str(e))
+
+    async def run(self, concurrency: Optional[int] = None) -> Dict[str, Any]:
+        concurrency = concurrency or settings.EXPORT_CONCURRENCY
+        self.status["state"] = "running"
+        self._save()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+        async with aiofiles.open(os.path.join(self.directory, "SHA256SUMS"), "a") as checksums:
+            async def work() -> None:
+                while True:
+                    session_id = await queue.get()
+                    if session_id is None:
+                        return
+                    await self._export_one(session_id, checksums)
+                    if self.status["completed"] % 50 == 0:
+                        self._save()
+
+            workers = [asyncio.create_task(work()) for _ in range(concurrency)]
+            for session_id in self._session_ids():
+                await queue.put(session_id)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+        self.status["state"] = "completed"
+        self.status["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self._save()
+        logger.info("Bulk export finished", job_id=self.job_id, completed=self.status["completed"], failed=len(self.status["failed"]))
+        return self.status
+
+
+def job_directory(job_id: str) -> str:
+    if not job_id.isalnum():
+        raise ValueError("Invalid export job id")
+    return os.path.join(settings.EXPORT_DIR, job_id)
+
+
+def job_status(job_id: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(job_directory(job_id), "status.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable sink zipfile writes into; the zip generator drains it between chunks"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def zip_job(job_id: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """A finished job's files as a zip, built on the fly one chunk at a time"""
+    directory = job_directory(job_id)
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith((".part", ".tmp")) or name == "sessions.txt":
+                continue
+            with open(os.path.join(directory, name), "rb") as source, archive.open(name, "w", force_zip64=True) as target:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+_exporter: Optional[TranscriptExporter] = None
+
+
+def get_transcript_exporter() -> TranscriptExporter:
+    """Return the process-wide transcript exporter"""
+    global _exporter
+    if _exporter is None:
+        _exporter = TranscriptExporter()
+    return _exporter
+
+
+async def _bulk(args: argparse.Namespace) -> None:
+    with open(args.sessions_file) as f:
+        session_ids = [line.strip() for line in f if line.strip()]
+    job = BulkExport.create(session_ids, args.format)
+    print(f"Exporting {len(session_ids)} sessions to {job.directory}")
+    status = await job.run(concurrency=args.concurrency)
+    print(f"Done: {status['completed']} exported, {len(status['failed'])} failed")
+
+
+def main() -> None:
+    setup_logging()
+    parser = argparse.ArgumentParser(description="HeliosCS transcript export")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bulk = commands.add_parser("bulk", help="Export many sessions to EXPORT_DIR")
+    bulk.add_argument("--sessions-file", required=True, help="One session id per line")
+    bulk.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    bulk.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(_bulk(args))
+
+
+if __name__ == "__main__":
+    main()
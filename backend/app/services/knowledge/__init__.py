@@ -0,0 +1,30 @@
+# Knowledge management services
+
+from .vector_index import VectorIndex, IndexStats
+from .embedding_codec import encode_embedding, decode_embedding, embedding_view, EmbeddingCodecError
+from .bm25 import BM25Index, tokenize
+from .hybrid import SourceInfo, reciprocal_rank_fusion
+from .ingestion import DocumentProcessor, IngestDocument, IngestionReport, SourceChanges, detect_kind
+from .search import SearchService, SearchHit, TenantIndex, get_search_service
+
+__all__ = [
+    "VectorIndex",
+    "IndexStats",
+    "encode_embedding",
+    "decode_embedding",
+    "embedding_view",
+    "EmbeddingCodecError",
+    "BM25Index",
+    "tokenize",
+    "SourceInfo",
+    "reciprocal_rank_fusion",
+    "DocumentProcessor",
+    "IngestDocument",
+    "IngestionReport",
+    "SourceChanges",
+    "detect_kind",
+    "SearchService",
+    "TenantIndex",
+    "SearchHit",
+    "get_search_service",
+]
@@ -0,0 +1,162 @@
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import re
+import numpy as np
+
+# Keep account codes, fee identifiers and product names such as "ACH-202",
+# "fee_wire_intl" or "v2.1" as whole tokens, and also index their parts.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-_./]")
+
+_MAX_TF = 65535
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, with compound identifiers also split into parts"""
+    tokens: List[str] = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _SPLIT_RE.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """Incremental in-memory BM25 inverted index over chunk text
+
+    Postings are kept per term as parallel compact arrays of document
+    slots (uint32) and term frequencies (uint16), appended in slot order.
+    Removed documents are tombstoned and their document frequencies
+    released immediately; ``compact`` rewrites the postings once the
+    tombstones pile up.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._vocab: Dict[str, int] = {}
+        self._postings_docs: List[array] = []
+        self._postings_tfs: List[array] = []
+        self._df: List[int] = []
+
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_len = array("I")
+        self._doc_terms: List[Optional[array]] = []
+        self._live = bytearray()
+        self._slot_of: Dict[str, int] = {}
+        self._total_len = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._slot_of
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self._dead > 1024 and self._dead > len(self._doc_ids) // 4
+
+    def add(self, chunk_id: str, text: str) -> None:
+        """Index a chunk, replacing any earlier version with the same id"""
+        self.remove(chunk_id)
+        counts = Counter(tokenize(text))
+        slot = len(self._doc_ids)
+
+        term_ids = array("I")
+        for term, tf in counts.items():
+            term_id = self._vocab.get(term)
+            if term_id is None:
+                term_id = self._vocab[term] = len(self._df)
+                self._postings_docs.append(array("I"))
+                self._postings_tfs.append(array("H"))
+                self._df.append(0)
+            self._postings_docs[term_id].append(slot)
+            self._postings_tfs[term_id].append(min(tf, _MAX_TF))
+            self._df[term_id] += 1
+            term_ids.append(term_id)
+
+        length = sum(counts.values())
+        self._doc_ids.append(chunk_id)
+        self._doc_len.append(length)
+        self._doc_terms.append(term_ids)
+        self._live.append(1)
+        self._slot_of[chunk_id] = slot
+        self._total_len += length
+
+    def add_many(self, docs: Iterable[Tuple[str, str]]) -> None:
+        for chunk_id, text in docs:
+            self.add(chunk_id, text)
+
+    def remove(self, chunk_id: str) -> bool:
+        """Tombstone a chunk; returns False if it was not indexed"""
+        slot = self._slot_of.pop(chunk_id, None)
+        if slot is None:
+            return False
+        for term_id in self._doc_terms[slot]:
+            self._df[term_id] -= 1
+        self._live[slot] = 0
+        self._total_len -= self._doc_len[slot]
+        self._doc_terms[slot] = None
+        self._doc_ids[slot] = None
+        self._dead += 1
+        return True
+
+    def remove_many(self, chunk_ids: Sequence[str]) -> int:
+        return sum(1 for chunk_id in chunk_ids if self.remove(chunk_id))
+
+    def compact(self) -> None:
+        """Drop tombstoned slots and renumber postings"""
+        remap = np.full(len(self._doc_ids), -1, dtype=np.int64)
+        live_slots = [slot for slot in range(len(self._doc_ids)) if self._live[slot]]
+        remap[live_slots] = np.arange(len(live_slots))
+
+        for term_id in range(len(self._df)):
+            docs = np.frombuffer(self._postings_docs[term_id], dtype=np.uint32)
+            tfs = np.frombuffer(self._postings_tfs[term_id], dtype=np.uint16)
+            keep = remap[docs] >= 0 if docs.shape[0] else np.zeros(0, dtype=bool)
+            self._postings_docs[term_id] = array("I", remap[docs[keep]].astype(np.uint32).tobytes())
+            self._postings_tfs[term_id] = array("H", tfs[keep].tobytes())
+
+        self._doc_ids = [self._doc_ids[slot] for slot in live_slots]
+        self._doc_len = array("I", (self._doc_len[slot] for slot in live_slots))
+        self._doc_terms = [self._doc_terms[slot] for slot in live_slots]
+        self._live = bytearray(b"\x01" * len(live_slots))
+        self._slot_of = {chunk_id: slot for slot, chunk_id in enumerate(self._doc_ids)}
+        self._dead = 0
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k BM25 scores returning (chunk_id, score) pairs"""
+        n_docs = len(self._slot_of)
+        if n_docs == 0 or k <= 0:
+            return []
+
+        terms = [self._vocab[term] for term in set(tokenize(query)) if term in self._vocab]
+        if not terms:
+            return []
+
+        avg_len = self._total_len / n_docs if n_docs else 0.0
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32).astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * doc_len / max(avg_len, 1e-9))
+        scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+
+        for term_id in terms:
+            df = self._df[term_id]
+            if df <= 0:
+                continue
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            # Zero-copy views over the compact postings arrays
+            docs = np.frombuffer(self._postings_docs[term_id], dtype=np.uint32)
+            tfs = np.frombuffer(self._postings_tfs[term_id], dtype=np.uint16).astype(np.float32)
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm[docs])
+
+        if self._dead:
+            scores[np.frombuffer(bytes(self._live), dtype=np.uint8) == 0] = 0.0
+
+        matched = np.flatnonzero(scores > 0)
+        if matched.shape[0] > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(self._doc_ids[slot], float(scores[slot])) for slot in matched]
@@ -0,0 +1,98 @@
+from typing import Optional, Union
+import json
+import struct
+import numpy as np
+from app.core.config import settings
+
+# Blob layout: 8-byte header followed by the packed vector.
+#   format code (uint8), codec version (uint8), dimension (uint16), scale (float32)
+# The header keeps the payload 4-byte aligned so float32 reads can be zero-copy.
+_HEADER = struct.Struct("<BBHf")
+_VERSION = 1
+
+FORMAT_CODES = {"float32": 1, "float16": 2, "int8": 3}
+_FORMAT_NAMES = {code: name for name, code in FORMAT_CODES.items()}
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+class EmbeddingCodecError(ValueError):
+    """Raised when an embedding blob cannot be decoded"""
+    pass
+
+
+def encode_embedding(vector: np.ndarray, dtype: Optional[str] = None) -> bytes:
+    """Pack a vector as float32, float16 or int8 scalar-quantized bytes"""
+    dtype = dtype or settings.EMBEDDING_STORAGE_DTYPE
+    if dtype not in FORMAT_CODES:
+        raise EmbeddingCodecError(f"Unsupported embedding dtype: {dtype}")
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+
+    scale = 1.0
+    if dtype == "int8":
+        # Symmetric per-vector quantization onto [-127, 127]
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        payload = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+    else:
+        payload = vector.astype(_DTYPES[dtype], copy=False)
+
+    header = _HEADER.pack(FORMAT_CODES[dtype], _VERSION, vector.shape[0], scale)
+    return header + payload.tobytes()
+
+
+def _parse_header(buffer: memoryview):
+    if len(buffer) < _HEADER.size:
+        raise EmbeddingCodecError("Embedding blob is shorter than its header")
+    code, version, dimension, scale = _HEADER.unpack_from(buffer)
+    if version != _VERSION or code not in _FORMAT_NAMES:
+        raise EmbeddingCodecError(f"Unknown embedding format {code} v{version}")
+    dtype = _FORMAT_NAMES[code]
+    expected = _HEADER.size + dimension * np.dtype(_DTYPES[dtype]).itemsize
+    if len(buffer) != expected:
+        raise EmbeddingCodecError(f"Embedding blob is {len(buffer)} bytes, expected {expected}")
+    return dtype, dimension, scale
+
+
+def embedding_view(blob: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """Zero-copy view of the stored payload in its storage dtype
+
+    For float32 blobs this is directly usable; float16 and int8 payloads
+    still need ``decode_embedding`` to widen and rescale.
+    """
+    buffer = memoryview(blob)
+    dtype, dimension, _ = _parse_header(buffer)
+    return np.frombuffer(buffer, dtype=_DTYPES[dtype], count=dimension, offset=_HEADER.size)
+
+
+def decode_embedding(blob: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """Decode a stored blob to a float32 vector, zero-copy for float32 storage"""
+    buffer = memoryview(blob)
+    dtype, dimension, scale = _parse_header(buffer)
+    payload = np.frombuffer(buffer, dtype=_DTYPES[dtype], count=dimension, offset=_HEADER.size)
+    if dtype == "float32":
+        return payload
+    if dtype == "int8":
+        return payload.astype(np.float32) * np.float32(scale)
+    return payload.astype(np.float32)
+
+
+def decode_into(blob: Union[bytes, bytearray, memoryview], out: np.ndarray) -> None:
+    """Decode a blob straight into a preallocated float32 row"""
+    buffer = memoryview(blob)
+    dtype, dimension, scale = _parse_header(buffer)
+    if dimension != out.shape[0]:
+        raise EmbeddingCodecError(f"Embedding dimension {dimension} does not match {out.shape[0]}")
+    payload = np.frombuffer(buffer, dtype=_DTYPES[dtype], count=dimension, offset=_HEADER.size)
+    np.copyto(out, payload, casting="unsafe")
+    if dtype == "int8":
+        out *= np.float32(scale)
+
+
+def decode_legacy_embedding(text: str) -> np.ndarray:
+    """Decode a JSON-text embedding written before the binary format"""
+    return np.asarray(json.loads(text), dtype=np.float32)
+
+
+def embedding_dimension(blob: Union[bytes, bytearray, memoryview]) -> int:
+    """Dimension recorded in a blob header"""
+    return _parse_header(memoryview(blob))[1]
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+from app.core.config import settings
+
+# Relative trust in each knowledge source type when scores are otherwise tied
+CREDIBILITY = {
+    "policy": 1.0,
+    "procedure": 0.95,
+    "faq": 0.9,
+    "document": 0.85,
+    "article": 0.8,
+}
+
+
+@dataclass
+class SourceInfo:
+    """Ranking-relevant metadata for a knowledge source"""
+    name: str
+    type: str
+    version: int
+    effective_date: Optional[datetime]
+    expiry_date: Optional[datetime]
+
+    def is_current(self, as_of: datetime) -> bool:
+        """Whether the source is in force at the given time"""
+        if self.effective_date is not None and _aware(self.effective_date) > as_of:
+            return False
+        if self.expiry_date is not None and _aware(self.expiry_date) <= as_of:
+            return False
+        return True
+
+    def is_expired(self, as_of: datetime) -> bool:
+        return self.expiry_date is not None and _aware(self.expiry_date) <= as_of
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: Optional[int] = None) -> Dict[str, float]:
+    """Fuse ranked id lists with RRF: sum of 1 / (k + rank) across lists"""
+    k = settings.SEARCH_RRF_K if k is None else k
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def source_weight(source: SourceInfo, as_of: datetime) -> float:
+    """Multiplicative boost from recency and credibility
+
+    Recency decays exponentially from the effective date with the
+    configured half-life; sources nearing expiry are damped the same way.
+    """
+    weight = CREDIBILITY.get(source.type, 0.8)
+    half_life = max(settings.SEARCH_RECENCY_HALF_LIFE_DAYS, 1)
+
+    if source.effective_date is not None:
+        age_days = max((as_of - _aware(source.effective_date)).total_seconds() / 86400, 0.0)
+        weight *= 1.0 + settings.SEARCH_RECENCY_WEIGHT * math.pow(0.5, age_days / half_life)
+    if source.expiry_date is not None:
+        remaining_days = max((_aware(source.expiry_date) - as_of).total_seconds() / 86400, 0.0)
+        weight *= 1.0 - settings.SEARCH_RECENCY_WEIGHT * math.pow(0.5, remaining_days / (half_life / 6))
+    return weight
+
+
+def fuse(
+    vector_hits: List[Tuple[str, float]],
+    keyword_hits: List[Tuple[str, float]],
+    chunk_sources: Dict[str, str],
+    sources: Dict[str, SourceInfo],
+    k: int,
+    as_of: Optional[datetime] = None,
+) -> List[Tuple[str, float]]:
+    """Rank-fuse vector and keyword hits, dropping chunks of sources not in force"""
+    as_of = as_of or datetime.now(timezone.utc)
+    fused = reciprocal_rank_fusion([
+        [chunk_id for chunk_id, _ in vector_hits],
+        [chunk_id for chunk_id, _ in keyword_hits],
+    ])
+
+    weights: Dict[str, Optional[float]] = {}
+    scored: List[Tuple[str, float]] = []
+    for chunk_id, score in fused.items():
+        source_id = chunk_sources.get(chunk_id)
+        source = sources.get(source_id) if source_id else None
+        if source is None:
+            continue
+        if source_id not in weights:
+            weights[source_id] = source_weight(source, as_of) if source.is_current(as_of) else None
+        if weights[source_id] is None:
+            continue
+        scored.append((chunk_id, score * weights[source_id]))
+
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:k]
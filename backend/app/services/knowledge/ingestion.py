@@ -0,0 +1,453 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.chunk import Chunk
+from app.models.knowledge_source import KnowledgeSource
+from app.services.ai.embeddings import EmbeddingService, get_embedding_service
+from app.services.knowledge.embedding_codec import encode_embedding
+
+logger = get_logger(__name__)
+
+DOCUMENT_KINDS = {
+    ".pdf": "pdf",
+    ".docx": "docx",
+    ".html": "html",
+    ".htm": "html",
+    ".txt": "text",
+    ".md": "text",
+}
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def detect_kind(filename: str) -> str:
+    """Map a filename to a parser kind, defaulting to plain text"""
+    return DOCUMENT_KINDS.get(os.path.splitext(filename.lower())[1], "text")
+
+
+# Parsers run inside worker processes, so they must be importable top-level functions
+
+def _parse_pdf(path: str) -> List[str]:
+    import fitz
+    with fitz.open(path) as doc:
+        return [page.get_text("text") for page in doc]
+
+
+def _parse_docx(path: str) -> List[str]:
+    import docx
+    document = docx.Document(path)
+    return ["\n\n".join(paragraph.text for paragraph in document.paragraphs)]
+
+
+def _parse_html(path: str) -> List[str]:
+    from bs4 import BeautifulSoup
+    with open(path, "rb") as handle:
+        soup = BeautifulSoup(handle, "lxml")
+    for tag in soup(["script", "style", "nav", "footer"]):
+        tag.decompose()
+    return [soup.get_text("\n\n")]
+
+
+def _parse_text(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as handle:
+        return [handle.read()]
+
+
+_PARSERS = {
+    "pdf": _parse_pdf,
+    "docx": _parse_docx,
+    "html": _parse_html,
+    "text": _parse_text,
+}
+
+
+def parse_document(path: str, kind: str) -> List[str]:
+    """Extract text sections (pages for PDFs) from a document on disk"""
+    return _PARSERS[kind](path)
+
+
+def _windows(text: str, max_chars: int, overlap: int) -> Iterator[str]:
+    """Split an oversized paragraph into overlapping word-aligned windows"""
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start + overlap + 1, end)
+            end = space if space > start else end
+        yield text[start:end].strip()
+        if end >= len(text):
+            break
+        next_start = text.find(" ", max(end - overlap, start + 1), end)
+        start = next_start + 1 if next_start > start else end
+
+
+def chunk_sections(sections: Iterable[str], max_chars: int, overlap: int) -> Iterator[str]:
+    """Pack paragraphs into chunks of at most ``max_chars`` with word overlap"""
+    buffer = ""
+    for section in sections:
+        for paragraph in _PARAGRAPH_RE.split(section):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            if len(paragraph) > max_chars:
+                if buffer:
+                    yield buffer
+                    buffer = ""
+                yield from _windows(paragraph, max_chars, overlap)
+                continue
+            if buffer and len(buffer) + 1 + len(paragraph) > max_chars:
+                yield buffer
+                tail = buffer[-overlap:] if overlap else ""
+                space = tail.find(" ")
+                tail = tail[space + 1:] if space >= 0 else ""
+                buffer = f"{tail} {paragraph}".strip() if len(tail) + 1 + len(paragraph) <= max_chars else paragraph
+            else:
+                buffer = f"{buffer} {paragraph}" if buffer else paragraph
+    if buffer:
+        yield buffer
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of whitespace-normalized chunk text; case is significant, so a corrected code or name is re-embedded"""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IngestDocument:
+    """A document queued for ingestion into an existing knowledge source"""
+    source_id: str
+    path: Optional[str] = None  # File on disk, parsed in the process pool
+    kind: str = "text"  # pdf, docx, html, text
+    text: Optional[str] = None  # Inline content, skips parsing
+    version: int = 1  # KnowledgeSource.version the chunks belong to
+    reindex: bool = False  # Diff against the source's existing chunks
+
+
+@dataclass
+class ParsedDocument:
+    document: IngestDocument
+    sections: List[str]
+
+
+@dataclass
+class ChunkDraft:
+    source_id: str
+    ordinal: int
+    content: str
+    content_hash: str
+    version: int
+
+
+@dataclass
+class SourceChanges:
+    """Chunk-level outcome of ingesting one source"""
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    reused: int = 0
+
+
+@dataclass
+class StageStats:
+    """Work done and time spent inside one pipeline stage"""
+    name: str
+    documents: int = 0
+    items: int = 0
+    seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "documents": self.documents,
+            "items": self.items,
+            "seconds": round(self.seconds, 4),
+            "documents_per_second": round(self.documents / self.seconds, 2) if self.seconds else None,
+            "items_per_second": round(self.items / self.seconds, 2) if self.seconds else None,
+        }
+
+
+@dataclass
+class IngestionReport:
+    """Per-stage throughput and per-source chunk changes for one ingestion run"""
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    changes: Dict[str, SourceChanges] = field(default_factory=dict)
+    documents: int = 0
+    chunks_written: int = 0
+    chunks_reused: int = 0
+    chunks_tombstoned: int = 0
+    duplicates_skipped: int = 0
+    failed_sources: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def stage(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    def source(self, source_id: str) -> SourceChanges:
+        if source_id not in self.changes:
+            self.changes[source_id] = SourceChanges()
+        return self.changes[source_id]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "documents": self.documents,
+            "chunks_written": self.chunks_written,
+            "chunks_reused": self.chunks_reused,
+            "chunks_tombstoned": self.chunks_tombstoned,
+            "duplicates_skipped": self.duplicates_skipped,
+            "failed_sources": self.failed_sources,
+            "seconds": round(self.seconds, 4),
+            "documents_per_second": round(self.documents / self.seconds, 2) if self.seconds else None,
+            "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+        }
+
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """Shared process pool for CPU-heavy document parsing"""
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=settings.INGEST_PARSE_WORKERS or None)
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+class DocumentProcessor:
+    """Streaming ingestion pipeline: parse -> chunk -> dedupe -> diff -> embed -> insert
+
+    Stages are chained async generators, so at most ``max_in_flight``
+    documents are parsed at once and only one embedding batch of chunks
+    is held in memory between stages. Documents flagged ``reindex`` are
+    diffed by content hash against the source's live chunks: unchanged
+    chunks are kept as-is, only new text is embedded, and chunks that
+    disappeared are tombstoned. The whole run is one transaction, including
+    any source changes the caller left pending: if embedding fails nothing
+    is tombstoned and the old chunks stay live.
+    """
+
+    def __init__(
+        self,
+        embedding_service: Optional[EmbeddingService] = None,
+        chunk_chars: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
+        embed_batch_size: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+    ):
+        self.embedding_service = embedding_service or get_embedding_service()
+        self.chunk_chars = chunk_chars or settings.INGEST_CHUNK_CHARS
+        self.chunk_overlap = settings.INGEST_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        self.embed_batch_size = embed_batch_size or settings.INGEST_EMBED_BATCH_SIZE
+        self.max_in_flight = max_in_flight or max(2 * (settings.INGEST_PARSE_WORKERS or os.cpu_count() or 1), 2)
+
+    async def run(self, db: AsyncSession, documents: Iterable[IngestDocument]) -> IngestionReport:
+        """Ingest documents and bulk-insert their new chunks"""
+        report = IngestionReport()
+        started = time.perf_counter()
+
+        parsed = self._parse(documents, report)
+        groups = self._diff(self._dedupe(self._chunk(parsed, db, report), report), db, report)
+        try:
+            await self._insert(db, self._embed(groups, report), report)
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+        report.seconds = time.perf_counter() - started
+        logger.info("Knowledge ingestion finished", **report.to_dict())
+        return report
+
+    async def _parse(self, documents: Iterable[IngestDocument], report: IngestionReport) -> AsyncIterator[ParsedDocument]:
+        stats = report.stage("parse")
+        loop = asyncio.get_running_loop()
+        pending: Dict[asyncio.Future, IngestDocument] = {}
+        queue = iter(documents)
+        exhausted = False
+
+        while pending or not exhausted:
+            # Keep the pool busy without reading ahead more than max_in_flight documents
+            while not exhausted and len(pending) < self.max_in_flight:
+                document = next(queue, None)
+                if document is None:
+                    exhausted = True
+                    break
+                report.documents += 1
+                if document.text is not None:
+                    yield ParsedDocument(document, [document.text])
+                    stats.documents += 1
+                    continue
+                future = loop.run_in_executor(get_parse_pool(), parse_document, document.path, document.kind)
+                pending[future] = document
+            if not pending:
+                continue
+
+            waited = time.perf_counter()
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            stats.seconds += time.perf_counter() - waited
+            for future in done:
+                document = pending.pop(future)
+                try:
+                    sections = future.result()
+                except Exception as e:
+                    logger.error("Document parsing failed", source_id=document.source_id, path=document.path, error=str(e))
+                    report.failed_sources.append(document.source_id)
+                    continue
+                stats.documents += 1
+                stats.items += len(sections)
+                yield ParsedDocument(document, sections)
+
+    async def _chunk(
+        self, parsed: AsyncIterator[ParsedDocument], db: AsyncSession, report: IngestionReport
+    ) -> AsyncIterator[Tuple[IngestDocument, List[ChunkDraft]]]:
+        stats = report.stage("chunk")
+        async for item in parsed:
+            document = item.document
+            if document.path is not None:
+                await db.execute(
+                    update(KnowledgeSource)
+                    .where(KnowledgeSource.id == document.source_id)
+                    .values(content="\n\n".join(item.sections))
+                )
+            started = time.perf_counter()
+            drafts = [
+                ChunkDraft(document.source_id, ordinal, text, content_hash(text), document.version)
+                for ordinal, text in enumerate(chunk_sections(item.sections, self.chunk_chars, self.chunk_overlap))
+            ]
+            stats.seconds += time.perf_counter() - started
+            stats.documents += 1
+            stats.items += len(drafts)
+            yield document, drafts
+
+    async def _dedupe(
+        self, groups: AsyncIterator[Tuple[IngestDocument, List[ChunkDraft]]], report: IngestionReport
+    ) -> AsyncIterator[Tuple[IngestDocument, List[ChunkDraft]]]:
+        stats = report.stage("dedupe")
+        async for document, drafts in groups:
+            started = time.perf_counter()
+            # Duplicates are only dropped within a source
+            seen: Set[str] = set()
+            unique: List[ChunkDraft] = []
+            for draft in drafts:
+                if draft.content_hash in seen:
+                    report.duplicates_skipped += 1
+                    continue
+                seen.add(draft.content_hash)
+                unique.append(draft)
+            stats.seconds += time.perf_counter() - started
+            stats.documents += 1
+            stats.items += len(unique)
+            yield document, unique
+
+    async def _diff(
+        self, groups: AsyncIterator[Tuple[IngestDocument, List[ChunkDraft]]], db: AsyncSession, report: IngestionReport
+    ) -> AsyncIterator[List[ChunkDraft]]:
+        stats = report.stage("diff")
+        async for document, drafts in groups:
+            changes = report.source(document.source_id)
+            if not document.reindex:
+                yield drafts
+                continue
+
+            started = time.perf_counter()
+            existing = {
+                row.content_hash: row.id
+                for row in await db.execute(
+                    select(Chunk.id, Chunk.content_hash)
+                    .where(Chunk.knowledge_source_id == document.source_id, Chunk.deleted_at.is_(None))
+                )
+            }
+
+            fresh: List[ChunkDraft] = []
+            kept: List[Dict[str, Any]] = []
+            for draft in drafts:
+                chunk_id = existing.pop(draft.content_hash, None)
+                if chunk_id is None:
+                    fresh.append(draft)
+                else:
+                    kept.append({"id": chunk_id, "ordinal": draft.ordinal, "source_version": draft.version})
+
+            if kept:
+                # Unchanged text keeps its embedding; only position and version move
+                await db.execute(update(Chunk), kept)
+            if existing:
+                await db.execute(
+                    update(Chunk)
+                    .where(Chunk.id.in_(list(existing.values())))
+                    .values(deleted_at=func.now())
+                )
+
+            changes.reused += len(kept)
+            changes.removed.extend(existing.values())
+            report.chunks_reused += len(kept)
+            report.chunks_tombstoned += len(existing)
+            stats.seconds += time.perf_counter() - started
+            stats.documents += 1
+            stats.items += len(fresh)
+            yield fresh
+
+    async def _embed(self, groups: AsyncIterator[List[ChunkDraft]], report: IngestionReport) -> AsyncIterator[List[Dict[str, Any]]]:
+        stats = report.stage("embed")
+        batch: List[ChunkDraft] = []
+        sources: Set[str] = set()
+
+        async def flush() -> List[Dict[str, Any]]:
+            started = time.perf_counter()
+            vectors = await self.embedding_service.embed([draft.content for draft in batch])
+            rows = [
+                {
+                    "id": uuid.uuid4().hex,
+                    "knowledge_source_id": draft.source_id,
+                    "content": draft.content,
+                    "content_hash": draft.content_hash,
+                    "ordinal": draft.ordinal,
+                    "source_version": draft.version,
+                    "embedding_data": encode_embedding(vector),
+                }
+                for draft, vector in zip(batch, vectors)
+            ]
+            stats.seconds += time.perf_counter() - started
+            stats.items += len(rows)
+            return rows
+
+        async for drafts in groups:
+            for draft in drafts:
+                batch.append(draft)
+                if draft.source_id not in sources:
+                    sources.add(draft.source_id)
+                    stats.documents += 1
+                if len(batch) >= self.embed_batch_size:
+                    yield await flush()
+                    batch = []
+        if batch:
+            yield await flush()
+
+    async def _insert(self, db: AsyncSession, batches: AsyncIterator[List[Dict[str, Any]]], report: IngestionReport) -> None:
+        stats = report.stage("insert")
+        sources: Set[str] = set()
+        async for rows in batches:
+            started = time.perf_counter()
+            await db.execute(insert(Chunk), rows)
+            stats.seconds += time.perf_counter() - started
+            stats.items += len(rows)
+            report.chunks_written += len(rows)
+            for row in rows:
+                sources.add(row["knowledge_source_id"])
+                report.source(row["knowledge_source_id"]).added.append(row["id"])
+        stats.documents = len(sources)
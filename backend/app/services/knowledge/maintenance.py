@@ -0,0 +1,160 @@
+"""Knowledge store maintenance tasks
+
+Run from the backend directory:
+
+    python -m app.services.knowledge.maintenance migrate-embeddings [--dtype float16]
+    python -m app.services.knowledge.maintenance ingest --tenant-id T --author A docs/
+"""
+from typing import Iterator, List, Optional
+import argparse
+import asyncio
+import os
+import uuid
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import AsyncSessionLocal, engine
+from app.core.logging import get_logger, setup_logging
+from app.models.chunk import Chunk
+from app.models.knowledge_source import KnowledgeSource
+from app.services.knowledge.embedding_codec import decode_legacy_embedding, encode_embedding
+from app.services.knowledge.ingestion import (
+    DOCUMENT_KINDS, DocumentProcessor, IngestDocument, content_hash, detect_kind, shutdown_parse_pool
+)
+
+logger = get_logger(__name__)
+
+
+_CHUNK_COLUMNS = {
+    "embedding_data": "BYTEA",
+    "content_hash": "VARCHAR(64)",
+    "ordinal": "INTEGER",
+    "source_version": "INTEGER",
+    "deleted_at": "TIMESTAMP WITH TIME ZONE",
+}
+
+
+async def ensure_chunk_columns() -> None:
+    """Add chunk columns to tables created before they existed"""
+    async with engine.begin() as conn:
+        for column, column_type in _CHUNK_COLUMNS.items():
+            await conn.execute(text(f"ALTER TABLE chunks ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_chunks_knowledge_source_id ON chunks (knowledge_source_id)"
+        ))
+
+
+async def backfill_content_hashes(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Hash chunks written before content hashes existed, so re-ingest can reuse them"""
+    updated = 0
+    while True:
+        rows = (await db.execute(
+            select(Chunk.id, Chunk.content).where(Chunk.content_hash.is_(None)).limit(batch_size)
+        )).all()
+        if not rows:
+            break
+        await db.execute(update(Chunk), [{"id": chunk_id, "content_hash": content_hash(body)} for chunk_id, body in rows])
+        await db.commit()
+        updated += len(rows)
+    return updated
+
+
+async def migrate_legacy_embeddings(
+    db: AsyncSession,
+    batch_size: int = 500,
+    dtype: Optional[str] = None,
+) -> int:
+    """Re-encode JSON-text embeddings into the binary column in batches
+
+    Each batch is committed on its own and clears the legacy text, so the
+    migration can be interrupted and resumed without redoing work.
+    """
+    migrated = 0
+    while True:
+        rows = (await db.execute(
+            select(Chunk.id, Chunk.embedding)
+            .where(Chunk.embedding_data.is_(None), Chunk.embedding.is_not(None))
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            break
+
+        await db.execute(update(Chunk), [
+            {"id": chunk_id, "embedding_data": encode_embedding(decode_legacy_embedding(legacy), dtype), "embedding": None}
+            for chunk_id, legacy in rows
+        ])
+        await db.commit()
+        migrated += len(rows)
+        logger.info("Migrated legacy embeddings", batch=len(rows), total=migrated)
+    return migrated
+
+
+def _walk(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if os.path.splitext(name.lower())[1] in DOCUMENT_KINDS:
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+async def _create_sources(db: AsyncSession, args: argparse.Namespace) -> List[IngestDocument]:
+    """Register one knowledge source per file, in batches"""
+    documents: List[IngestDocument] = []
+    for path in _walk(args.paths):
+        source_id = uuid.uuid4().hex
+        db.add(KnowledgeSource(
+            id=source_id, name=os.path.basename(path), type=args.type, category=args.category,
+            tenant_id=args.tenant_id, author=args.author, content="",
+        ))
+        documents.append(IngestDocument(source_id=source_id, path=path, kind=detect_kind(path)))
+        if len(documents) % 1000 == 0:
+            await db.commit()
+    await db.commit()
+    return documents
+
+
+async def _ingest(args: argparse.Namespace) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            documents = await _create_sources(db, args)
+            report = await DocumentProcessor().run(db, documents)
+    finally:
+        shutdown_parse_pool()
+    for name, stats in report.to_dict()["stages"].items():
+        print(f"{name:>8}: {stats['documents']} docs, {stats['items']} items, "
+              f"{stats['documents_per_second']} docs/s")
+
+
+async def _migrate(args: argparse.Namespace) -> None:
+    await ensure_chunk_columns()
+    async with AsyncSessionLocal() as db:
+        total = await migrate_legacy_embeddings(db, args.batch_size, args.dtype)
+        hashed = await backfill_content_hashes(db)
+    logger.info("Embedding migration complete", total=total, hashed=hashed)
+
+
+def main() -> None:
+    setup_logging()
+    parser = argparse.ArgumentParser(description="HeliosCS knowledge maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate-embeddings", help="Add chunk columns and convert JSON embeddings to binary")
+    migrate.add_argument("--batch-size", type=int, default=500)
+    migrate.add_argument("--dtype", choices=["float32", "float16", "int8"], default=None)
+    ingest = commands.add_parser("ingest", help="Bulk-ingest files or directories as knowledge sources")
+    ingest.add_argument("paths", nargs="+")
+    ingest.add_argument("--tenant-id", required=True)
+    ingest.add_argument("--author", required=True)
+    ingest.add_argument("--type", default="document")
+    ingest.add_argument("--category", default="general")
+    args = parser.parse_args()
+
+    if args.command == "migrate-embeddings":
+        asyncio.run(_migrate(args))
+    elif args.command == "ingest":
+        asyncio.run(_ingest(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import time
+import uuid
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.logging import get_logger
+from app.models.chunk import Chunk
+from app.models.knowledge_source import KnowledgeSource
+from app.services.ai.embeddings import EmbeddingError, EmbeddingService, get_embedding_service
+from app.services.knowledge.bm25 import BM25Index
+from app.services.knowledge.embedding_codec import EmbeddingCodecError, decode_into, decode_legacy_embedding
+from app.services.knowledge.hybrid import SourceInfo, fuse
+from app.services.knowledge.ingestion import SourceChanges
+from app.services.knowledge.vector_index import VectorIndex
+
+logger = get_logger(__name__)
+
+# Candidates pulled from each retriever per requested result
+_CANDIDATE_FACTOR = 4
+
+NOTIFY_CHANNEL = "knowledge_index"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+_NOTIFY_LIMIT = 7900
+
+# Identifies this worker's own notifications, which it has already applied
+_WORKER_ID = uuid.uuid4().hex
+
+
+@dataclass
+class SearchHit:
+    """A single retrieved chunk"""
+    chunk_id: str
+    knowledge_source_id: str
+    source_name: str
+    content: str
+    score: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class TenantIndex:
+    """Vector and keyword indexes plus source metadata for one tenant"""
+
+    def __init__(self, dimension: int):
+        self.vectors = VectorIndex(dimension)
+        self.keywords = BM25Index()
+        self.sources: Dict[str, SourceInfo] = {}
+        self.chunk_source: Dict[str, str] = {}
+        self.source_chunks: Dict[str, List[str]] = {}
+        self.next_expiry: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.chunk_source)
+
+    def remove_chunks(self, chunk_ids: List[str]) -> None:
+        """Drop individual chunks from both indexes"""
+        self.vectors.remove(chunk_ids)
+        self.keywords.remove_many(chunk_ids)
+        for chunk_id in chunk_ids:
+            source_id = self.chunk_source.pop(chunk_id, None)
+            if source_id is not None and source_id in self.source_chunks:
+                self.source_chunks[source_id].remove(chunk_id)
+
+    def version_of(self, source_id: str) -> Optional[int]:
+        """Version of a source currently in force, None if unknown or not current"""
+        source = self.sources.get(source_id)
+        if source is None or not source.is_current(datetime.now(timezone.utc)):
+            return None
+        return source.version
+
+    def add_source(self, source_id: str, info: SourceInfo) -> None:
+        self.sources[source_id] = info
+        self.source_chunks.setdefault(source_id, [])
+        if info.expiry_date is not None:
+            expiry = info.expiry_date if info.expiry_date.tzinfo else info.expiry_date.replace(tzinfo=timezone.utc)
+            if self.next_expiry is None or expiry < self.next_expiry:
+                self.next_expiry = expiry
+
+    def expiry_due(self, as_of: datetime) -> bool:
+        return self.next_expiry is not None and as_of >= self.next_expiry
+
+    def prune_expired(self, as_of: datetime) -> List[str]:
+        """Release memory held by sources whose expiry date has passed"""
+        if not self.expiry_due(as_of):
+            return []
+        self.next_expiry = None
+        pruned: List[str] = []
+        for source_id, source in list(self.sources.items()):
+            if source.is_expired(as_of):
+                self.remove_source(source_id)
+                pruned.append(source_id)
+            elif source.expiry_date is not None:
+                self.add_source(source_id, source)
+        return pruned
+
+    def remove_source(self, source_id: str) -> int:
+        """Drop every chunk of a source from both indexes"""
+        chunk_ids = self.source_chunks.pop(source_id, [])
+        self.sources.pop(source_id, None)
+        self.vectors.remove(chunk_ids)
+        self.keywords.remove_many(chunk_ids)
+        for chunk_id in chunk_ids:
+            self.chunk_source.pop(chunk_id, None)
+        return len(chunk_ids)
+
+    async def maybe_compact(self) -> None:
+        """Compact drifted indexes, repartitioning vectors in a worker thread
+
+        The caller holds the tenant lock, so no change lands between the
+        snapshot and the swap; searches keep using the old vectors until then.
+        """
+        if self.vectors.needs_compaction:
+            self.vectors = await asyncio.to_thread(self.vectors.compacted)
+        if self.keywords.needs_compaction:
+            self.keywords.compact()
+
+
+def _source_info(source: KnowledgeSource) -> SourceInfo:
+    return SourceInfo(
+        name=source.name,
+        type=source.type,
+        version=source.version or 1,
+        effective_date=source.effective_date,
+        expiry_date=source.expiry_date,
+    )
+
+
+class SearchService:
+    """Hybrid knowledge search over per-tenant in-memory indexes
+
+    Each tenant's active chunks are decoded once into a ``VectorIndex``
+    and a ``BM25Index`` kept in process, so queries never touch the
+    embedding column. Source changes are applied incrementally through
+    ``apply_changes``, ``upsert_source`` and ``remove_source`` rather
+    than a full rebuild, and announced on NOTIFY_CHANNEL so every other
+    worker re-indexes the changed sources too (see ``run_forever``).
+    """
+
+    def __init__(self, embedding_service: Optional[EmbeddingService] = None):
+        self.embedding_service = embedding_service or get_embedding_service()
+        self._indexes: Dict[str, TenantIndex] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._listeners: List[Callable[[str, str], None]] = []
+
+    def add_listener(self, listener: Callable[[str, str], None]) -> None:
+        """Register a callback invoked with (tenant_id, source_id) when a source changes"""
+        self._listeners.append(listener)
+
+    def _notify(self, tenant_id: str, source_ids) -> None:
+        for source_id in source_ids:
+            for listener in self._listeners:
+                listener(tenant_id, source_id)
+
+    def _lock(self, tenant_id: str) -> asyncio.Lock:
+        lock = self._locks.get(tenant_id)
+        if lock is None:
+            lock = self._locks[tenant_id] = asyncio.Lock()
+        return lock
+
+    def invalidate(self, tenant_id: str) -> None:
+        """Drop a tenant's indexes so the next query rebuilds them"""
+        self._indexes.pop(tenant_id, None)
+
+    async def get_index(self, db: AsyncSession, tenant_id: str) -> TenantIndex:
+        """Return the tenant's indexes, building them on first use"""
+        index = self._indexes.get(tenant_id)
+        if index is not None:
+            return index
+        async with self._lock(tenant_id):
+            index = self._indexes.get(tenant_id)
+            if index is None:
+                index = await self.build_index(db, tenant_id)
+                self._indexes[tenant_id] = index
+        return index
+
+    async def build_index(self, db: AsyncSession, tenant_id: str) -> TenantIndex:
+        """Load a tenant's active chunks and build fresh indexes"""
+        started = time.perf_counter()
+        index = TenantIndex(await self.embedding_service.ready())
+
+        sources = await db.execute(
+            select(KnowledgeSource).where(
+                KnowledgeSource.tenant_id == tenant_id,
+                KnowledgeSource.is_active.is_(True),
+            )
+        )
+        for source in sources.scalars():
+            index.add_source(source.id, _source_info(source))
+
+        ids, vectors = await self._load_chunks(db, index, [
+            KnowledgeSource.tenant_id == tenant_id,
+            KnowledgeSource.is_active.is_(True),
+        ])
+        # k-means over the whole corpus; keep it off the event loop
+        await asyncio.to_thread(index.vectors.build, ids, vectors)
+
+        logger.info(
+            "Knowledge index built",
+            tenant_id=tenant_id,
+            chunks=len(index),
+            vectors=len(index.vectors),
+            nlist=index.vectors.stats().nlist,
+            duration=time.perf_counter() - started,
+        )
+        return index
+
+    async def _load_chunks(self, db: AsyncSession, index: TenantIndex, conditions: list) -> Tuple[List[str], np.ndarray]:
+        """Stream matching chunks into the keyword index and collect their vectors"""
+        dimension = self.embedding_service.dimension
+        ids: List[str] = []
+        rows: List[np.ndarray] = []
+        block = np.empty((0, dimension), dtype=np.float32)
+        filled = 0
+
+        result = await db.stream(
+            select(Chunk.id, Chunk.knowledge_source_id, Chunk.content, Chunk.embedding_data, Chunk.embedding)
+            .join(KnowledgeSource, Chunk.knowledge_source_id == KnowledgeSource.id)
+            .where(Chunk.deleted_at.is_(None), *conditions)
+            .execution_options(yield_per=2000)
+        )
+        async for chunk_id, source_id, content, blob, legacy in result:
+            index.keywords.add(chunk_id, content)
+            index.chunk_source[chunk_id] = source_id
+            index.source_chunks.setdefault(source_id, []).append(chunk_id)
+            if blob is None and legacy is None:
+                continue
+
+            # Decode into fixed-size blocks instead of one list entry per row
+            if filled == block.shape[0]:
+                if filled:
+                    rows.append(block)
+                block = np.empty((4096, dimension), dtype=np.float32)
+                filled = 0
+            try:
+                if blob is not None:
+                    decode_into(blob, block[filled])
+                else:
+                    # Rows not yet migrated still carry JSON text
+                    vector = decode_legacy_embedding(legacy)
+                    if vector.shape[0] != dimension:
+                        raise EmbeddingCodecError(f"Embedding dimension {vector.shape[0]} does not match {dimension}")
+                    block[filled] = vector
+            except (EmbeddingCodecError, ValueError) as e:
+                logger.warning("Skipping undecodable chunk embedding", chunk_id=chunk_id, error=str(e))
+                continue
+            ids.append(chunk_id)
+            filled += 1
+
+        rows.append(block[:filled])
+        return ids, np.concatenate(rows)
+
+    async def upsert_source(self, db: AsyncSession, source_id: str, broadcast: bool = True) -> bool:
+        """Re-index one knowledge source after it was added, versioned or deactivated
+
+        Returns False when the source no longer exists.
+        """
+        source = await db.get(KnowledgeSource, source_id)
+        if source is None:
+            return False
+        if broadcast:
+            await self._broadcast(source.tenant_id, [source_id])
+        index = self._indexes.get(source.tenant_id)
+        if index is None:
+            # Nothing cached yet; the first query will build from the table
+            self._notify(source.tenant_id, [source_id])
+            return True
+
+        async with self._lock(source.tenant_id):
+            index.remove_source(source_id)
+            if source.is_active:
+                index.add_source(source_id, _source_info(source))
+                ids, vectors = await self._load_chunks(db, index, [Chunk.knowledge_source_id == source_id])
+                if ids:
+                    index.vectors.add(ids, vectors)
+            await index.maybe_compact()
+        self._notify(source.tenant_id, [source_id])
+
+        logger.info(
+            "Knowledge source re-indexed",
+            tenant_id=source.tenant_id,
+            source_id=source_id,
+            version=source.version,
+            active=bool(source.is_active),
+        )
+        return True
+
+    async def apply_changes(self, db: AsyncSession, tenant_id: str, changes: Dict[str, SourceChanges]) -> None:
+        """Apply chunk-level ingestion results without reloading unchanged chunks
+
+        Removed chunks are dropped, added chunks are loaded by id, and each
+        touched source's metadata (version, effective and expiry dates) is
+        refreshed. Inactive sources are dropped entirely.
+        """
+        if changes:
+            self._notify(tenant_id, list(changes))
+            await self._broadcast(tenant_id, list(changes))
+        index = self._indexes.get(tenant_id)
+        if index is None or not changes:
+            return
+
+        async with self._lock(tenant_id):
+            rows = await db.execute(select(KnowledgeSource).where(KnowledgeSource.id.in_(list(changes))))
+            sources = {source.id: source for source in rows.scalars()}
+            for source_id, change in changes.items():
+                source = sources.get(source_id)
+                if source is None or not source.is_active:
+                    index.remove_source(source_id)
+                    continue
+                index.add_source(source_id, _source_info(source))
+                index.remove_chunks(change.removed)
+                if change.added:
+                    ids, vectors = await self._load_chunks(db, index, [Chunk.id.in_(change.added)])
+                    if ids:
+                        index.vectors.add(ids, vectors)
+            await index.maybe_compact()
+
+        logger.info(
+            "Knowledge index updated",
+            tenant_id=tenant_id,
+            sources=len(changes),
+            added=sum(len(change.added) for change in changes.values()),
+            removed=sum(len(change.removed) for change in changes.values()),
+        )
+
+    async def remove_source(self, tenant_id: str, source_id: str, broadcast: bool = True) -> None:
+        """Drop a source's chunks from a tenant's cached indexes"""
+        self._notify(tenant_id, [source_id])
+        if broadcast:
+            await self._broadcast(tenant_id, [source_id])
+        index = self._indexes.get(tenant_id)
+        if index is None:
+            return
+        async with self._lock(tenant_id):
+            index.remove_source(source_id)
+            await index.maybe_compact()
+
+    async def _broadcast(self, tenant_id: str, source_ids: List[str]) -> None:
+        """Tell the other workers which of a tenant's sources changed"""
+        if not settings.SEARCH_INDEX_NOTIFY_ENABLED:
+            return
+        payload = json.dumps({"origin": _WORKER_ID, "tenant_id": tenant_id, "sources": source_ids})
+        if len(payload.encode()) >= _NOTIFY_LIMIT:
+            # Too many to name; receivers rebuild the tenant instead
+            payload = json.dumps({"origin": _WORKER_ID, "tenant_id": tenant_id, "sources": None})
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": payload})
+        except Exception as e:
+            logger.error("Knowledge index change not broadcast", tenant_id=tenant_id, error=str(e))
+
+    async def _apply_remote(self, tenant_id: str, source_ids: Optional[List[str]]) -> None:
+        """Re-index sources another worker changed, if this worker has the tenant cached"""
+        if tenant_id not in self._indexes:
+            return
+        if source_ids is None:
+            self.invalidate(tenant_id)
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                for source_id in source_ids:
+                    if not await self.upsert_source(db, source_id, broadcast=False):
+                        await self.remove_source(tenant_id, source_id, broadcast=False)
+        except Exception as e:
+            # Rebuilt from the table on next use rather than served stale
+            self.invalidate(tenant_id)
+            logger.warning("Knowledge index change not applied, rebuilding", tenant_id=tenant_id, error=str(e))
+
+    async def _listen(self) -> None:
+        # A pooled connection held for the life of the subscription; returns when it breaks
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            changed: asyncio.Queue = asyncio.Queue()
+
+            def notified(connection, pid, channel, payload):
+                changed.put_nowait(payload)
+
+            await driver.add_listener(NOTIFY_CHANNEL, notified)
+            # Changes announced while unsubscribed were missed; cached tenants are rebuilt on next use
+            for tenant_id in list(self._indexes):
+                self.invalidate(tenant_id)
+            logger.info("Listening for knowledge index changes", channel=NOTIFY_CHANNEL)
+            try:
+                while True:
+                    try:
+                        payload = await asyncio.wait_for(changed.get(), timeout=settings.SEARCH_INDEX_LISTEN_RETRY_SECONDS)
+                    except asyncio.TimeoutError:
+                        await driver.execute("SELECT 1")  # raises once the connection is gone
+                        continue
+                    try:
+                        message = json.loads(payload)
+                    except ValueError:
+                        logger.warning("Ignoring malformed knowledge index notification", payload=payload[:200])
+                        continue
+                    if message.get("origin") != _WORKER_ID:
+                        await self._apply_remote(message["tenant_id"], message.get("sources"))
+            finally:
+                # The connection goes back to the pool; it must not keep delivering to this queue
+                if not driver.is_closed():
+                    await driver.remove_listener(NOTIFY_CHANNEL, notified)
+
+    async def run_forever(self) -> None:
+        """Apply index changes made by other workers until cancelled"""
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Knowledge index notifications unavailable, retrying", error=str(e))
+            await asyncio.sleep(settings.SEARCH_INDEX_LISTEN_RETRY_SECONDS)
+
+    async def search(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        query: str,
+        k: int = 5,
+        as_of: Optional[datetime] = None,
+        query_vector: Optional[np.ndarray] = None,
+    ) -> List[SearchHit]:
+        """Hybrid BM25 + vector search fused with reciprocal rank fusion
+
+        Falls back to keyword-only ranking if the embedding backend fails.
+        """
+        as_of = as_of or datetime.now(timezone.utc)
+        index = await self.get_index(db, tenant_id)
+        if index.expiry_due(as_of):
+            async with self._lock(tenant_id):
+                pruned = index.prune_expired(as_of)
+                await index.maybe_compact()
+            self._notify(tenant_id, pruned)
+        candidates = k * _CANDIDATE_FACTOR
+        keyword_hits = index.keywords.search(query, candidates)
+
+        vector_hits: List[Tuple[str, float]] = []
+        if len(index.vectors):
+            try:
+                if query_vector is None:
+                    query_vector = await self.embedding_service.embed_query(query)
+                vector_hits = index.vectors.search(query_vector, candidates)
+            except EmbeddingError as e:
+                if not keyword_hits:
+                    raise
+                logger.warning("Vector retrieval unavailable, using keyword results", error=str(e))
+
+        matches = fuse(
+            vector_hits,
+            keyword_hits,
+            index.chunk_source,
+            index.sources,
+            k,
+            as_of,
+        )
+        return await self._load_hits(db, matches)
+
+    async def _load_hits(self, db: AsyncSession, matches: List[Tuple[str, float]]) -> List[SearchHit]:
+        """Fetch chunk text and source names for matched ids, preserving rank"""
+        if not matches:
+            return []
+        scores = dict(matches)
+        rows = await db.execute(
+            select(Chunk.id, Chunk.knowledge_source_id, Chunk.content, KnowledgeSource.name)
+            .join(KnowledgeSource, Chunk.knowledge_source_id == KnowledgeSource.id)
+            .where(Chunk.id.in_(list(scores)), Chunk.deleted_at.is_(None))
+        )
+        by_id = {row.id: row for row in rows}
+        return [
+            SearchHit(
+                chunk_id=chunk_id,
+                knowledge_source_id=by_id[chunk_id].knowledge_source_id,
+                source_name=by_id[chunk_id].name,
+                content=by_id[chunk_id].content,
+                score=score,
+            )
+            for chunk_id, score in matches
+            if chunk_id in by_id
+        ]
+
+
+_search_service: Optional[SearchService] = None
+
+
+def get_search_service() -> SearchService:
+    """Return the process-wide search service"""
+    global _search_service
+    if _search_service is None:
+        _search_service = SearchService()
+    return _search_service
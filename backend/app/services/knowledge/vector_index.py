@@ -0,0 +1,311 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import numpy as np
+from app.core.config import settings
+
+
+@dataclass
+class IndexStats:
+    """Size and tuning parameters of a built index"""
+    size: int
+    dimension: int
+    nlist: int
+    nprobe: int
+    exact: bool
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows in place so dot product equals cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k >= scores.shape[0]:
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class VectorIndex:
+    """IVF-partitioned cosine similarity index over chunk embeddings
+
+    Vectors are normalized and stored as one contiguous float32 matrix,
+    reordered so each inverted list is a contiguous row range. A query
+    scores the centroids, then scans only the ``nprobe`` closest lists.
+    Small corpora fall back to an exact scan of the whole matrix.
+
+    Incremental updates go to a small delta matrix that is always scanned
+    exactly; removals are tombstoned. ``compact`` folds both back into a
+    freshly partitioned base once ``needs_compaction`` reports drift.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        nlist: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        exact_threshold: Optional[int] = None,
+        seed: int = 0,
+        compact_ratio: float = 0.1,
+    ):
+        self.dimension = dimension
+        self.nlist = settings.VECTOR_INDEX_NLIST if nlist is None else nlist
+        self.nprobe = nprobe or settings.VECTOR_INDEX_NPROBE
+        self.exact_threshold = (
+            settings.VECTOR_INDEX_EXACT_THRESHOLD if exact_threshold is None else exact_threshold
+        )
+        self.compact_ratio = compact_ratio
+        self._rng = np.random.default_rng(seed)
+
+        # Partitioned base
+        self._ids = np.empty(0, dtype=object)
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+        self._live = np.ones(0, dtype=bool)
+        self._row_of: Dict[str, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._dead = 0
+
+        # Unpartitioned delta for incremental adds
+        self._delta_ids: List[str] = []
+        self._delta_vectors = np.empty((0, dimension), dtype=np.float32)
+        self._delta_live = np.ones(0, dtype=bool)
+        self._delta_row_of: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._row_of) + len(self._delta_row_of)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._row_of or chunk_id in self._delta_row_of
+
+    @property
+    def is_exact(self) -> bool:
+        return self._centroids is None
+
+    def stats(self) -> IndexStats:
+        nlist = 0 if self._centroids is None else self._centroids.shape[0]
+        return IndexStats(len(self), self.dimension, nlist, self.nprobe, self.is_exact)
+
+    def build(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """Build the index from chunk ids and an (n, dimension) matrix"""
+        vectors = self._check(ids, vectors)
+        vectors = _normalize(vectors.copy())
+        ids = np.asarray(ids, dtype=object)
+        n = vectors.shape[0]
+
+        self._delta_ids = []
+        self._delta_vectors = np.empty((0, self.dimension), dtype=np.float32)
+        self._delta_live = np.ones(0, dtype=bool)
+        self._delta_row_of = {}
+        self._dead = 0
+        self._live = np.ones(n, dtype=bool)
+
+        if n < max(self.exact_threshold, 1):
+            self._ids, self._vectors = ids, vectors
+            self._centroids = None
+            self._offsets = np.array([0, n], dtype=np.int64)
+        else:
+            nlist = self.nlist or int(math.sqrt(n))
+            nlist = max(1, min(nlist, n))
+            centroids = self._train(vectors, nlist)
+            assignments = self._assign(vectors, centroids)
+
+            # Reorder rows so each inverted list is a contiguous slice
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=nlist)
+            self._ids = ids[order]
+            self._vectors = np.ascontiguousarray(vectors[order])
+            self._centroids = centroids
+            self._offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+
+    def _check(self, ids: Sequence[str], vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected shape (n, {self.dimension}), got {vectors.shape}")
+        if len(ids) != vectors.shape[0]:
+            raise ValueError("ids and vectors must have the same length")
+        return vectors
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """Insert or replace vectors without repartitioning"""
+        vectors = _normalize(self._check(ids, vectors).copy())
+        self.remove(ids)
+
+        used = len(self._delta_ids)
+        needed = used + len(ids)
+        if needed > self._delta_vectors.shape[0]:
+            # Grow geometrically so repeated small adds stay amortized O(1)
+            capacity = max(needed, 2 * self._delta_vectors.shape[0], 64)
+            grown = np.empty((capacity, self.dimension), dtype=np.float32)
+            grown[:used] = self._delta_vectors[:used]
+            live = np.zeros(capacity, dtype=bool)
+            live[:used] = self._delta_live[:used]
+            self._delta_vectors, self._delta_live = grown, live
+
+        self._delta_vectors[used:needed] = vectors
+        self._delta_live[used:needed] = True
+        for offset, chunk_id in enumerate(ids):
+            self._delta_row_of[chunk_id] = used + offset
+            self._delta_ids.append(chunk_id)
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """Tombstone vectors by chunk id, returning how many were present"""
+        removed = 0
+        for chunk_id in ids:
+            row = self._row_of.pop(chunk_id, None)
+            if row is not None:
+                self._live[row] = False
+                self._dead += 1
+                removed += 1
+                continue
+            row = self._delta_row_of.pop(chunk_id, None)
+            if row is not None:
+                self._delta_live[row] = False
+                removed += 1
+        return removed
+
+    @property
+    def needs_compaction(self) -> bool:
+        """True once tombstones and unpartitioned adds outgrow the base"""
+        drift = self._dead + len(self._delta_ids)
+        return drift > self.compact_ratio * max(self._vectors.shape[0], self.exact_threshold, 1)
+
+    def _live_rows(self) -> Tuple[List[str], np.ndarray]:
+        delta_rows = np.flatnonzero(self._delta_live[:len(self._delta_ids)])
+        ids = list(self._ids[self._live]) + [self._delta_ids[row] for row in delta_rows]
+        vectors = np.concatenate([self._vectors[self._live], self._delta_vectors[delta_rows]])
+        return ids, vectors
+
+    def compact(self) -> None:
+        """Rebuild the partitioned base from every live vector"""
+        self.build(*self._live_rows())
+
+    def compacted(self) -> "VectorIndex":
+        """A freshly partitioned copy of every live vector, leaving this index untouched
+
+        Safe to run in a worker thread while this index keeps serving
+        searches, provided nothing mutates it meanwhile.
+        """
+        fresh = VectorIndex(
+            self.dimension, self.nlist, self.nprobe, self.exact_threshold, compact_ratio=self.compact_ratio,
+        )
+        fresh._rng = self._rng
+        fresh.build(*self._live_rows())
+        return fresh
+
+    def _train(self, vectors: np.ndarray, nlist: int, iterations: int = 10) -> np.ndarray:
+        """Spherical k-means on a sample of the corpus"""
+        sample_size = min(vectors.shape[0], nlist * 64)
+        sample = vectors[self._rng.choice(vectors.shape[0], sample_size, replace=False)]
+        centroids = sample[self._rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            # Re-seed empty lists from random sample points
+            if empty.any():
+                sums[empty] = sample[self._rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalize(sums)
+        return centroids
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 16384) -> np.ndarray:
+        """Nearest centroid for each row, in batches to bound memory"""
+        out = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], batch_size):
+            block = vectors[start:start + batch_size]
+            out[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+        return out
+
+    def _prepare_query(self, query: np.ndarray) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.dimension:
+            raise ValueError(f"Expected query of dimension {self.dimension}, got {query.shape[0]}")
+        return _normalize(query.copy())
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Approximate top-k cosine search returning (chunk_id, score) pairs"""
+        if len(self) == 0 or k <= 0:
+            return []
+        query = self._prepare_query(query)
+        if self._centroids is None:
+            return self._scan(query, k, [(0, self._vectors.shape[0])])
+
+        nprobe = min(nprobe or self.nprobe, self._centroids.shape[0])
+        lists = _top_k(self._centroids @ query, nprobe)
+        ranges = [(self._offsets[i], self._offsets[i + 1]) for i in lists]
+        return self._scan(query, k, ranges)
+
+    def exact_search(self, query: np.ndarray, k: int = 10) -> List[Tuple[str, float]]:
+        """Brute-force top-k over every indexed vector"""
+        if len(self) == 0 or k <= 0:
+            return []
+        return self._scan(self._prepare_query(query), k, [(0, self._vectors.shape[0])])
+
+    def _scan(self, query: np.ndarray, k: int, ranges: List[Tuple[int, int]]) -> List[Tuple[str, float]]:
+        """Score the given base row ranges plus the delta and keep the best k"""
+        ranges = [(start, end) for start, end in ranges if end > start]
+        candidates: List[Tuple[str, float]] = []
+
+        if ranges:
+            if len(ranges) == 1:
+                # Contiguous slice: score a view without copying the block
+                start, end = ranges[0]
+                rows = np.arange(start, end)
+                scores = self._vectors[start:end] @ query
+            else:
+                rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+                scores = np.concatenate([self._vectors[start:end] @ query for start, end in ranges])
+            if self._dead:
+                scores[~self._live[rows]] = -np.inf
+            for i in _top_k(scores, k):
+                if np.isfinite(scores[i]):
+                    candidates.append((self._ids[rows[i]], float(scores[i])))
+
+        used = len(self._delta_ids)
+        if self._delta_row_of:
+            scores = self._delta_vectors[:used] @ query
+            scores[~self._delta_live[:used]] = -np.inf
+            for i in _top_k(scores, k):
+                if np.isfinite(scores[i]):
+                    candidates.append((self._delta_ids[i], float(scores[i])))
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:k]
+
+    def measure_recall(
+        self,
+        k: int = 10,
+        queries: Optional[np.ndarray] = None,
+        sample_size: int = 100,
+        nprobe: Optional[int] = None,
+    ) -> float:
+        """Mean recall@k of the approximate search against exact search
+
+        When no queries are given, a random sample of indexed vectors is used.
+        """
+        if len(self) == 0:
+            return 1.0
+        if queries is None:
+            live = np.flatnonzero(self._live)
+            pool = self._vectors if live.shape[0] == self._vectors.shape[0] else self._vectors[live]
+            if pool.shape[0] == 0:
+                pool = self._delta_vectors[np.flatnonzero(self._delta_live[:len(self._delta_ids)])]
+            queries = pool[self._rng.choice(pool.shape[0], min(sample_size, pool.shape[0]), replace=False)]
+
+        queries = np.atleast_2d(queries)
+        total = 0.0
+        for query in queries:
+            exact = {chunk_id for chunk_id, _ in self.exact_search(query, k)}
+            approx = {chunk_id for chunk_id, _ in self.search(query, k, nprobe=nprobe)}
+            total += len(exact & approx) / max(len(exact), 1)
+        return total / queries.shape[0]
@@ -0,0 +1,10 @@
+# Tenant services
+
+from .config import TenantConfig, TenantConfigService, ensure_tenant_notify_trigger, get_tenant_config_service
+
+__all__ = [
+    "TenantConfig",
+    "TenantConfigService",
+    "ensure_tenant_notify_trigger",
+    "get_tenant_config_service",
+]
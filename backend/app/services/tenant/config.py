@@ -0,0 +1,255 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional
+import asyncio
+import json
+import time
+from sqlalchemy import func, select, text
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.logging import get_logger
+from app.models.tenant import Tenant
+
+logger = get_logger(__name__)
+
+NOTIFY_CHANNEL = "tenant_config"
+
+# Flags a tenant has unless its settings turn them off
+DEFAULT_FEATURES: Dict[str, bool] = {
+    "answer_cache": True,
+    "llm_generation": True,
+}
+
+# Rows updated this long before the last poll are read again, for transactions that committed late
+_POLL_OVERLAP = timedelta(seconds=60)
+
+_NOTIFY_TRIGGER = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_tenant_config() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', OLD.id);
+        ELSE
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', NEW.id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS tenants_notify_config ON tenants",
+    """
+    CREATE TRIGGER tenants_notify_config AFTER INSERT OR UPDATE OR DELETE ON tenants
+    FOR EACH ROW EXECUTE FUNCTION notify_tenant_config()
+    """,
+]
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    """A tenant's settings, parsed once from ``Tenant.settings``
+
+    Recognised keys are ``jurisdiction``, ``locale``, ``locale_routing``
+    (language or locale to agent queue), ``dry_run`` and ``features``
+    (a flag-to-bool object or a list of enabled flags). Unknown keys are
+    kept in ``extra`` without interpretation.
+    """
+    tenant_id: str
+    name: str = ""
+    is_active: bool = True
+    version: str = ""
+    jurisdiction: str = field(default_factory=lambda: settings.COMPLIANCE_JURISDICTION)
+    locale: str = "en-US"
+    locale_routing: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    dry_run: bool = False
+    features: FrozenSet[str] = field(default_factory=lambda: frozenset(name for name, on in DEFAULT_FEATURES.items() if on))
+    extra: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    def enabled(self, flag: str) -> bool:
+        return flag in self.features
+
+    def route(self, locale: Optional[str] = None) -> Optional[str]:
+        """Agent queue for a customer locale: exact match, then its language, then ``default``"""
+        locale = (locale or self.locale).lower()
+        routing = self.locale_routing
+        return routing.get(locale) or routing.get(locale.split("-", 1)[0]) or routing.get("default")
+
+    @classmethod
+    def from_row(
+        cls, tenant_id: str, name: str, raw: Optional[str], is_active: Optional[bool], updated_at: Optional[datetime]
+    ) -> "TenantConfig":
+        data: Dict[str, Any] = {}
+        if raw:
+            try:
+                parsed = json.loads(raw)
+                if isinstance(parsed, dict):
+                    data = parsed
+                else:
+                    logger.warning("Tenant settings are not an object, using defaults", tenant_id=tenant_id)
+            except ValueError as e:
+                logger.warning("Tenant settings are not valid JSON, using defaults", tenant_id=tenant_id, error=str(e))
+
+        flags = dict(DEFAULT_FEATURES)
+        features = data.pop("features", None)
+        if isinstance(features, dict):
+            flags.update({str(name): bool(on) for name, on in features.items()})
+        elif isinstance(features, list):
+            flags.update({str(name): True for name in features})
+        routing = data.pop("locale_routing", None) or {}
+
+        return cls(
+            tenant_id=tenant_id,
+            name=name or "",
+            is_active=is_active is not False,
+            version=updated_at.isoformat() if updated_at else "",
+            jurisdiction=str(data.pop("jurisdiction", None) or settings.COMPLIANCE_JURISDICTION).upper(),
+            locale=str(data.pop("locale", None) or "en-US"),
+            locale_routing=MappingProxyType({str(k).lower(): str(v) for k, v in dict(routing).items()}),
+            dry_run=bool(data.pop("dry_run", False)),
+            features=frozenset(name for name, on in flags.items() if on),
+            extra=MappingProxyType(data),
+        )
+
+
+class TenantConfigService:
+    """Parsed tenant configuration served from memory
+
+    Each tenant's settings are parsed into an immutable ``TenantConfig``
+    on first use and replaced whole when the row changes, so a lookup is
+    one dict read and readers never see a half-applied change. Changes
+    arrive by Postgres LISTEN/NOTIFY from a trigger on ``tenants``; when
+    notifications are unavailable, ``updated_at`` is polled every
+    ``TENANT_CONFIG_POLL_SECONDS`` instead. Listeners hear about every
+    change.
+    """
+
+    def __init__(self):
+        self._configs: Dict[str, TenantConfig] = {}
+        self._listeners: List[Callable[[str], None]] = []
+        self._since: Optional[datetime] = None
+        self._seen: Dict[str, datetime] = {}  # changes already announced within the poll overlap
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """Register a callback invoked with the tenant id when its row changes"""
+        self._listeners.append(listener)
+
+    def cached(self, tenant_id: str) -> Optional[TenantConfig]:
+        return self._configs.get(tenant_id)
+
+    async def get(self, tenant_id: str) -> TenantConfig:
+        """The tenant's configuration; defaults for an unknown tenant, which are not cached"""
+        config = self._configs.get(tenant_id)
+        if config is None:
+            config = await self._load(tenant_id)
+        return config
+
+    async def _load(self, tenant_id: str) -> TenantConfig:
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(Tenant.id, Tenant.name, Tenant.settings, Tenant.is_active, Tenant.updated_at)
+                .where(Tenant.id == tenant_id)
+            )).one_or_none()
+        if row is None:
+            return TenantConfig(tenant_id=tenant_id)
+        config = TenantConfig.from_row(*row)
+        self._configs[tenant_id] = config
+        return config
+
+    async def reload(self, tenant_id: str) -> None:
+        """Re-read a changed tenant if it is cached, and notify listeners"""
+        if tenant_id in self._configs:
+            try:
+                await self._load(tenant_id)
+            except Exception as e:
+                # The next lookup reads it again instead of serving the stale copy
+                self._configs.pop(tenant_id, None)
+                logger.warning("Tenant config reload failed", tenant_id=tenant_id, error=str(e))
+        logger.info("Tenant config changed", tenant_id=tenant_id)
+        for listener in self._listeners:
+            listener(tenant_id)
+
+    async def poll(self) -> int:
+        """Reload tenants whose ``updated_at`` moved since the last poll; returns how many changed"""
+        async with AsyncSessionLocal() as db:
+            if self._since is None:
+                self._since = (await db.execute(select(func.now()))).scalar_one()
+                return 0
+            rows = (await db.execute(
+                select(Tenant.id, Tenant.updated_at).where(Tenant.updated_at > self._since - _POLL_OVERLAP)
+            )).all()
+        changed = 0
+        for tenant_id, updated_at in rows:
+            self._since = max(self._since, updated_at)
+            if self._seen.get(tenant_id) == updated_at:
+                continue
+            self._seen[tenant_id] = updated_at
+            changed += 1
+            await self.reload(tenant_id)
+        horizon = self._since - _POLL_OVERLAP
+        self._seen = {tenant_id: seen for tenant_id, seen in self._seen.items() if seen > horizon}
+        return changed
+
+    async def _listen(self) -> None:
+        # A pooled connection held for the life of the subscription; returns when it breaks
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            changed: asyncio.Queue = asyncio.Queue()
+
+            def notified(connection, pid, channel, payload):
+                changed.put_nowait(payload)
+
+            await driver.add_listener(NOTIFY_CHANNEL, notified)
+            logger.info("Listening for tenant config changes", channel=NOTIFY_CHANNEL)
+            try:
+                # Anything that changed before the subscription started
+                await self.poll()
+                while True:
+                    try:
+                        tenant_id = await asyncio.wait_for(changed.get(), timeout=settings.TENANT_CONFIG_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        await driver.execute("SELECT 1")  # raises once the connection is gone
+                        continue
+                    await self.reload(tenant_id)
+            finally:
+                # The connection goes back to the pool; it must not keep delivering to this queue
+                if not driver.is_closed():
+                    await driver.remove_listener(NOTIFY_CHANNEL, notified)
+
+    async def run_forever(self) -> None:
+        """Follow tenant changes until cancelled, by notification when possible"""
+        while True:
+            if settings.TENANT_CONFIG_NOTIFY_ENABLED:
+                try:
+                    await self._listen()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Tenant config notifications unavailable, polling", error=str(e))
+            retry_at = time.monotonic() + settings.TENANT_CONFIG_LISTEN_RETRY_SECONDS
+            while not settings.TENANT_CONFIG_NOTIFY_ENABLED or time.monotonic() < retry_at:
+                try:
+                    await self.poll()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error("Tenant config poll failed", error=str(e))
+                await asyncio.sleep(settings.TENANT_CONFIG_POLL_SECONDS)
+
+
+async def ensure_tenant_notify_trigger() -> None:
+    """Install the trigger that announces tenant row changes on NOTIFY_CHANNEL"""
+    async with engine.begin() as conn:
+        for statement in _NOTIFY_TRIGGER:
+            await conn.execute(text(statement))
+
+
+_tenant_config_service: Optional[TenantConfigService] = None
+
+
+def get_tenant_config_service() -> TenantConfigService:
+    """Return the process-wide tenant config service"""
+    global _tenant_config_service
+    if _tenant_config_service is None:
+        _tenant_config_service = TenantConfigService()
+    return _tenant_config_service
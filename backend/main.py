@@ -1,12 +1,27 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import structlog
 from app.core.config import settings
+from app.core.cache import close_shared_cache
 from app.core.database import init_db
+from app.core.metrics import MetricsMiddleware, metrics_response, scrape_allowed
+from app.core.rate_limit import RateLimitMiddleware
+from app.core.security import get_principal_cache, scope_tenant
 from app.api.v1.api import api_router
+from app.services.chat.fanout import close_fanout
+from app.services.ai.llm import close_llm_pool
+from app.services.ai.local_embeddings import shutdown_local_engine
+from app.services.analytics.events import close_event_writer
+from app.services.analytics.rollup import ensure_analytics_columns, get_rollup_service
+from app.services.compliance.audit_store import ensure_audit_indexes
 from app.core.logging import setup_logging
+from app.services.knowledge.ingestion import shutdown_parse_pool
+from app.services.knowledge.maintenance import ensure_chunk_columns
+from app.services.knowledge.search import get_search_service
+from app.services.tenant.config import ensure_tenant_notify_trigger, get_tenant_config_service
 
 # Setup structured logging
 setup_logging()
@@ -19,11 +34,39 @@ async def lifespan(app: FastAPI):
     logger.info("Starting HeliosCS API server")
     await init_db()
     logger.info("Database initialized")
+    await ensure_analytics_columns()
+    await ensure_audit_indexes()
+    await ensure_chunk_columns()
+    if settings.TENANT_CONFIG_NOTIFY_ENABLED:
+        await ensure_tenant_notify_trigger()
+    rollup_task = None
+    if settings.ANALYTICS_ROLLUP_ENABLED:
+        rollup_task = asyncio.create_task(get_rollup_service().run_forever())
+    principal_task = asyncio.create_task(get_principal_cache().run_forever())
+    tenant_configs = get_tenant_config_service()
+    # Deactivating a tenant locks its users out without waiting for the principal poll
+    tenant_configs.add_listener(get_principal_cache().invalidate_tenant)
+    tenant_config_task = asyncio.create_task(tenant_configs.run_forever())
+    search_index_task = None
+    if settings.SEARCH_INDEX_NOTIFY_ENABLED:
+        search_index_task = asyncio.create_task(get_search_service().run_forever())
     
     yield
     
     # Shutdown
     logger.info("Shutting down HeliosCS API server")
+    if rollup_task is not None:
+        rollup_task.cancel()
+    principal_task.cancel()
+    tenant_config_task.cancel()
+    if search_index_task is not None:
+        search_index_task.cancel()
+    await close_event_writer()
+    shutdown_parse_pool()
+    shutdown_local_engine()
+    await close_fanout()
+    await close_llm_pool()
+    await close_shared_cache()
 
 def create_application() -> FastAPI:
     """Create and configure FastAPI application"""
@@ -37,6 +80,9 @@ def create_application() -> FastAPI:
         lifespan=lifespan,
     )
     
+    # Rate limiting, innermost so CORS headers still reach rejected requests
+    app.add_middleware(RateLimitMiddleware)
+    
     # Security middleware
     app.add_middleware(
         TrustedHostMiddleware,
@@ -52,6 +98,10 @@ def create_application() -> FastAPI:
         allow_headers=["*"],
     )
     
+    # Request metrics, outermost so rejected and failed requests are timed too
+    if settings.PROMETHEUS_ENABLED:
+        app.add_middleware(MetricsMiddleware, tenant_of=scope_tenant)
+    
     # Include API router
     app.include_router(api_router, prefix="/api/v1")
     
@@ -65,6 +115,14 @@ def create_application() -> FastAPI:
             "environment": settings.ENVIRONMENT
         }
     
+    if settings.PROMETHEUS_ENABLED:
+        @app.get("/metrics", include_in_schema=False)
+        async def metrics(request: Request):
+            """Prometheus scrape endpoint for this worker, for internal scrapers only"""
+            if not scrape_allowed(request.scope):
+                raise HTTPException(status_code=404, detail="Not Found")
+            return metrics_response()
+    
     @app.get("/")
     async def root():
         """Root endpoint"""